@@ -1,47 +1,37 @@
 import gradio as gr
-import sqlite3
+import threading
 import uuid
 
+from repository import get_repository
+
+# Same schema and storage as my_app.py
+repo = get_repository()
+
 # Initialize Database
 def initialize_database():
-    conn = sqlite3.connect("chat_history.db")
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            role TEXT,
-            content TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
+    repo.initialize()
 
 # Save Messages to Database
 def save_message(session_id, role, content):
-    conn = sqlite3.connect("chat_history.db")
-    c = conn.cursor()
-    c.execute("INSERT INTO conversations (session_id, role, content) VALUES (?, ?, ?)", (session_id, role, content))
-    conn.commit()
-    conn.close()
+    repo.save_message(session_id, role, content)
 
 # Get Conversation History
 def get_conversation_history(session_id):
-    conn = sqlite3.connect("chat_history.db")
-    c = conn.cursor()
-    c.execute("SELECT role, content FROM conversations WHERE session_id = ?", (session_id,))
-    history = c.fetchall()
-    conn.close()
-    return [{"role": row[0], "content": row[1]} for row in history]
+    return [{"role": msg["role"], "content": msg["content"]} for msg in repo.get_conversation_history(session_id)]
 
 # Get Conversation Count
 def get_conversation_count():
-    conn = sqlite3.connect("chat_history.db")
-    c = conn.cursor()
-    c.execute("SELECT COUNT(DISTINCT session_id) FROM conversations")
-    count = c.fetchone()[0]
-    conn.close()
-    return count
+    return len(conversation_choices)
+
+# Dropdown labels in catalogue order. Each refresh reads only catalogue entries newer than
+# the last one seen, so conversations started by my_app.py or other processes show up too
+conversation_choices = []
+last_catalogue_id = 0
+catalogue_lock = threading.Lock()
+
+def catalogue_label(entry):
+    catalogue_id, _, title, _, _ = entry
+    return f"Conversation {catalogue_id}: {title or 'Untitled'}"
 
 # Initialize Session Data
 session_data = {
@@ -58,45 +48,57 @@ def start_new_chat():
 # Function to Handle Chat Interaction
 def chat(user_input):
     if not user_input:
-        return session_data["messages"], "Please enter a message."
+        return session_data["messages"], "Please enter a message.", gr.update()
 
+    new_conversation = not session_data["messages"]
     session_data["messages"].append({"role": "user", "content": user_input})
     save_message(session_data["session_id"], "user", user_input)
+    if new_conversation:
+        title = f"Topic: {user_input.strip()}"
+        repo.save_conversation_title(session_data["session_id"], title[:47] + "..." if len(title) > 50 else title)
 
     # Placeholder response (Replace with actual model inference)
     response = "<Here will be the response from trained model>"
     session_data["messages"].append({"role": "bot", "content": response})
     save_message(session_data["session_id"], "bot", response)
 
-    return [(msg["role"], msg["content"]) for msg in session_data["messages"]], ""
+    dropdown = gr.update(choices=refresh_conversations()) if new_conversation else gr.update()
+    return [(msg["role"], msg["content"]) for msg in session_data["messages"]], "", dropdown
 
 # Fetch Available Conversations for Sidebar
+def refresh_conversations():
+    global last_catalogue_id
+    with catalogue_lock:
+        entries = repo.get_catalogue(after_id=last_catalogue_id)
+        if entries:
+            conversation_choices.extend(catalogue_label(entry) for entry in entries)
+            last_catalogue_id = entries[-1][0]
+        return list(conversation_choices)
+
 def get_conversations():
-    initialize_database()  # Ensure the database and table exist before querying
-    conn = sqlite3.connect("chat_history.db")
-    c = conn.cursor()
-    c.execute("SELECT DISTINCT session_id FROM conversations")
-    sessions = c.fetchall()
-    conn.close()
-    return [f"Conversation {i+1}" for i in range(len(sessions))]
+    return refresh_conversations()
+
+def update_conversation_selector():
+    return gr.update(choices=refresh_conversations())
 
 
 # Function to Load a Selected Conversation
 def load_conversation(conversation_name):
-    conn = sqlite3.connect("chat_history.db")
-    c = conn.cursor()
-    c.execute("SELECT session_id FROM conversations")
-    sessions = c.fetchall()
-    conn.close()
-
-    if sessions:
-        index = int(conversation_name.split(" ")[-1]) - 1
-        session_id = sessions[index][0]
+    # Labels carry the catalogue id, so the session is one primary-key lookup away
+    entry = None
+    if conversation_name:
+        entry = repo.get_catalogue_entry(int(conversation_name.split(":")[0].split(" ")[-1]))
+
+    if entry:
+        session_id = entry[1]
         session_data["session_id"] = session_id
         session_data["messages"] = get_conversation_history(session_id)
     
     return [(msg["role"], msg["content"]) for msg in session_data["messages"]]
 
+# Schema setup runs once, before the dropdown below first queries the catalogue
+initialize_database()
+
 # Gradio Interface
 with gr.Blocks() as demo:
     gr.Markdown("## COT-Reasoning GPT")
@@ -117,11 +119,13 @@ with gr.Blocks() as demo:
     new_chat_button = gr.Button("Start New Chat")
 
     # Actions
-    send_button.click(chat, user_input, [chatbot, user_input])
+    send_button.click(chat, user_input, [chatbot, user_input, conversation_selector])
     new_chat_button.click(start_new_chat, [], [chatbot])
     load_button.click(load_conversation, conversation_selector, chatbot)
+    # Pick up conversations saved since the last refresh, by this or any other process
+    conversation_selector.focus(update_conversation_selector, [], conversation_selector)
+    demo.load(update_conversation_selector, [], conversation_selector)
 
 # Launch Gradio App
 if __name__ == "__main__":
-    initialize_database()
     demo.launch()
@@ -0,0 +1,123 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from repository import get_repository
+
+# -------------------- PASSWORD HASHING --------------------
+#
+# Passwords are stored as "scrypt$<log2 n>$<r>$<p>$<salt>$<hash>". The work
+# factor is tunable through COT_SCRYPT_LOG_N; rows hashed with an older factor,
+# and legacy plaintext rows, are re-hashed on the next successful login.
+# At most MAX_CONCURRENT_HASHES key derivations run at once so a burst of logins
+# queues instead of starving the rest of the app of CPU.
+
+SCRYPT_LOG_N = int(os.getenv("COT_SCRYPT_LOG_N", "14"))
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+MAX_CONCURRENT_HASHES = os.cpu_count() or 2
+
+# Verified logins skip the KDF for this long when the same credentials are presented again
+VERIFIED_TTL = 15 * 60
+VERIFIED_CACHE_SIZE = 1024
+
+_hash_slots = threading.BoundedSemaphore(MAX_CONCURRENT_HASHES)
+_verified = OrderedDict()  # email -> (password fingerprint, expires)
+_verified_lock = threading.Lock()
+_fingerprint_key = secrets.token_bytes(32)
+
+
+def _b64(data):
+    return base64.b64encode(data).decode()
+
+
+def _scrypt(password, salt, log_n, r, p):
+    with _hash_slots:
+        return hashlib.scrypt(password.encode(), salt=salt, n=2 ** log_n, r=r, p=p,
+                              maxmem=256 * r * 2 ** log_n)
+
+
+def hash_password(password, log_n=None):
+    log_n = log_n or SCRYPT_LOG_N
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, log_n, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${log_n}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+def verify_password(password, stored):
+    # Returns (matches, needs_rehash)
+    if not stored.startswith("scrypt$"):
+        # Plaintext row written before hashing existed
+        return hmac.compare_digest(password.encode(), stored.encode()), True
+    _, log_n, r, p, salt, digest = stored.split("$")
+    candidate = _scrypt(password, base64.b64decode(salt), int(log_n), int(r), int(p))
+    matches = hmac.compare_digest(candidate, base64.b64decode(digest))
+    return matches, (int(log_n), int(r), int(p)) != (SCRYPT_LOG_N, SCRYPT_R, SCRYPT_P)
+
+
+# Verified against for unknown emails so they cost the same as wrong passwords
+_DUMMY_HASH = None
+
+
+def _dummy_hash():
+    global _DUMMY_HASH
+    if _DUMMY_HASH is None:
+        _DUMMY_HASH = hash_password(secrets.token_hex(16))
+    return _DUMMY_HASH
+
+# -------------------- VERIFIED LOGIN CACHE --------------------
+
+def _fingerprint(password):
+    return hmac.new(_fingerprint_key, password.encode(), hashlib.sha256).digest()
+
+
+def _cached_login(email, password):
+    with _verified_lock:
+        entry = _verified.get(email)
+        if entry is None:
+            return False
+        fingerprint, expires = entry
+        if expires < time.monotonic():
+            del _verified[email]
+            return False
+        _verified.move_to_end(email)
+    return hmac.compare_digest(fingerprint, _fingerprint(password))
+
+
+def _remember_login(email, password):
+    with _verified_lock:
+        _verified[email] = (_fingerprint(password), time.monotonic() + VERIFIED_TTL)
+        _verified.move_to_end(email)
+        while len(_verified) > VERIFIED_CACHE_SIZE:
+            _verified.popitem(last=False)
+
+
+def forget_login(email):
+    with _verified_lock:
+        _verified.pop(email, None)
+
+# -------------------- USER FUNCTIONS --------------------
+
+def save_user(email, password, first_name, last_name):
+    return get_repository().save_user(email, hash_password(password), first_name, last_name)
+
+
+def authenticate_user(email, password):
+    if _cached_login(email, password):
+        return True
+    stored = get_repository().get_password_hash(email)
+    if stored is None:
+        verify_password(password, _dummy_hash())
+        return False
+    matches, needs_rehash = verify_password(password, stored)
+    if matches:
+        if needs_rehash:
+            get_repository().update_password_hash(email, hash_password(password))
+        _remember_login(email, password)
+    return matches
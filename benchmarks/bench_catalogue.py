@@ -0,0 +1,68 @@
+"""COT_Interface conversation list and load: full-table scans vs the conversation catalogue.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_catalogue --rows 1000000 --sessions 10000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import storage
+from benchmarks.bench_history_load import percentile, seed
+from migrations import migrate
+
+
+def legacy_load(db_path, index):
+    # The original load_conversation: every message row's session id, then pick by position
+    sessions = storage.query("SELECT session_id FROM conversations", db_path=db_path)
+    session_id = sessions[index][0]
+    return storage.query("SELECT role, content FROM conversations WHERE session_id = ?", (session_id,), db_path)
+
+
+def legacy_list(db_path):
+    return storage.query("SELECT DISTINCT session_id FROM conversations", db_path=db_path)
+
+
+def catalogue_load(db_path, catalogue_id):
+    entry = storage.get_catalogue_entry(catalogue_id, db_path=db_path)
+    return storage.get_conversation_history(entry[1], db_path)
+
+
+def measure(fn, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentile(samples, 50), percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--loads", type=int, default=50, help="loads and listings to time per phase")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "catalogue.db")
+        seed(db_path, args.rows, args.sessions)
+        migrate(db_path)
+        rng = random.Random(3)
+        picks = [rng.randrange(args.sessions) for _ in range(args.loads)]
+
+        print(f"{'':>22}  {'p50 ms':>8}  {'p99 ms':>8}")
+        rows = (("list: DISTINCT scan", measure(legacy_list, [(db_path,)] * args.loads)),
+                ("list: catalogue", measure(lambda p: storage.get_catalogue(db_path=p), [(db_path,)] * args.loads)),
+                ("load: by position", measure(legacy_load, [(db_path, p) for p in picks])),
+                ("load: catalogue id", measure(catalogue_load, [(db_path, p + 1) for p in picks])))
+        for label, (p50, p99) in rows:
+            print(f"{label:>22}  {p50:>8.2f}  {p99:>8.2f}")
+        storage.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Per-turn latency with a new Client per message vs the shared client cache, against a local mock Space.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_client_cache --turns 20 --handshake-latency 0.3
+"""
+import argparse
+import statistics
+import time
+
+import inference
+from mock_backend import MockClient, MockGradioServer
+
+
+def turn(client):
+    timings = {}
+    for _ in inference.stream_response(client, "What is 17 * 23?", "Llama-3.2-1B-DPO", timings):
+        pass
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--handshake-latency", type=float, default=0.3)
+    parser.add_argument("--first-token-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with MockGradioServer(handshake_latency=args.handshake_latency,
+                          first_token_latency=args.first_token_latency, chunk_latency=0.0) as server:
+        inference.create_client = lambda space, hf_token=None: MockClient(server.url, hf_token=hf_token)
+
+        fresh = []
+        for _ in range(args.turns):
+            start = time.perf_counter()
+            timings = turn(MockClient(server.url))
+            fresh.append((time.perf_counter() - start, timings["ttft"]))
+
+        inference.clear_clients()
+        cached = []
+        for _ in range(args.turns):
+            start = time.perf_counter()
+            timings = turn(inference.get_client(inference.SPACE))
+            cached.append((time.perf_counter() - start, timings["ttft"]))
+
+    print(f"{'mode':>8}  {'turn p50 ms':>11}  {'ttft p50 ms':>11}")
+    for name, samples in (("fresh", fresh), ("cached", cached)):
+        turn_ms = statistics.median(s[0] for s in samples) * 1000
+        ttft_ms = statistics.median(s[1] for s in samples) * 1000
+        print(f"{name:>8}  {turn_ms:>11.1f}  {ttft_ms:>11.1f}")
+    saved = statistics.median(s[0] for s in fresh) - statistics.median(s[0] for s in cached)
+    print(f"Handshake latency saved per turn: {saved * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""History-load p50/p99 on a seeded database, before and after the schema migrations.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_history_load --rows 2000000 --sessions 20000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import storage
+from migrations import migrate
+
+
+def seed(db_path, rows, sessions, batch_size=50000):
+    # Version 1 schema only, as an existing chat_history.db would look
+    migrate(db_path, target=1)
+    conn = storage.get_connection(db_path)
+    session_ids = [f"session-{n:08d}" for n in range(sessions)]
+    rng = random.Random(42)
+    written = 0
+    while written < rows:
+        count = min(batch_size, rows - written)
+        with conn:
+            conn.executemany(
+                "INSERT INTO conversations (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                ((rng.choice(session_ids), "user" if (written + n) % 2 == 0 else "bot",
+                  f"message body {written + n}", "2025-01-01 00:00:00") for n in range(count)))
+        written += count
+    with conn:
+        conn.executemany("INSERT INTO conversation_titles (session_id, title) VALUES (?, ?)",
+                         ((sid, f"Topic: {sid}") for sid in session_ids))
+    return session_ids
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def measure(db_path, session_ids, loads):
+    rng = random.Random(7)
+    samples = []
+    for _ in range(loads):
+        sid = rng.choice(session_ids)
+        start = time.perf_counter()
+        storage.query(storage.SQL_CONVERSATION_HISTORY, (sid,), db_path=db_path)
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentile(samples, 50), percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--loads", type=int, default=200, help="history loads to time per phase")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "history.db")
+        start = time.perf_counter()
+        session_ids = seed(db_path, args.rows, args.sessions)
+        print(f"Seeded {args.rows} rows across {args.sessions} sessions in {time.perf_counter() - start:.1f}s")
+
+        before = measure(db_path, session_ids, args.loads)
+
+        start = time.perf_counter()
+        version = migrate(db_path)
+        print(f"Migrated to version {version} in {time.perf_counter() - start:.1f}s")
+
+        after = measure(db_path, session_ids, args.loads)
+        storage.close_all_connections()
+
+    print(f"{'phase':>8}  {'p50 ms':>8}  {'p99 ms':>8}")
+    print(f"{'before':>8}  {before[0]:>8.3f}  {before[1]:>8.3f}")
+    print(f"{'after':>8}  {after[0]:>8.3f}  {after[1]:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
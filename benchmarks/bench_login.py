@@ -0,0 +1,67 @@
+"""Login latency p50/p99 under concurrent logins for a range of scrypt work factors.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_login --log-n 13 14 15 --threads 8 --logins 20
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import auth
+import storage
+from benchmarks.bench_history_load import percentile
+
+
+def run(threads, logins, users, use_cache):
+    samples = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def client(worker):
+        barrier.wait()
+        for n in range(logins):
+            email = users[(worker + n) % len(users)]
+            if not use_cache:
+                auth.forget_login(email)
+            start = time.perf_counter()
+            assert auth.authenticate_user(email, "correct horse battery staple")
+            with lock:
+                samples.append((time.perf_counter() - start) * 1000)
+
+    workers = [threading.Thread(target=client, args=(w,)) for w in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    return percentile(samples, 50), percentile(samples, 99), len(samples) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log-n", type=int, nargs="+", default=[13, 14, 15], help="scrypt log2(n) values to try")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent logins")
+    parser.add_argument("--logins", type=int, default=10, help="logins per thread")
+    args = parser.parse_args()
+
+    print(f"{'log2 n':>6}  {'cache':>5}  {'p50 ms':>8}  {'p99 ms':>8}  {'logins/s':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for log_n in args.log_n:
+            storage.DB_PATH = os.path.join(directory, f"login-{log_n}.db")
+            storage.initialize_database()
+            auth.SCRYPT_LOG_N = log_n
+            users = [f"user{n}@example.com" for n in range(args.threads * 2)]
+            for email in users:
+                auth.save_user(email, "correct horse battery staple", "Bench", "User")
+            for use_cache in (False, True):
+                p50, p99, rate = run(args.threads, args.logins, users, use_cache)
+                print(f"{log_n:>6}  {'on' if use_cache else 'off':>5}  {p50:>8.1f}  {p99:>8.1f}  {rate:>8.1f}")
+            storage.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Overhead of the metrics module on a full chat turn, metrics enabled vs COT_METRICS=0.
+
+A turn is dispatcher -> client cache -> stream_response against a local mock
+Space, then split_reasoning, two save_message calls and a page reload, all
+instrumented. Mock latencies default to zero so the turn is as short as it can
+be and the relative overhead is the worst case. Rounds alternate between the
+two modes to cancel drift.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_metrics --turns 200 --rounds 5
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import inference
+import metrics
+import storage
+from dispatcher import InferenceDispatcher
+from mock_backend import MockClient, MockGradioServer
+from reasoning import split_reasoning
+
+
+def turn(dispatcher, n):
+    ticket = dispatcher.submit("Llama-3.2-1B-DPO", f"What is {n} * 23?")
+    for _ in ticket.follow():
+        pass
+    reasoning, answer = split_reasoning(ticket.result())
+    storage.save_message("bench", "user", f"What is {n} * 23?")
+    storage.save_message("bench", "bot", answer, "Llama-3.2-1B-DPO", reasoning)
+    storage.get_conversation_page("bench", limit=20)
+
+
+def run(dispatcher, turns, enabled):
+    metrics.ENABLED = enabled
+    start = time.perf_counter()
+    for n in range(turns):
+        turn(dispatcher, n)
+    return (time.perf_counter() - start) / turns
+
+
+def observe_cost(samples=200000):
+    # Nanoseconds per timed block, enabled and disabled
+    hist = metrics.histogram("bench_observe_seconds")
+    costs = {}
+    for enabled in (True, False):
+        metrics.ENABLED = enabled
+        start = time.perf_counter()
+        for _ in range(samples):
+            with hist.time(stage="bench"):
+                pass
+        costs[enabled] = (time.perf_counter() - start) / samples * 1e9
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200, help="turns per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--first-token-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory, \
+            MockGradioServer(handshake_latency=0.0, first_token_latency=args.first_token_latency,
+                             chunk_latency=0.0) as server:
+        storage.DB_PATH = os.path.join(directory, "metrics.db")
+        storage.initialize_database()
+        inference.create_client = lambda space, hf_token=None: MockClient(server.url, hf_token=hf_token)
+        dispatcher = InferenceDispatcher(max_retries=0)
+        run(dispatcher, 20, True)   # warm up the client cache and statement cache
+
+        samples = {True: [], False: []}
+        for _ in range(args.rounds):
+            for enabled in (False, True):
+                samples[enabled].append(run(dispatcher, args.turns, enabled))
+        storage.close_all_connections()
+
+    off = statistics.median(samples[False])
+    on = statistics.median(samples[True])
+    costs = observe_cost()
+    print(f"turn, metrics off: {off * 1000:.3f} ms")
+    print(f"turn, metrics on:  {on * 1000:.3f} ms")
+    print(f"overhead: {(on - off) / off:+.2%}")
+    print(f"one timed stage: {costs[True]:.0f} ns enabled, {costs[False]:.0f} ns disabled")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Database size and chat render payload for chain-of-thought answers, stored whole vs split by reasoning.py.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_reasoning_storage --sessions 500 --turns 20 --steps 8
+"""
+import argparse
+import os
+import tempfile
+
+import storage
+from migrations import migrate
+from mock_backend import fake_answer
+from reasoning import split_reasoning
+from rendering import bubble_html
+
+
+def seed(sessions, turns, steps, split, batch_size=5000):
+    # Whole answers in conversations.content, as stored before migration 9, or split as save_message does now
+    migrate()
+    conn = storage.get_connection()
+    rows = []
+    for s in range(sessions):
+        for t in range(turns):
+            question = f"Question {t} of session {s}: how many apples are left?"
+            rows.append((f"session-{s:06d}", "user", question))
+            rows.append((f"session-{s:06d}", "bot", fake_answer(question, "bench", steps)))
+    for start in range(0, len(rows), batch_size):
+        with storage.transaction() as conn:
+            for session_id, role, content in rows[start:start + batch_size]:
+                reasoning, answer = split_reasoning(content) if split and role == "bot" else ("", content)
+                storage._insert_message(conn, session_id, role, answer, "bench", reasoning)
+
+
+def db_size():
+    conn = storage.get_connection()
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return os.path.getsize(storage.DB_PATH)
+
+
+def render_payload(sessions, limit=40):
+    # Bytes of bubble HTML sent for the newest page of every session
+    total = 0
+    for s in range(sessions):
+        rows = storage.query("SELECT role, content FROM conversations WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                             (f"session-{s:06d}", limit))
+        total += sum(len(bubble_html(role, content).encode()) for role, content in rows)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=20, help="question/answer pairs per session")
+    parser.add_argument("--steps", type=int, default=8, help="reasoning steps per answer")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for split in (False, True):
+            storage.DB_PATH = os.path.join(directory, f"reasoning-{split}.db")
+            seed(args.sessions, args.turns, args.steps, split)
+            results[split] = db_size(), render_payload(args.sessions)
+        storage.close_all_connections()
+    before, after = results[False], results[True]
+
+    print(f"{'':>14}  {'db bytes':>12}  {'payload bytes':>14}")
+    print(f"{'whole answers':>14}  {before[0]:>12,}  {before[1]:>14,}")
+    print(f"{'split':>14}  {after[0]:>12,}  {after[1]:>14,}")
+    print(f"{'change':>14}  {(after[0] - before[0]) / before[0]:>12.0%}  {(after[1] - before[1]) / before[1]:>14.0%}")
+
+
+if __name__ == "__main__":
+    main()
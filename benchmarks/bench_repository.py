@@ -0,0 +1,96 @@
+"""The same chat workloads against every ChatRepository backend.
+
+Workloads: user signup and profile lookups, chat turns written from several
+threads, newest-page history loads, and sidebar conversation listings.
+Each prints operations/sec per backend.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_repository --users 200 --threads 4 --turns 200
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+import storage
+from repository import MemoryRepository, SQLiteRepository
+
+
+def timed(operations, fn):
+    start = time.perf_counter()
+    fn()
+    return operations / (time.perf_counter() - start)
+
+
+def users_workload(repo, users):
+    def run():
+        for n in range(users):
+            repo.save_user(f"user{n}@example.com", "hash", "Bench", "User")
+        for n in range(users):
+            repo.get_user_profile(f"user{n}@example.com")
+    return timed(users * 2, run)
+
+
+def turns_workload(repo, threads, turns):
+    barrier = threading.Barrier(threads)
+
+    def session(worker):
+        barrier.wait()
+        session_id = f"bench-{worker}"
+        repo.save_conversation_title(session_id, f"Topic: {worker}", worker % 10)
+        for n in range(turns):
+            repo.save_message(session_id, "user", f"question {n}")
+            repo.save_message(session_id, "bot", f"The answer is {n}.", "bench", "Step 1: think.\n")
+
+    def run():
+        workers = [threading.Thread(target=session, args=(w,)) for w in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    return timed(threads * turns * 2, run)
+
+
+def pages_workload(repo, threads, loads):
+    rng = random.Random(7)
+
+    def run():
+        for _ in range(loads):
+            repo.get_conversation_page(f"bench-{rng.randrange(threads)}")
+    return timed(loads, run)
+
+
+def listing_workload(repo, loads):
+    def run():
+        for n in range(loads):
+            repo.get_user_conversations(n % 10, 20, "Topic" if n % 2 else "")
+    return timed(loads, run)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=4, help="concurrent chat sessions")
+    parser.add_argument("--turns", type=int, default=200, help="turns written per session")
+    parser.add_argument("--loads", type=int, default=2000, help="page loads and listings")
+    args = parser.parse_args()
+
+    print(f"{'backend':>8}  {'users op/s':>10}  {'msg/s':>8}  {'pages/s':>8}  {'lists/s':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        backends = (("sqlite", SQLiteRepository(os.path.join(directory, "bench.db"))),
+                    ("memory", MemoryRepository()))
+        for name, repo in backends:
+            repo.initialize()
+            results = (users_workload(repo, args.users),
+                       turns_workload(repo, args.threads, args.turns),
+                       pages_workload(repo, args.threads, args.loads),
+                       listing_workload(repo, args.loads))
+            print(f"{name:>8}  {results[0]:>10.0f}  {results[1]:>8.0f}  {results[2]:>8.0f}  {results[3]:>8.0f}")
+        storage.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Deleting a large history in one transaction vs retention.py's chunks, with a live writer alongside.
+
+Reports deletion rows/s, the longest write-lock hold and the p99/max latency
+of a concurrent save_message loop standing in for live chat sessions.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_retention --rows 200000 --chunk-rows 500
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import retention
+import storage
+from benchmarks.bench_history_load import percentile
+
+
+def seed(rows, sessions, batch_size=50000):
+    storage.initialize_database()
+    conn = storage.get_connection()
+    for start in range(0, rows, batch_size):
+        with conn:
+            conn.executemany(
+                "INSERT INTO conversations (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                ((f"old-{n % sessions:06d}", "user" if n % 2 == 0 else "bot", f"message body {n}",
+                  "2020-01-01 00:00:00") for n in range(start, min(rows, start + batch_size))))
+    return [f"old-{n:06d}" for n in range(sessions)]
+
+
+def single_delete(conn, session_ids, max_id):
+    # The delete_conversations.py pattern: everything in one transaction
+    started = time.perf_counter()
+    with conn:
+        deleted = conn.execute("DELETE FROM conversations WHERE id <= ?", (max_id,)).rowcount
+    return deleted, time.perf_counter() - started
+
+
+def run(delete, rows, sessions, chunk_rows):
+    session_ids = seed(rows, sessions)
+    conn = storage.get_connection()
+    max_id = conn.execute("SELECT MAX(id) FROM conversations").fetchone()[0]
+    samples = []
+    stop = threading.Event()
+
+    def live_writer():
+        n = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                storage.save_message("live-session", "user", f"live message {n}")
+            except sqlite3.OperationalError:
+                pass
+            samples.append((time.perf_counter() - start) * 1000)
+            n += 1
+            time.sleep(0.005)
+
+    writer = threading.Thread(target=live_writer)
+    writer.start()
+    start = time.perf_counter()
+    if delete is single_delete:
+        deleted, longest = single_delete(conn, session_ids, max_id)
+    else:
+        deleted, longest = retention.delete_sessions(conn, session_ids, max_id, chunk_rows)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    writer.join()
+    return deleted / elapsed, longest * 1000, percentile(samples, 99), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--chunk-rows", type=int, default=retention.CHUNK_ROWS)
+    args = parser.parse_args()
+
+    print(f"{'':>8}  {'rows/s':>8}  {'max lock ms':>11}  {'writer p99 ms':>13}  {'writer max ms':>13}")
+    with tempfile.TemporaryDirectory() as directory:
+        for label, delete in (("single", single_delete), ("chunked", retention.delete_sessions)):
+            storage.DB_PATH = os.path.join(directory, f"{label}.db")
+            rate, longest, p99, worst = run(delete, args.rows, args.sessions, args.chunk_rows)
+            storage.close_all_connections()
+            print(f"{label:>8}  {rate:>8.0f}  {longest:>11.1f}  {p99:>13.1f}  {worst:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
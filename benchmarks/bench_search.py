@@ -0,0 +1,78 @@
+"""Message search latency: FTS5 MATCH vs LIKE '%...%' on a seeded multi-million-row corpus.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_search --rows 2000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import storage
+from benchmarks.bench_history_load import percentile
+from migrations import migrate
+from search import fts_query
+
+VOCABULARY = ("step answer add multiply divide number sum total first second therefore question "
+              "circle area square triangle angle prime even odd fraction ratio percent equation "
+              "solve value result check reason compare greater smaller double half").split()
+
+SQL_LIKE = "SELECT id FROM conversations WHERE content LIKE ? LIMIT 10"
+SQL_FTS = ("SELECT rowid FROM conversations_fts WHERE conversations_fts MATCH ? "
+           "ORDER BY rank LIMIT 10")
+
+
+def seed(db_path, rows, batch_size=50000):
+    migrate(db_path)
+    conn = storage.get_connection(db_path)
+    rng = random.Random(42)
+    written = 0
+    while written < rows:
+        count = min(batch_size, rows - written)
+        with conn:
+            conn.executemany(
+                "INSERT INTO conversations (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                ((f"session-{rng.randrange(rows // 20 + 1)}", "bot",
+                  " ".join(rng.choice(VOCABULARY) for _ in range(30)) + f" token{rng.randrange(100000)}",
+                  "2025-01-01 00:00:00") for _ in range(count)))
+        written += count
+
+
+def measure(db_path, sql, params, queries):
+    samples = []
+    for p in params[:queries]:
+        start = time.perf_counter()
+        storage.query(sql, (p,), db_path=db_path)
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentile(samples, 50), percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    # Rare terms are the interesting case: LIKE has to scan everything to find 10 hits or prove there are none
+    terms = [f"token{rng.randrange(100000)}" for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "search.db")
+        start = time.perf_counter()
+        seed(db_path, args.rows)
+        print(f"Seeded and indexed {args.rows} rows in {time.perf_counter() - start:.1f}s")
+
+        like = measure(db_path, SQL_LIKE, [f"%{t}%" for t in terms], args.queries)
+        fts = measure(db_path, SQL_FTS, [fts_query(t) for t in terms], args.queries)
+        storage.close_all_connections()
+
+    print(f"{'query':>6}  {'p50 ms':>8}  {'p99 ms':>8}")
+    print(f"{'LIKE':>6}  {like[0]:>8.3f}  {like[1]:>8.3f}")
+    print(f"{'FTS5':>6}  {fts[0]:>8.3f}  {fts[1]:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Near-duplicate prompt lookup: recall on paraphrases, false hits and latency per similarity threshold.
+
+Half of the prompt corpus is indexed. The queries are:
+- paraphrases of indexed prompts, which should find their original;
+- paraphrases of the other half, which should find nothing;
+- indexed math prompts with one number or operator changed, which must
+  find nothing;
+- questions worded almost like an indexed one but asking something else
+  ("oldest" for "youngest", "not a mammal" for "a mammal", "was" for "is"),
+  which must find nothing.
+
+The corpus is the prompts stored in a response cache (--db) or, by
+default, generated math and commonsense questions.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_similarity --prompts 4000
+    python -m benchmarks.bench_similarity --db chat_history.db
+"""
+import argparse
+import random
+import re
+import time
+
+import similarity_index
+import storage
+from benchmarks.bench_history_load import percentile
+from response_cache import normalize_prompt
+
+THINGS = ["sky", "sea", "grass", "snow", "sun", "moon", "blood", "coffee", "ice", "fire", "rain", "gold",
+          "a rainbow", "a cat", "a dog", "a bird", "a fish", "a tree", "a river", "a volcano"]
+QUALITIES = ["blue", "green", "white", "hot", "cold", "wet", "bright", "heavy", "round", "shiny"]
+COMMONSENSE = ["Why is the {a} {q}?", "Can {a} ever be {q}?", "What makes {a} look {q} at night?",
+               "Is {a} more {q} than {b}?", "Where would you find {a} next to {b}?",
+               "If you put {a} near {b}, what happens?"]
+MATH = ["What is {x} * {y}?", "What is {x} + {y}?", "If a train travels {x} km in {y} hours, what is its speed?",
+        "Tom has {x} apples and gives away {y}. How many are left?",
+        "A shop sells pens at {y} dollars each. How much do {x} pens cost?",
+        "What is {x} percent of {y}?"]
+
+PARAPHRASES = [
+    lambda p, rng: p.lower(),
+    lambda p, rng: p.upper(),
+    lambda p, rng: p.rstrip("?.!") + rng.choice(["", " ?", "??", "."]),
+    lambda p, rng: rng.choice(["Please answer: ", "Q: ", "Quick question, ", "Hey, "]) + p,
+    lambda p, rng: p + rng.choice([" Explain step by step.", " Thanks!", " Show your work."]),
+    lambda p, rng: p.replace("What is", "What's").replace("what is", "what's"),
+    lambda p, rng: p.replace(" * ", " times ").replace(" + ", " plus "),
+    lambda p, rng: p.replace(" * ", "*").replace(" + ", "+"),
+    lambda p, rng: re.sub(r"\b(the|a) ", "", p, count=1),
+    lambda p, rng: re.sub(r"^(what is|what's) ", "", p, flags=re.IGNORECASE),
+]
+
+
+# (indexed, query) pairs a few characters apart whose answers differ
+OPPOSITES = [
+    ("Ann is 31, Ben is 27 and Cleo is 45. Who is the oldest? Think step by step.",
+     "Ann is 31, Ben is 27 and Cleo is 45. Who is the youngest? Think step by step."),
+    ("Is Oslo farther north than Berlin?", "Is Oslo farther south than Berlin?"),
+    ("Who is the president of France?", "Who was the president of France?"),
+    ("Explain why a whale is not a mammal.", "Explain why a whale is a mammal."),
+    ("Is the sun bigger than the moon?", "Is the moon bigger than the sun?"),
+    ("Which is heavier, a kilogram of iron or a kilogram of feathers?",
+     "Which is lighter, a kilogram of iron or a kilogram of feathers?"),
+]
+
+
+def generate_corpus(count, rng):
+    prompts = set()
+    while len(prompts) < count:
+        if rng.random() < 0.5:
+            a, b = rng.sample(THINGS, 2)
+            prompts.add(rng.choice(COMMONSENSE).format(a=a, b=b, q=rng.choice(QUALITIES)))
+        else:
+            prompts.add(rng.choice(MATH).format(x=rng.randint(2, 999), y=rng.randint(2, 99)))
+    return sorted(prompts)
+
+
+def paraphrase(prompt, rng):
+    for transform in rng.sample(PARAPHRASES, 2):
+        prompt = transform(prompt, rng)
+    return prompt
+
+
+def perturb(prompt, rng):
+    # Same wording, different problem: one number nudged or one operator swapped
+    numbers = re.findall(r"\d+", prompt)
+    if " * " in prompt and rng.random() < 0.5:
+        return prompt.replace(" * ", " + ")
+    old = rng.choice(numbers)
+    return prompt.replace(old, str(int(old) + rng.randint(1, 9)), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=4000, help="generated corpus size")
+    parser.add_argument("--db", help="use the prompts cached in this database instead")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.6, 0.7, 0.8, 0.85, 0.9, 0.95])
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    if args.db:
+        corpus = sorted({row[0] for row in storage.query("SELECT prompt FROM response_cache", db_path=args.db)
+                         if row[0]})
+    else:
+        corpus = generate_corpus(args.prompts, rng)
+    rng.shuffle(corpus)
+    indexed, unseen = corpus[:len(corpus) // 2], corpus[len(corpus) // 2:]
+
+    index = similarity_index.ModelIndex(max_entries=len(indexed) + len(OPPOSITES))
+    start = time.perf_counter()
+    for n, prompt in enumerate(indexed):
+        text = normalize_prompt(prompt)
+        index.put(n, similarity_index.match_key(text), similarity_index.signature(text))
+    build = time.perf_counter() - start
+
+    def prepared(prompts):
+        texts = [normalize_prompt(p) for p in prompts]
+        return [(similarity_index.match_key(t), similarity_index.signature(t)) for t in texts]
+
+    for n, (original, _) in enumerate(OPPOSITES):
+        (match, sig), = prepared([original])
+        index.put(("opposite", n), match, sig)
+    opposites = prepared([query for _, query in OPPOSITES])
+
+    positives = prepared([paraphrase(p, rng) for p in indexed])
+    negatives = prepared([paraphrase(p, rng) for p in unseen])
+    # A perturbation that lands on another corpus prompt is a true duplicate, not a false hit
+    known = {normalize_prompt(p) for p in corpus}
+    perturbed = prepared([q for q in (perturb(p, rng) for p in indexed if re.search(r"\d", p))
+                          if normalize_prompt(q) not in known])
+
+    backend = "numpy" if similarity_index.get_numpy() is not None else "pure python"
+    print(f"{len(corpus)} prompts, {len(indexed)} indexed in {build:.2f}s ({backend}), "
+          f"{len(positives)} paraphrases, {len(negatives)} unseen, {len(perturbed)} perturbed, "
+          f"{len(opposites)} opposite")
+    print(f"{'threshold':>9}  {'recall':>7}  {'wrong':>6}  {'unseen hit':>10}  {'perturbed hit':>13}  "
+          f"{'opposite hit':>12}")
+    for threshold in args.thresholds:
+        found = [index.find(match, sig, threshold) for match, sig in positives]
+        recall = sum(key == n for n, key in enumerate(found)) / len(found)
+        wrong = sum(key is not None and key != n for n, key in enumerate(found)) / len(found)
+        unseen_hits = sum(index.find(match, sig, threshold) is not None for match, sig in negatives) / len(negatives)
+        perturbed_hits = sum(index.find(match, sig, threshold) is not None
+                             for match, sig in perturbed) / max(1, len(perturbed))
+        opposite_hits = sum(index.find(match, sig, threshold) is not None for match, sig in opposites) / len(opposites)
+        print(f"{threshold:>9.2f}  {recall:>7.1%}  {wrong:>6.1%}  {unseen_hits:>10.1%}  {perturbed_hits:>13.1%}  "
+              f"{opposite_hits:>12.1%}")
+
+    samples = []
+    for prompt in corpus[:2000]:
+        start = time.perf_counter()
+        text = normalize_prompt(paraphrase(prompt, rng))
+        index.find(similarity_index.match_key(text), similarity_index.signature(text),
+                   similarity_index.SIMILARITY_THRESHOLD)
+        samples.append((time.perf_counter() - start) * 1e6)
+    print(f"lookup including signature: p50 {percentile(samples, 50):.0f} us, p99 {percentile(samples, 99):.0f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""my_app.py cold start and per-rerun cost: eager imports and per-rerun migrate() vs lazy imports and one-time setup.
+
+Cold start is a fresh interpreter importing what my_app.py imports (all but
+Streamlit itself) and setting up the schema, on a new and on an existing
+database. "eager" also imports what used to load at startup and is now
+deferred: the dispatcher with its thread pool, http.server for the metrics
+endpoint and urllib.request for client health checks. Per rerun is what main()
+spends on the schema each time Streamlit re-executes the script.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup --runs 10 --reruns 2000
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import storage
+from migrations import migrate
+
+APP_IMPORTS = "import metrics, auth, chat_session, context, inference, rendering, response_cache, search, repository"
+EAGER_IMPORTS = "import dispatcher, http.server, urllib.request"
+
+COLD_START = """
+import os, time
+start = time.perf_counter()
+{imports}
+import storage
+storage.DB_PATH = {db_path!r}
+storage.initialize_database()
+print(time.perf_counter() - start)
+"""
+
+
+def cold_start(imports, db_path, runs, fresh):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    samples = []
+    for _ in range(runs):
+        if fresh:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+        output = subprocess.run([sys.executable, "-c", COLD_START.format(imports=imports, db_path=db_path)],
+                                cwd=root, capture_output=True, text=True, check=True).stdout
+        samples.append(float(output) * 1000)
+    return statistics.median(samples)
+
+
+def per_rerun(fn, reruns):
+    # Streamlit runs each rerun on a new script thread, which takes an idle connection from the pool
+    start = time.perf_counter()
+    for _ in range(reruns):
+        thread = threading.Thread(target=fn)
+        thread.start()
+        thread.join()
+    return (time.perf_counter() - start) / reruns * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="interpreters started per cold-start case")
+    parser.add_argument("--reruns", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        fresh = os.path.join(directory, "fresh.db")
+        existing = os.path.join(directory, "existing.db")
+        storage.DB_PATH = existing
+        storage.initialize_database()
+
+        print(f"{'cold start':>22}  {'eager ms':>9}  {'lazy ms':>9}")
+        for label, db_path in (("new database", fresh), ("existing database", existing)):
+            eager = cold_start(f"{APP_IMPORTS}\n{EAGER_IMPORTS}", db_path, args.runs, db_path == fresh)
+            lazy = cold_start(APP_IMPORTS, db_path, args.runs, db_path == fresh)
+            print(f"{label:>22}  {eager:>9.1f}  {lazy:>9.1f}")
+
+        print(f"{'per rerun':>22}  {'every us':>9}  {'once us':>9}")
+        before = per_rerun(migrate, args.reruns)
+        after = per_rerun(storage.initialize_database, args.reruns)
+        print(f"{'schema setup':>22}  {before:>9.1f}  {after:>9.1f}")
+        storage.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
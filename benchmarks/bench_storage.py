@@ -0,0 +1,93 @@
+"""Messages/sec across N concurrent writer threads: per-call connect vs pooled WAL storage.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_storage --threads 1 4 8 --messages 500
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import storage
+
+
+def legacy_save_message(db_path, session_id, role, content):
+    # The original my_app.py pattern: connect, insert, commit, close on every call
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("INSERT INTO conversations (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+              (session_id, role, content, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    conn.commit()
+    conn.close()
+
+
+def pooled_save_message(db_path, session_id, role, content):
+    storage.save_message(session_id, role, content)
+
+
+def fresh_database(directory, name, wal):
+    db_path = os.path.join(directory, name)
+    conn = sqlite3.connect(db_path)
+    if not wal:
+        conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+    storage.DB_PATH = db_path
+    storage.initialize_database()
+    storage.close_all_connections()
+    if not wal:
+        # initialize_database goes through the pool and switches to WAL; undo it for the baseline
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+    return db_path
+
+
+def run(save, db_path, threads, messages):
+    errors = []
+    barrier = threading.Barrier(threads)
+
+    def writer(worker):
+        barrier.wait()
+        session_id = f"bench-{worker}"
+        for n in range(messages):
+            try:
+                save(db_path, session_id, "user" if n % 2 == 0 else "bot", f"message {n} from worker {worker}")
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+
+    workers = [threading.Thread(target=writer, args=(w,)) for w in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    written = threads * messages - len(errors)
+    return written / elapsed, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--messages", type=int, default=500, help="messages written per thread")
+    args = parser.parse_args()
+
+    print(f"{'threads':>7}  {'before msg/s':>12}  {'errors':>6}  {'after msg/s':>12}  {'errors':>6}  {'speedup':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        for threads in args.threads:
+            legacy_db = fresh_database(directory, f"legacy-{threads}.db", wal=False)
+            before, before_errors = run(legacy_save_message, legacy_db, threads, args.messages)
+
+            pooled_db = fresh_database(directory, f"pooled-{threads}.db", wal=True)
+            after, after_errors = run(pooled_save_message, pooled_db, threads, args.messages)
+            storage.close_all_connections()
+
+            print(f"{threads:>7}  {before:>12.0f}  {before_errors:>6}  {after:>12.0f}  {after_errors:>6}  {after / before:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""JSONL export and import throughput, plain and gzip, against a raw file copy of the same bytes.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_transfer --rows 1000000 --sessions 10000
+"""
+import argparse
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import storage
+import transfer
+from benchmarks.bench_history_load import seed
+from migrations import migrate
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--sessions", type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "source.db")
+        seed(source, args.rows, args.sessions)
+        migrate(source)
+        print(f"source database: {os.path.getsize(source) / 2 ** 20:.0f} MiB, {args.rows} messages")
+
+        print(f"{'':>14}  {'file MiB':>8}  {'export s':>8}  {'rows/s':>9}  {'import s':>8}  {'rows/s':>9}  {'copy MiB/s':>10}")
+        for name in ("dump.jsonl", "dump.jsonl.gz"):
+            path = os.path.join(directory, name)
+            exported = timed(transfer.export_jsonl, path, source)
+            imported = timed(transfer.import_jsonl, path, os.path.join(directory, f"{name}.db"))
+            size = os.path.getsize(path)
+            # Disk reference: the same bytes copied without any parsing or SQLite work
+            copied = timed(shutil.copyfile, path, path + ".copy")
+            print(f"{name:>14}  {size / 2 ** 20:>8.0f}  {exported:>8.1f}  {args.rows / exported:>9.0f}  "
+                  f"{imported:>8.1f}  {args.rows / imported:>9.0f}  {size / 2 ** 20 / copied:>10.0f}")
+        storage.close_all_connections()
+    print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Sustained chat-turn inserts/sec: one transaction per save_message vs the write-behind queue.
+
+Each simulated session writes a user message, a title on its first turn and a
+bot reply, then waits for the ids as chat_interface does. --synchronous FULL
+fsyncs every commit, which approximates a slow disk.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_write_behind --sessions 1 8 32 --turns 50 --synchronous FULL
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import storage
+
+
+def direct_turn(session_id, n):
+    storage.save_message(session_id, "user", f"question {n}")
+    if n == 0:
+        storage.save_conversation_title(session_id, f"Topic: {session_id}", 1)
+    storage.save_message(session_id, "bot", f"The answer is {n}.", "bench", "Step 1: think.\n")
+
+
+def queued_turn(session_id, n):
+    writes = [storage.queue_message(session_id, "user", f"question {n}")]
+    if n == 0:
+        writes.append(storage.queue_conversation_title(session_id, f"Topic: {session_id}", 1))
+    writes.append(storage.queue_message(session_id, "bot", f"The answer is {n}.", "bench", "Step 1: think.\n"))
+    for write in writes:
+        write.result()
+
+
+def run(turn, sessions, turns):
+    barrier = threading.Barrier(sessions)
+
+    def session(worker):
+        barrier.wait()
+        for n in range(turns):
+            turn(f"bench-{worker}", n)
+
+    workers = [threading.Thread(target=session, args=(w,)) for w in range(sessions)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return sessions * turns * 2 / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32], help="concurrent sessions")
+    parser.add_argument("--turns", type=int, default=50, help="turns per session")
+    parser.add_argument("--synchronous", default="FULL", choices=["OFF", "NORMAL", "FULL"])
+    args = parser.parse_args()
+
+    storage.PRAGMAS = tuple(p for p in storage.PRAGMAS if "synchronous" not in p) + (
+        f"PRAGMA synchronous={args.synchronous}",)
+    print(f"{'sessions':>8}  {'direct msg/s':>12}  {'queued msg/s':>12}  {'speedup':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        for sessions in args.sessions:
+            storage.DB_PATH = os.path.join(directory, f"direct-{sessions}.db")
+            storage.initialize_database()
+            direct = run(direct_turn, sessions, args.turns)
+
+            storage.DB_PATH = os.path.join(directory, f"queued-{sessions}.db")
+            storage.initialize_database()
+            queued = run(queued_turn, sessions, args.turns)
+            storage.stop_writer()
+            storage.close_all_connections()
+
+            print(f"{sessions:>8}  {direct:>12.0f}  {queued:>12.0f}  {queued / direct:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""Headless load test: hundreds of simulated my_app.py users against a mock Space.
+
+Each user is a thread driving chat_session, the module behind my_app.py's
+widgets: Signup and Login, a browser refresh restored from the ?session=
+token, chat turns (response cache, dispatcher, write-behind queue), New Chat,
+Load Chat from the sidebar and Log out. Every interaction is followed by the
+rerun the script would do: main()'s schema setup and the sidebar conversation
+index. Per-user state is a dict standing in for st.session_state.
+
+Reports throughput, per-action latency percentiles, "database is locked"
+errors, other failures, and the session state each user holds before logging
+out, so changes to the storage and inference layers can be compared run to run.
+
+Run from the repository root:
+
+    python -m benchmarks.load_test --users 200 --chats 2 --turns 3 --first-token-latency 0.2
+"""
+import argparse
+import os
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import auth
+import chat_session
+import inference
+import storage
+from benchmarks.bench_history_load import percentile
+from dispatcher import QueueFull, follow_all
+from mock_backend import MockClient, MockGradioServer
+from repository import get_repository
+
+ACTIONS = ("signup", "login", "restore", "rerun", "send", "new_chat", "load_chat", "logout")
+
+
+class Recorder:
+    # Latency samples per action and failures by kind, shared by every simulated user
+
+    def __init__(self):
+        self.samples = {action: [] for action in ACTIONS}
+        self.failures = {}
+        self.turns = 0
+        self._lock = threading.Lock()
+
+    def record(self, action, seconds):
+        with self._lock:
+            self.samples[action].append(seconds)
+            if action == "send":
+                self.turns += 1
+
+    def fail(self, kind):
+        with self._lock:
+            self.failures[kind] = self.failures.get(kind, 0) + 1
+
+
+def failure_kind(error):
+    if isinstance(error, sqlite3.OperationalError) and "locked" in str(error):
+        return "database is locked"
+    if isinstance(error, QueueFull):
+        return "queue full"
+    return type(error).__name__
+
+
+def deep_size(obj, seen=None):
+    # Bytes reachable from obj, each object counted once
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+    return size
+
+
+class SimulatedUser:
+    def __init__(self, number, recorder, questions, models, think_time, rng):
+        self.email = f"load{number}-{uuid.uuid4().hex[:8]}@example.com"
+        self.password = f"password-{number}"
+        self.recorder = recorder
+        self.questions = questions
+        self.models = models
+        self.think_time = think_time
+        self.rng = rng
+        self.repo = get_repository()
+        self.token = None
+        self.state = chat_session.default_state()
+        self.state_size = 0
+
+    def timed(self, action, fn, *args):
+        start = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            self.recorder.fail(failure_kind(e))
+            result = None
+        self.recorder.record(action, time.perf_counter() - start)
+        return result
+
+    def pause(self):
+        if self.think_time > 0:
+            time.sleep(self.rng.expovariate(1 / self.think_time))
+
+    # One method per interaction, each making the chat_session calls my_app.py makes
+
+    def rerun(self):
+        self.repo.initialize()
+        if self.state["logged_in"]:
+            chat_session.conversation_index(self.state)
+
+    def signup(self):
+        return auth.save_user(self.email, self.password, "Load", "Test")
+
+    def login(self):
+        if not auth.authenticate_user(self.email, self.password):
+            raise RuntimeError("login rejected")
+        self.token = chat_session.login(self.state, self.email)
+
+    def restore(self):
+        # A browser refresh: new session state, logged back in from the token
+        self.state = chat_session.default_state()
+        if not chat_session.restore(self.state, self.token):
+            raise RuntimeError("session token rejected")
+
+    def send(self, user_input, model_name):
+        state = self.state
+        state["model_name"] = model_name
+        user_msg, pending_user = chat_session.start_turn(state, user_input)
+        start = time.perf_counter()
+        responses, tickets = chat_session.submit_answers(user_input, [model_name])
+        if not tickets and responses[0].startswith("⚠️"):
+            self.recorder.fail("queue full")
+        for _ in follow_all(list(tickets.values())):
+            pass
+        for ticket in tickets.values():
+            if ticket.error is not None:
+                self.recorder.fail(failure_kind(ticket.error))
+        answers, _ = chat_session.collect_answers(user_input, [model_name], responses, tickets, start)
+        chat_session.finish_turn(state, user_msg, pending_user, answers)
+        state["renderer"].pair(state["messages"])
+
+    def new_chat(self):
+        chat_session.new_chat(self.state)
+
+    def load_chat(self):
+        conversations, _ = chat_session.conversation_index(self.state)
+        if not conversations:
+            return
+        chat_session.load_conversation(self.state, self.rng.choice(conversations)[0])
+        self.state["renderer"].pair(self.state["messages"])
+
+    def logout(self):
+        chat_session.logout(self.token)
+        self.state = chat_session.default_state()
+
+    def interact(self, action, *args):
+        self.timed(action, getattr(self, action), *args)
+        self.timed("rerun", self.rerun)
+        self.pause()
+
+    def run(self, chats, turns):
+        self.interact("signup")
+        self.interact("login")
+        self.interact("restore")
+        for chat in range(chats):
+            if chat:
+                self.interact("new_chat")
+            for _ in range(turns):
+                self.interact("send", self.rng.choice(self.questions), self.rng.choice(self.models))
+        self.interact("load_chat")
+        self.state_size = deep_size(self.state)
+        self.interact("logout")
+
+
+def run_load(args, users):
+    threads = []
+    for user in users:
+        threads.append(threading.Thread(target=user.run, args=(args.chats, args.turns)))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+        if args.ramp_up:
+            time.sleep(args.ramp_up / len(threads))
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def report(recorder, users, wall):
+    actions = sum(len(samples) for samples in recorder.samples.values())
+    print(f"{len(users)} users, {recorder.turns} turns in {wall:.1f}s: "
+          f"{recorder.turns / wall:.1f} turns/s, {actions / wall:.1f} actions/s")
+    print(f"{'action':>10}  {'count':>6}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}  {'max ms':>8}")
+    for action in ACTIONS:
+        samples = recorder.samples[action]
+        if samples:
+            p50, p95, p99 = (percentile(samples, pct) * 1000 for pct in (50, 95, 99))
+            print(f"{action:>10}  {len(samples):>6}  {p50:>8.1f}  {p95:>8.1f}  {p99:>8.1f}  {max(samples) * 1000:>8.1f}")
+    print(f"database is locked: {recorder.failures.get('database is locked', 0)}")
+    others = {kind: count for kind, count in recorder.failures.items() if kind != "database is locked"}
+    print("other failures: " + (", ".join(f"{kind} {count}" for kind, count in sorted(others.items())) or "none"))
+    sizes = [user.state_size for user in users]
+    print(f"session state per user: {sum(sizes) / len(sizes) / 1024:.1f} KiB mean, {max(sizes) / 1024:.1f} KiB max; "
+          f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200, help="concurrent simulated users")
+    parser.add_argument("--chats", type=int, default=2, help="conversations per user")
+    parser.add_argument("--turns", type=int, default=3, help="questions per conversation")
+    parser.add_argument("--questions", type=int, default=100, help="distinct questions; repeats hit the response cache")
+    parser.add_argument("--think-time", type=float, default=0.5, help="mean seconds between a user's interactions")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="seconds over which users arrive")
+    parser.add_argument("--handshake-latency", type=float, default=0.2)
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--chunk-latency", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--scrypt-log-n", type=int, default=auth.SCRYPT_LOG_N, help="password hashing work factor")
+    parser.add_argument("--db", help="database file (default: a fresh temporary one)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    auth.SCRYPT_LOG_N = args.scrypt_log_n
+    rng = random.Random(args.seed)
+    questions = [f"If a train travels {n * 7} km in {n % 5 + 1} hours, what is its speed?" for n in range(args.questions)]
+
+    with tempfile.TemporaryDirectory() as directory, \
+            MockGradioServer(handshake_latency=args.handshake_latency, first_token_latency=args.first_token_latency,
+                             chunk_latency=args.chunk_latency, error_rate=args.error_rate) as server:
+        storage.DB_PATH = args.db or os.path.join(directory, "load.db")
+        inference.create_client = lambda space, hf_token=None: MockClient(server.url, hf_token=hf_token)
+        get_repository().initialize()
+
+        recorder = Recorder()
+        users = [SimulatedUser(n, recorder, questions, inference.MODEL_OPTIONS, args.think_time,
+                               random.Random(rng.random())) for n in range(args.users)]
+        wall = run_load(args, users)
+        storage.flush_writes()
+        report(recorder, users, wall)
+        storage.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import os
+import sys
+import time
+import uuid
+
+from context import ContextBuilder
+from inference import EMPTY_RESPONSE, INVALID_RESPONSE
+from reasoning import count_steps, split_reasoning
+from rendering import ChatRenderer
+from repository import get_repository
+from response_cache import get_cached_response, store_response
+from sessions import create_session, revoke_session, validate_session
+
+# -------------------- CHAT SESSION LOGIC --------------------
+#
+# What my_app.py does for a browser session, minus the widgets: logging in and
+# out, the sidebar conversation index, loading conversations, and a chat turn
+# from the question to the queued replies. Every function works on `state`,
+# st.session_state in the app or a plain dict anywhere else, through item
+# access only, so benchmarks/load_test.py drives exactly this code.
+
+# Long chats are loaded newest-first in pages and only the latest turns are rendered
+HISTORY_PAGE_TURNS = 20
+RENDER_WINDOW_TURNS = 20
+
+# Conversations listed in the sidebar per page
+SIDEBAR_CONVERSATIONS = 20
+
+DEFAULT_MODEL = "Llama-3.2-1B-DPO"
+
+
+def default_state():
+    # Everything a fresh browser session starts with
+    return {
+        "logged_in": False,
+        "user_email": "",
+        "user_first_name": "",
+        "user_id": None,
+        "conversation_limit": SIDEBAR_CONVERSATIONS,
+        "conversation_index": None,
+        "session_id": str(uuid.uuid4()),
+        "messages": [],
+        "history_cursor": None,
+        "render_window": RENDER_WINDOW_TURNS,
+        "renderer": ChatRenderer(),
+        "context_builder": ContextBuilder(),
+        "last_timings": {},
+        "last_trace": [],
+        "pending_input": "",
+        "send_triggered": False,
+        "model_name": DEFAULT_MODEL,
+    }
+
+# -------------------- LOGIN --------------------
+
+def login(state, email):
+    # For a user whose password has been checked; returns the token for ?session=
+    state["logged_in"] = True
+    state["user_email"] = email
+    state["user_id"], state["user_first_name"] = get_repository().get_user_profile(email)
+    return create_session(state["user_id"], email, state["user_first_name"])
+
+
+def restore(state, token):
+    # Logs the session back in from a ?session= token; False if the token is no longer valid
+    session = validate_session(token)
+    if not session:
+        return False
+    state["logged_in"] = True
+    state["user_id"], state["user_email"], state["user_first_name"] = session
+    return True
+
+
+def logout(token):
+    if token:
+        revoke_session(token)
+
+# -------------------- CONVERSATIONS --------------------
+
+def conversation_index(state, search=""):
+    # The user's most recent conversations and their display strings, cached per session
+    # until a saved title bumps the user's index version or the query changes
+    repo = get_repository()
+    user_id = state["user_id"]
+    key = (user_id, repo.conversation_index_version(user_id), state["conversation_limit"], search)
+    cached = state["conversation_index"]
+    if cached is None or cached[0] != key:
+        conversations = repo.get_user_conversations(user_id, state["conversation_limit"], search)
+        display_options = [f"{title} ({sid[:8]}...)" for sid, title in conversations]
+        cached = state["conversation_index"] = (key, conversations, display_options)
+    return cached[1], cached[2]
+
+
+def load_conversation(state, session_id):
+    messages, cursor = get_repository().get_conversation_page(session_id, limit=HISTORY_PAGE_TURNS * 2)
+    state["session_id"] = session_id
+    state["messages"] = messages
+    state["history_cursor"] = cursor
+    state["render_window"] = RENDER_WINDOW_TURNS
+
+
+def load_earlier(state, hidden):
+    # Widens the render window; fetches the next older page first if nothing is hidden in memory
+    if hidden <= 0:
+        older, cursor = get_repository().get_conversation_page(state["session_id"], before_id=state["history_cursor"],
+                                                               limit=HISTORY_PAGE_TURNS * 2)
+        state["messages"] = older + state["messages"]
+        state["history_cursor"] = cursor
+    state["render_window"] += RENDER_WINDOW_TURNS
+
+
+def new_chat(state):
+    state["session_id"] = str(uuid.uuid4())
+    state["messages"] = []
+    state["history_cursor"] = None
+    state["render_window"] = RENDER_WINDOW_TURNS
+
+# -------------------- CHAT TURN --------------------
+
+def conversation_title(user_input):
+    title = f"Topic: {user_input.strip()}"
+    return title[:47] + "..." if len(title) > 50 else title
+
+
+def build_histories(state, models, budget, collapse_reasoning):
+    # Context per model, built from the turns already on screen before the new question is appended
+    turns = state["renderer"].pair(state["messages"])
+    return {model_name: state["context_builder"].build(turns, model_name, budget, collapse_reasoning,
+                                                       state["session_id"], state["history_cursor"])
+            for model_name in models}
+
+
+def start_turn(state, user_input):
+    # Queues the question (and the title of a new conversation); returns (user_msg, pending write)
+    repo = get_repository()
+    pending = repo.queue_message(state["session_id"], "user", user_input, state["model_name"])
+    user_msg = {"id": None, "role": "user", "content": user_input}
+    state["messages"].append(user_msg)
+    if len(state["messages"]) == 1:
+        repo.queue_conversation_title(state["session_id"], conversation_title(user_input), state["user_id"])
+    return user_msg, pending
+
+
+def _cached_response(model_name, user_input):
+    # The response cache is best-effort: a database error there must not cost the user their turn
+    try:
+        return get_cached_response(model_name, user_input)
+    except Exception as e:
+        print(f"❗ Response cache lookup failed: {e}", file=sys.stderr)
+        return None
+
+
+def _store_response(model_name, user_input, response):
+    try:
+        store_response(model_name, user_input, response)
+    except Exception as e:
+        print(f"❗ Response cache write failed: {e}", file=sys.stderr)
+
+
+def submit_answers(user_input, models, use_cache=True, histories=None, dispatcher=None):
+    # Returns (responses, tickets): responses holds cached answers and "busy" notices by model
+    # index, tickets the dispatcher calls for the rest. Answers given with context depend on
+    # it, so they neither read nor fill the response cache.
+    # The dispatcher and its thread pool are imported on the first question, not at login
+    from dispatcher import QueueFull, get_dispatcher
+    dispatcher = dispatcher or get_dispatcher()
+    histories = histories or {}
+    hf_token = os.getenv("HF_API_TOKEN")
+    responses = [None] * len(models)
+    tickets = {}
+    for index, model_name in enumerate(models):
+        history = histories.get(model_name) or []
+        cached = _cached_response(model_name, user_input) if use_cache and not history else None
+        if cached is not None:
+            responses[index] = cached
+            continue
+        try:
+            tickets[index] = dispatcher.submit(model_name, user_input, hf_token, history)
+        except QueueFull as e:
+            responses[index] = f"⚠️ {e}"
+    return responses, tickets
+
+
+def collect_answers(user_input, models, responses, tickets, start, histories=None):
+    # After the tickets have been followed to the end: fills in their answers, caches them and
+    # returns ([(model_name, response)], timings)
+    histories = histories or {}
+    timings = {"cached": not tickets}
+    for index, ticket in tickets.items():
+        try:
+            response = ticket.result() or EMPTY_RESPONSE
+        except Exception as e:
+            response = f"❗ Error: {e}"
+        else:
+            if response not in (EMPTY_RESPONSE, INVALID_RESPONSE) and not histories.get(models[index]):
+                _store_response(models[index], user_input, response)
+        responses[index] = response
+    first_tokens = [t.timings["ttft"] for t in tickets.values() if "ttft" in t.timings]
+    if first_tokens:
+        timings["ttft"] = min(first_tokens)
+    timings.setdefault("ttft", time.perf_counter() - start)
+    timings["total"] = time.perf_counter() - start
+    return list(zip(models, responses)), timings
+
+
+def finish_turn(state, user_msg, pending_user, answers):
+    # Splits and queues each answer, then waits for the ids that key the bubble memo and reasoning toggles
+    repo = get_repository()
+    pending = []
+    for model_name, response in answers:
+        reasoning, answer = split_reasoning(response)
+        bot_msg = {"id": None, "role": "bot", "content": answer, "model_name": model_name,
+                   "reasoning_steps": count_steps(reasoning)}
+        pending.append((bot_msg, repo.queue_message(state["session_id"], "bot", answer, model_name, reasoning)))
+        state["messages"].append(bot_msg)
+    user_msg["id"] = pending_user.result()
+    for bot_msg, write in pending:
+        bot_msg["id"] = write.result()
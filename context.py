@@ -0,0 +1,89 @@
+from inference import estimate_tokens
+from reasoning import split_reasoning
+from rendering import pair_turns
+from repository import get_repository
+
+# -------------------- CONVERSATION CONTEXT --------------------
+#
+# Builds the `history` sent with a question: the most recent [user, bot] pairs
+# that fit in a token budget, newest kept first. Older answers can be collapsed
+# to their final answer so long chains of thought do not crowd out turns. Each
+# turn's prepared pair and token count is memoized by message ids, and turns
+# older than what is in st.session_state.messages are fetched from the DB page
+# by page and kept, so a new question only costs work for the newest turn.
+
+CONTEXT_TOKEN_BUDGET = 1024
+# The most recent turns keep their full reasoning; older ones are collapsed
+FULL_REASONING_TURNS = 1
+
+
+def final_answer(text):
+    # The conclusion of a chain-of-thought answer, as reasoning.split_reasoning finds it. Answers
+    # saved since migration 9 already are their conclusion; older rows may still hold the reasoning.
+    return split_reasoning(text)[1].strip()
+
+
+class ContextBuilder:
+    # Per-session memo of prepared turns, kept in st.session_state next to the ChatRenderer
+
+    def __init__(self):
+        self._prepared = {}     # (user id, bot id, collapsed) -> ([user, bot], tokens)
+        self._older = []        # turns fetched from the DB that predate the in-memory messages
+        self._older_cursor = None
+        self._older_session = None
+
+    def _prepare(self, user_msg, bot_msg, collapse):
+        key = (user_msg.get("id"), bot_msg.get("id"), collapse)
+        prepared = self._prepared.get(key) if key[0] is not None else None
+        if prepared is None:
+            if collapse:
+                answer = final_answer(bot_msg["content"])
+            elif bot_msg.get("reasoning_steps"):
+                # Reasoning is stored apart from the answer (migration 9); full turns send the original text
+                answer = get_repository().get_reasoning(bot_msg["id"]) + bot_msg["content"]
+            else:
+                answer = bot_msg["content"]
+            pair = [user_msg["content"], answer]
+            prepared = (pair, estimate_tokens(pair[0]) + estimate_tokens(pair[1]))
+            if key[0] is not None:
+                self._prepared[key] = prepared
+        return prepared
+
+    def _older_turns(self, session_id, cursor):
+        # Yields turns from the DB older than `cursor`, newest first, one page at a time
+        if self._older_session != (session_id, cursor):
+            self._older_session = (session_id, cursor)
+            self._older = []
+            self._older_cursor = cursor
+        for turn in reversed(self._older):
+            yield turn
+        while self._older_cursor:
+            messages, self._older_cursor = get_repository().get_conversation_page(session_id,
+                                                                                  before_id=self._older_cursor)
+            page, _ = pair_turns(messages)
+            self._older = page + self._older
+            for turn in reversed(page):
+                yield turn
+
+    def build(self, turns, model_name, budget=CONTEXT_TOKEN_BUDGET, collapse_reasoning=True,
+              session_id=None, cursor=None):
+        # `turns` is ChatRenderer.pair(...) output; `cursor` is the history cursor of those messages
+        def newest_first():
+            yield from reversed(turns)
+            if session_id and cursor:
+                yield from self._older_turns(session_id, cursor)
+
+        history = []
+        used = 0
+        for age, (user_msg, bot_msgs) in enumerate(newest_first()):
+            # In compare turns prefer the answer from the model being asked now
+            bot_msg = next((b for b in bot_msgs if b.get("model_name") == model_name), bot_msgs[0])
+            if bot_msg["content"].startswith(("⚠️", "❗")):
+                continue
+            pair, tokens = self._prepare(user_msg, bot_msg, collapse_reasoning and age >= FULL_REASONING_TURNS)
+            if used + tokens > budget:
+                break
+            history.append(pair)
+            used += tokens
+        history.reverse()
+        return history
@@ -1,12 +1,15 @@
-import sqlite3
+from migrations import migrate
+import storage
+from retention import delete_sessions, select_sessions
 
 def delete_all_conversations():
-    conn = sqlite3.connect("chat_history.db")  # Connect to your database
-    c = conn.cursor()
-    c.execute("DELETE FROM conversations")  # Delete all rows
-    conn.commit()
-    conn.close()
-    print("All conversations deleted successfully.")
+    # Chunked through retention.py so the app is never locked out for the whole run;
+    # see `python retention.py --help` for age/user/session policies and archiving
+    migrate()
+    conn = storage.get_connection()
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM conversations").fetchone()[0]
+    deleted, _ = delete_sessions(conn, select_sessions(conn, everything=True), max_id)
+    print(f"All conversations deleted successfully ({deleted} messages).")
 
 if __name__ == "__main__":
     delete_all_conversations()
@@ -0,0 +1,265 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from inference import SPACE, get_client, invalidate_client, stream_response
+from response_cache import normalize_prompt
+
+# -------------------- INFERENCE DISPATCHER --------------------
+#
+# Sits between chat_interface and the backend. Each model gets at most
+# PER_MODEL_CONCURRENCY calls in flight; further requests wait in a bounded
+# FIFO (QueueFull beyond MAX_QUEUED) and can report their queue position.
+# Identical concurrent prompts for the same model share one call. Calls that
+# fail before producing any output are retried with jittered exponential
+# backoff, and every call is bounded by REQUEST_TIMEOUT: at the deadline the
+# ticket fails for everyone following it, leaves the in-flight table, frees its
+# model slot and has its backend job cancelled. A worker still blocked on the
+# backend is abandoned and whatever it returns afterwards is dropped.
+
+PER_MODEL_CONCURRENCY = 2
+MAX_QUEUED = 32
+REQUEST_TIMEOUT = 180
+MAX_RETRIES = 2
+RETRY_BACKOFF = 0.5
+
+QUEUE_WAIT = metrics.histogram("cot_dispatch_queue_seconds", "Time a call waited for a free model slot")
+CALLS = metrics.counter("cot_dispatch_calls_total", "Backend calls by model and outcome")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Ticket:
+    # One backend call, shared by every session that asked the same question meanwhile
+
+    def __init__(self, dispatcher, key, model_name, user_input, hf_token, timeout, history=None):
+        self.dispatcher = dispatcher
+        self.key = key
+        self.model_name = model_name
+        self.user_input = user_input
+        self.history = history or []
+        self.hf_token = hf_token
+        self.deadline = time.monotonic() + timeout
+        self.submitted = time.perf_counter()
+        self.finished = None
+        self.text = ""
+        self.timings = {}
+        self.error = None
+        self.done = False
+        self.version = 0
+        self.job = None         # the backend job of the current attempt, cancelled on expiry
+        self.released = False   # the model slot has been handed back; guarded by the dispatcher lock
+        self._timer = None
+        self._changed = threading.Condition()
+
+    def _publish(self, text=None, error=None, done=False):
+        # Returns False once the ticket has finished: late output from an abandoned worker is dropped
+        with self._changed:
+            if self.done:
+                return False
+            if text is not None:
+                self.text = text
+            if error is not None:
+                self.error = error
+            if done and not self.done:
+                self.finished = time.perf_counter()
+            self.done = done
+            self.version += 1
+            self._changed.notify_all()
+        return True
+
+    def position(self):
+        return self.dispatcher.queue_position(self)
+
+    def expire(self):
+        self.dispatcher._expire(self)
+
+    def wait(self, version, timeout):
+        # Block until something newer than `version` was published; returns the current version
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version or self.done, timeout)
+            return self.version
+
+    def follow(self, poll_interval=0.25):
+        # Yields (queue_position, text) on every change until the call finishes
+        version = -1
+        while True:
+            if time.monotonic() > self.deadline and not self.done:
+                self.expire()
+            new_version = self.wait(version, poll_interval)
+            position = self.position()
+            if new_version != version or position:
+                version = new_version
+                yield position, self.text
+            if self.done:
+                return
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.text
+
+
+class InferenceDispatcher:
+
+    def __init__(self, per_model_concurrency=PER_MODEL_CONCURRENCY, max_queued=MAX_QUEUED,
+                 timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES, backoff=RETRY_BACKOFF, max_workers=32):
+        self.per_model_concurrency = per_model_concurrency
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._in_flight = {}   # (model_name, normalized prompt, token, context) -> Ticket
+        self._active = {}      # model_name -> running calls
+        self._waiting = {}     # model_name -> deque of queued Tickets
+
+    def submit(self, model_name, user_input, hf_token=None, history=None):
+        # Only calls with the same context are shared
+        context = tuple(tuple(pair) for pair in history or [])
+        key = (model_name, normalize_prompt(user_input), hf_token, context)
+        with self._lock:
+            ticket = self._in_flight.get(key)
+            if ticket is not None:
+                return ticket
+            ticket = Ticket(self, key, model_name, user_input, hf_token, self.timeout, history)
+            ticket._timer = threading.Timer(self.timeout, self._expire, (ticket,))
+            ticket._timer.daemon = True
+            if self._active.get(model_name, 0) < self.per_model_concurrency:
+                self._active[model_name] = self._active.get(model_name, 0) + 1
+                self._executor.submit(self._run, ticket)
+            else:
+                if sum(len(q) for q in self._waiting.values()) >= self.max_queued:
+                    CALLS.inc(model=model_name, outcome="rejected")
+                    raise QueueFull(f"{model_name} is busy, please try again in a moment")
+                self._waiting.setdefault(model_name, deque()).append(ticket)
+            self._in_flight[key] = ticket
+        ticket._timer.start()
+        return ticket
+
+    def queue_position(self, ticket):
+        with self._lock:
+            waiting = self._waiting.get(ticket.model_name, ())
+            for position, queued in enumerate(waiting, start=1):
+                if queued is ticket:
+                    return position
+        return 0
+
+    def _run(self, ticket):
+        try:
+            ticket.timings["queued"] = time.perf_counter() - ticket.submitted
+            QUEUE_WAIT.observe(ticket.timings["queued"], model=ticket.model_name)
+            if time.monotonic() > ticket.deadline:
+                raise TimeoutError(f"{ticket.model_name} request expired while queued")
+            self._call_with_retries(ticket)
+            if ticket._publish(done=True):
+                CALLS.inc(model=ticket.model_name, outcome="ok")
+        except Exception as e:
+            if ticket._publish(error=e, done=True):
+                CALLS.inc(model=ticket.model_name, outcome="timeout" if isinstance(e, TimeoutError) else "error")
+        finally:
+            self._release(ticket)
+
+    def _expire(self, ticket):
+        # Runs on the ticket's timer, or from follow()/follow_all() if they notice the deadline first
+        if not ticket._publish(error=TimeoutError(f"No answer from {ticket.model_name} within {self.timeout}s"),
+                               done=True):
+            return
+        CALLS.inc(model=ticket.model_name, outcome="timeout")
+        with self._lock:
+            waiting = self._waiting.get(ticket.model_name)
+            if waiting and ticket in waiting:
+                # Never started: it holds no slot
+                waiting.remove(ticket)
+                ticket.released = True
+                if self._in_flight.get(ticket.key) is ticket:
+                    del self._in_flight[ticket.key]
+                return
+        self._release(ticket)
+        job = ticket.job
+        if job is not None and hasattr(job, "cancel"):
+            try:
+                job.cancel()
+            except Exception:
+                pass
+
+    def _call_with_retries(self, ticket):
+        def on_submit(job):
+            ticket.job = job
+
+        for attempt in range(self.max_retries + 1):
+            produced = False
+            try:
+                client = get_client(SPACE, ticket.hf_token)
+                for text in stream_response(client, ticket.user_input, ticket.model_name, ticket.timings,
+                                            ticket.history, on_submit):
+                    if time.monotonic() > ticket.deadline:
+                        raise TimeoutError(f"No answer from {ticket.model_name} within {self.timeout}s")
+                    produced = True
+                    ticket._publish(text=text)
+                return
+            except TimeoutError:
+                raise
+            except Exception:
+                if ticket.done:
+                    # Expired: the error is the cancelled job, not the backend
+                    raise
+                invalidate_client(SPACE, ticket.hf_token)
+                # A partially streamed answer is not replayed; only clean failures are retried
+                if produced or attempt == self.max_retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                if time.monotonic() + delay > ticket.deadline:
+                    raise
+                CALLS.inc(model=ticket.model_name, outcome="retry")
+                time.sleep(delay)
+
+    def _release(self, ticket):
+        # Called by the worker when it finishes and by _expire(); only the first call frees the slot
+        ticket._timer.cancel()
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            if self._in_flight.get(ticket.key) is ticket:
+                del self._in_flight[ticket.key]
+            waiting = self._waiting.get(ticket.model_name)
+            if waiting:
+                self._executor.submit(self._run, waiting.popleft())
+            else:
+                self._active[ticket.model_name] -= 1
+
+
+def follow_all(tickets, poll_interval=0.1):
+    # Yields (index, queue_position, text) whenever one of `tickets` changes, until all have finished
+    versions = [-1] * len(tickets)
+    while True:
+        for index, ticket in enumerate(tickets):
+            if not ticket.done and time.monotonic() > ticket.deadline:
+                ticket.expire()
+            position = ticket.position()
+            if ticket.version != versions[index] or position:
+                versions[index] = ticket.version
+                yield index, position, ticket.text
+        if all(ticket.done for ticket in tickets):
+            return
+        time.sleep(poll_interval)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    # One dispatcher per process, so limits apply across all Streamlit sessions
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = InferenceDispatcher()
+        return _dispatcher
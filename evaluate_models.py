@@ -0,0 +1,157 @@
+import argparse
+import csv
+import json
+import time
+
+import chat_session
+import inference
+import storage
+from dispatcher import InferenceDispatcher, follow_all
+from inference import MODEL_OPTIONS, estimate_tokens
+from reasoning import split_reasoning
+
+# -------------------- OFFLINE EVALUATION --------------------
+#
+# Replays the user prompts stored in chat_history.db against one or more models
+# through chat_session.submit_answers, the dispatcher -> client cache ->
+# stream_response path of a chat turn with the response cache off, and reports latency, throughput, error rate and
+# chain-of-thought length per model.
+#
+#   python evaluate_models.py --models phi-2-DPO gemma-3-1b-it-DPO --limit 200 --parallel 4 --json report.json
+#   python evaluate_models.py --mock          # offline, against mock_backend.MockGradioServer
+
+SQL_STORED_PROMPTS = ("SELECT content FROM conversations WHERE role = 'user' "
+                      "GROUP BY content ORDER BY MIN(id) LIMIT ?")
+
+
+def load_prompts(limit):
+    return [row[0] for row in storage.query(SQL_STORED_PROMPTS, (limit,)) if row[0] and row[0].strip()]
+
+
+def reasoning_text(answer):
+    # Everything before the final answer counts as the chain of thought
+    return split_reasoning(answer)[0]
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def replay(models, prompts, parallel, timeout, retries):
+    dispatcher = InferenceDispatcher(per_model_concurrency=parallel, max_queued=len(models) * len(prompts),
+                                     timeout=timeout, max_retries=retries, max_workers=parallel * len(models))
+    tickets = []
+    results = []
+    for prompt in prompts:
+        responses, submitted = chat_session.submit_answers(prompt, models, use_cache=False, dispatcher=dispatcher)
+        for index, model in enumerate(models):
+            if index in submitted:
+                tickets.append((model, prompt, submitted[index]))
+            else:
+                results.append({"model": model, "prompt": prompt, "latency": 0.0, "ttft": None, "queued": None,
+                                "error": responses[index], "tokens": 0, "cot_tokens": 0})
+    for _ in follow_all([ticket for _, _, ticket in tickets]):
+        pass
+
+    for model, prompt, ticket in tickets:
+        row = {"model": model, "prompt": prompt, "latency": ticket.finished - ticket.submitted,
+               "ttft": ticket.timings.get("ttft"), "queued": ticket.timings.get("queued"),
+               "error": None, "tokens": 0, "cot_tokens": 0}
+        try:
+            answer = ticket.result()
+            row["tokens"] = estimate_tokens(answer)
+            row["cot_tokens"] = estimate_tokens(reasoning_text(answer))
+        except Exception as e:
+            row["error"] = str(e)
+        results.append(row)
+    return results
+
+
+def summarize(results, models):
+    summary = []
+    for model in models:
+        rows = [r for r in results if r["model"] == model]
+        ok = [r for r in rows if r["error"] is None]
+        # Service time excludes queueing so parallelism does not inflate per-request latency
+        latencies = [r["latency"] - (r["queued"] or 0) for r in ok]
+        summary.append({
+            "model": model,
+            "requests": len(rows),
+            "errors": len(rows) - len(ok),
+            "error_rate": (len(rows) - len(ok)) / len(rows) if rows else 0.0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "ttft_p50": percentile([r["ttft"] for r in ok if r["ttft"] is not None], 50),
+            "tokens_per_sec": sum(r["tokens"] for r in ok) / sum(latencies) if latencies and sum(latencies) else 0.0,
+            "mean_cot_tokens": sum(r["cot_tokens"] for r in ok) / len(ok) if ok else 0.0,
+        })
+    return summary
+
+
+def print_summary(summary):
+    def ms(value):
+        return f"{value * 1000:.0f}" if value is not None else "-"
+    print(f"{'model':<28} {'n':>5} {'err%':>6} {'p50ms':>7} {'p95ms':>7} {'p99ms':>7} {'ttft':>6} {'tok/s':>7} {'cot':>6}")
+    for s in summary:
+        print(f"{s['model']:<28} {s['requests']:>5} {s['error_rate'] * 100:>6.1f} {ms(s['p50']):>7} {ms(s['p95']):>7} "
+              f"{ms(s['p99']):>7} {ms(s['ttft_p50']):>6} {s['tokens_per_sec']:>7.1f} {s['mean_cot_tokens']:>6.1f}")
+
+
+def write_csv(path, results):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()) if results else ["model"])
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay stored prompts against models and report latency/throughput")
+    parser.add_argument("--db", default=None, help="database with the prompts (default: chat_history.db)")
+    parser.add_argument("--models", nargs="+", default=MODEL_OPTIONS, choices=MODEL_OPTIONS)
+    parser.add_argument("--limit", type=int, default=100, help="number of distinct stored prompts to replay")
+    parser.add_argument("--parallel", type=int, default=2, help="concurrent requests per model")
+    parser.add_argument("--timeout", type=float, default=180)
+    parser.add_argument("--retries", type=int, default=0)
+    parser.add_argument("--json", help="write the summary and per-request results to this JSON file")
+    parser.add_argument("--csv", help="write per-request results to this CSV file")
+    parser.add_argument("--mock", action="store_true", help="run against a local mock backend, no network")
+    parser.add_argument("--mock-latency", type=float, default=0.2, help="mock time to first token in seconds")
+    args = parser.parse_args()
+
+    if args.db:
+        storage.DB_PATH = args.db
+    prompts = load_prompts(args.limit)
+    if not prompts:
+        print("No stored prompts found.")
+        return
+
+    server = None
+    if args.mock:
+        from mock_backend import MockGradioServer
+        server = MockGradioServer(handshake_latency=0.0, first_token_latency=args.mock_latency).start()
+        inference.MOCK_BACKEND_URL = server.url
+
+    try:
+        start = time.perf_counter()
+        results = replay(args.models, prompts, args.parallel, args.timeout, args.retries)
+        elapsed = time.perf_counter() - start
+    finally:
+        if server:
+            server.stop()
+
+    summary = summarize(results, args.models)
+    print(f"Replayed {len(prompts)} prompts x {len(args.models)} models in {elapsed:.1f}s")
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"prompts": len(prompts), "elapsed": elapsed, "summary": summary, "results": results}, f, indent=2)
+    if args.csv:
+        write_csv(args.csv, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+# -------------------- MODEL BACKEND --------------------
+
+SPACE = "Eshita-ds/cot-llm-298"
+API_NAME = "/chatbot_response"
+
+MODEL_OPTIONS = [
+    "Llama-3.2-1B-DPO",
+    "gemma-3-1b-it-DPO",
+    "phi-2-DPO",
+    "Llama-3.2-1B-DPO-DPO-GRPO"
+]
+
+# Point the app at a local mock_backend.MockGradioServer instead of the Space
+MOCK_BACKEND_URL = os.getenv("COT_MOCK_BACKEND")
+
+EMPTY_RESPONSE = "⚠️ Empty response."
+INVALID_RESPONSE = "⚠️ Invalid response format."
+
+CLIENT_CREATE = metrics.histogram("cot_client_create_seconds", "Building a Client, including the Space handshake")
+CLIENT_LOOKUPS = metrics.counter("cot_client_cache_lookups_total", "get_client() calls by result")
+PREDICT = metrics.histogram("cot_predict_seconds", "Remote prediction from submit to final result")
+FIRST_TOKEN = metrics.histogram("cot_predict_first_token_seconds", "Remote prediction from submit to first text")
+PARSE = metrics.histogram("cot_parse_seconds", "parse_response() per streamed output",
+                          buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.01))
+
+# -------------------- CLIENT CACHE --------------------
+#
+# Building a Client fetches the Space's config and API schema before any
+# inference can start, so clients are shared process-wide (and therefore across
+# Streamlit sessions) keyed by (space, token). Idle clients are evicted, the
+# least recently used one is dropped when the cache is full, and a client that
+# has not been used for a while is health-checked before it is handed out.
+
+CLIENT_CACHE_SIZE = 8
+CLIENT_MAX_IDLE = 30 * 60
+HEALTH_CHECK_AFTER = 60
+HEALTH_CHECK_TIMEOUT = 5
+
+_clients = OrderedDict()  # (space, token) -> [client, last_used]
+_clients_lock = threading.Lock()
+_key_locks = {}
+
+
+def create_client(space, hf_token=None):
+    with CLIENT_CREATE.time():
+        if MOCK_BACKEND_URL:
+            from mock_backend import MockClient
+            return MockClient(MOCK_BACKEND_URL, hf_token=hf_token)
+        from gradio_client import Client
+        return Client(space, hf_token=hf_token)
+
+
+def client_is_healthy(client, hf_token=None):
+    src = getattr(client, "src", None)
+    if not src:
+        return True
+    import urllib.error
+    import urllib.request
+    # Private Spaces only serve /config with the token the client was built with
+    headers = {"Authorization": f"Bearer {hf_token}"} if hf_token else {}
+    request = urllib.request.Request(f"{src.rstrip('/')}/config", headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=HEALTH_CHECK_TIMEOUT) as response:
+            return response.status == 200
+    except urllib.error.HTTPError as e:
+        # The Space answered but refused the check; the client's own auth is what matters for calls
+        return e.code in (401, 403)
+    except Exception:
+        return False
+
+
+def get_client(space=SPACE, hf_token=None):
+    key = (space, hf_token)
+    with _clients_lock:
+        lock = _key_locks.setdefault(key, threading.Lock())
+
+    # Per-key lock: concurrent sessions wait for one handshake instead of each doing their own
+    with lock:
+        now = time.monotonic()
+        with _clients_lock:
+            entry = _clients.get(key)
+            if entry is not None:
+                _clients.move_to_end(key)
+        if entry is not None:
+            client, last_used = entry
+            idle = now - last_used
+            if idle <= CLIENT_MAX_IDLE and (idle <= HEALTH_CHECK_AFTER or client_is_healthy(client, hf_token)):
+                entry[1] = now
+                CLIENT_LOOKUPS.inc(result="hit")
+                return client
+            invalidate_client(space, hf_token)
+        CLIENT_LOOKUPS.inc(result="miss")
+
+        client = create_client(space, hf_token)
+        with _clients_lock:
+            _clients[key] = [client, time.monotonic()]
+            while len(_clients) > CLIENT_CACHE_SIZE:
+                _clients.popitem(last=False)
+        return client
+
+
+def invalidate_client(space=SPACE, hf_token=None):
+    # Drop a client after a failed call; the next get_client() reconnects lazily
+    with _clients_lock:
+        _clients.pop((space, hf_token), None)
+
+
+def clear_clients():
+    with _clients_lock:
+        _clients.clear()
+
+# -------------------- RESPONSES --------------------
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    # Word pieces and punctuation; close enough to BPE counts for budgeting and throughput
+    return len(_TOKEN_PATTERN.findall(text or ""))
+
+
+def parse_response(result):
+    # /chatbot_response returns (chat_history, ...) where the last history entry is (user, bot)
+    if result and isinstance(result, (list, tuple)) and len(result) >= 1:
+        if isinstance(result[0], (list, tuple)) and len(result[0]) > 0 and isinstance(result[0][-1], (list, tuple)):
+            return result[0][-1][1]
+        return INVALID_RESPONSE
+    return EMPTY_RESPONSE
+
+
+def stream_response(client, user_input, model_name, timings=None, history=None, on_submit=None):
+    # Yields the answer text so far each time the backend publishes a new output.
+    # `timings` is filled with "ttft" (seconds to first non-empty text) and "total".
+    # `history` is a list of earlier [user, bot] pairs, see context.py.
+    # `on_submit` is called with the backend job, so a caller can cancel() it from another thread.
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    job = client.submit(
+        user_input=user_input,
+        history=history or [],
+        session_id=None,
+        model_name=model_name,
+        api_name=API_NAME,
+    )
+    if on_submit is not None:
+        on_submit(job)
+    text = ""
+    for output in job:
+        with PARSE.time():
+            chunk = parse_response(output)
+        if chunk in (EMPTY_RESPONSE, INVALID_RESPONSE) or not chunk or chunk == text:
+            continue
+        if "ttft" not in timings:
+            timings["ttft"] = time.perf_counter() - start
+            FIRST_TOKEN.observe(timings["ttft"], model=model_name)
+        text = chunk
+        yield text
+
+    # Surfaces backend errors and covers endpoints that only publish a final result
+    final = parse_response(job.result())
+    if final != text and (not text or final not in (EMPTY_RESPONSE, INVALID_RESPONSE)):
+        timings.setdefault("ttft", time.perf_counter() - start)
+        yield final
+    timings["total"] = time.perf_counter() - start
+    PREDICT.observe(timings["total"], model=model_name)
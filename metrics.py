@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# -------------------- METRICS --------------------
+#
+# Process-wide counters and histograms for the chat pipeline, rendered in the
+# Prometheus text format. Set COT_METRICS_PORT to serve them at /metrics, or
+# call write_prometheus() for a textfile collector. COT_METRICS=0 turns every
+# timer and counter into a no-op. While a trace() block is open, the
+# observations made on that thread are also collected for the per-turn debug
+# panel. Recording is a perf_counter pair, a bisect and a short locked update,
+# so it stays far below a millisecond per stage.
+
+ENABLED = os.getenv("COT_METRICS", "1") != "0"
+METRICS_PORT = int(os.getenv("COT_METRICS_PORT", "0"))
+
+# Seconds; spans sub-millisecond SQLite work up to multi-minute generations
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry = {}
+_registry_lock = threading.Lock()
+_local = threading.local()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in values]
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series = {}   # label key -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+        spans = getattr(_local, "spans", None)
+        if spans is not None:
+            spans.append((self.name, key, value))
+
+    def time(self, **labels):
+        # with histogram.time(model="phi-2-DPO"): ...
+        return _Timer(self, labels)
+
+    def summary(self, **labels):
+        # (count, sum) for one label set
+        series = self._series.get(_label_key(labels))
+        return (sum(series[:-1]), series[-1]) if series else (0, 0.0)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            series = [(key, list(values)) for key, values in self._series.items()]
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            cumulative += values[-2]
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {values[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+def _register(cls, name, help, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, help, **kwargs)
+        return metric
+
+
+def counter(name, help=""):
+    return _register(Counter, name, help)
+
+
+def histogram(name, help="", buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, help, buckets=buckets)
+
+
+class trace:
+    # with trace() as spans: ... -> [(metric name, label key, seconds)] observed on this thread
+
+    def __enter__(self):
+        self.previous = getattr(_local, "spans", None)
+        self.spans = _local.spans = []
+        return self.spans
+
+    def __exit__(self, *exc):
+        _local.spans = self.previous
+
+
+def render_prometheus():
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    # Atomic replace so a node_exporter textfile collector never reads half a file
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp, path)
+
+
+def _metrics_handler():
+    # Built on first use so importing metrics does not pull in http.server
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return MetricsHandler
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, host="127.0.0.1"):
+    # Idempotent: Streamlit reruns the script, the endpoint is started once per process
+    global _server
+    port = METRICS_PORT if port is None else port
+    with _server_lock:
+        if _server is None and port:
+            from http.server import ThreadingHTTPServer
+            _server = ThreadingHTTPServer((host, port), _metrics_handler())
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        return _server
@@ -0,0 +1,423 @@
+import argparse
+import secrets
+from datetime import datetime
+
+import storage
+
+# -------------------- MIGRATION RUNNER --------------------
+#
+# Each migration is (version, name, apply, backfill). `apply` runs the schema
+# change inside one transaction together with the version bump. `backfill`, if
+# present, is run afterwards in small committed chunks so large tables never sit
+# behind one long write lock; it must be idempotent because an interrupted
+# backfill is simply resumed by the next migrate() call.
+
+BACKFILL_BATCH_SIZE = 5000
+
+MIGRATIONS = []
+
+
+def migration(version, name, backfill=None):
+    def register(apply):
+        MIGRATIONS.append((version, name, apply, backfill))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return apply
+    return register
+
+
+def column_names(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def backfill_in_batches(conn, table, assignment, pending_condition, batch_size=None):
+    # UPDATE rows matching pending_condition in rowid order, one commit per batch
+    batch_size = batch_size or BACKFILL_BATCH_SIZE
+    updated = 0
+    while True:
+        with conn:
+            cursor = conn.execute(
+                f"UPDATE {table} SET {assignment} WHERE rowid IN "
+                f"(SELECT rowid FROM {table} WHERE {pending_condition} ORDER BY rowid LIMIT ?)",
+                (batch_size,))
+        updated += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            return updated
+
+
+def ensure_migrations_table(conn):
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT,
+                applied_at TEXT,
+                backfilled INTEGER DEFAULT 0
+            )
+        """)
+
+
+def current_version(conn):
+    row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+def migrate(db_path=None, target=None, verbose=False):
+    conn = storage.get_connection(db_path)
+    ensure_migrations_table(conn)
+    version = current_version(conn)
+
+    for number, name, apply, backfill in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-check under the write lock in case another process migrated first
+            if number > current_version(conn):
+                apply(conn)
+                conn.execute(
+                    "INSERT INTO schema_migrations (version, name, applied_at, backfilled) VALUES (?, ?, ?, ?)",
+                    (number, name, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 0 if backfill else 1))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if verbose:
+            print(f"✅ Applied migration {number}: {name}")
+
+    # Finish any backfills that are pending, including ones interrupted earlier
+    pending = conn.execute("SELECT version FROM schema_migrations WHERE backfilled = 0").fetchall()
+    backfills = {number: backfill for number, _, _, backfill in MIGRATIONS}
+    for (number,) in pending:
+        updated = backfills[number](conn) if backfills.get(number) else 0
+        with conn:
+            conn.execute("UPDATE schema_migrations SET backfilled = 1 WHERE version = ?", (number,))
+        if verbose:
+            print(f"✅ Backfilled migration {number}: {updated} rows")
+
+    return current_version(conn)
+
+# -------------------- MIGRATIONS --------------------
+
+@migration(1, "create base tables")
+def create_base_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT,
+            role TEXT,
+            content TEXT,
+            timestamp TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE,
+            password TEXT,
+            first_name TEXT,
+            last_name TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_titles (
+            session_id TEXT PRIMARY KEY,
+            title TEXT
+        )
+    """)
+
+
+@migration(2, "add conversations.timestamp")
+def add_conversation_timestamp(conn):
+    # Databases created by COT_Interface.py have no timestamp column
+    if "timestamp" not in column_names(conn, "conversations"):
+        conn.execute("ALTER TABLE conversations ADD COLUMN timestamp TEXT")
+
+
+@migration(3, "index conversations by session")
+def index_conversations_by_session(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_session ON conversations (session_id, id)")
+
+
+def backfill_title_created_at(conn):
+    return backfill_in_batches(
+        conn, "conversation_titles",
+        "created_at = COALESCE((SELECT MIN(timestamp) FROM conversations "
+        "WHERE conversations.session_id = conversation_titles.session_id), '')",
+        "created_at IS NULL")
+
+
+@migration(4, "add conversation ownership", backfill=backfill_title_created_at)
+def add_conversation_ownership(conn):
+    columns = column_names(conn, "conversation_titles")
+    if "user_id" not in columns:
+        conn.execute("ALTER TABLE conversation_titles ADD COLUMN user_id INTEGER")
+    if "created_at" not in columns:
+        conn.execute("ALTER TABLE conversation_titles ADD COLUMN created_at TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conversation_titles_user ON conversation_titles (user_id, created_at)")
+
+
+@migration(5, "add response cache")
+def add_response_cache(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS response_cache (
+            model_name TEXT,
+            prompt_hash TEXT,
+            prompt TEXT,
+            response TEXT,
+            created_at REAL,
+            last_used REAL,
+            hits INTEGER DEFAULT 0,
+            PRIMARY KEY (model_name, prompt_hash)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_last_used ON response_cache (last_used)")
+
+
+@migration(6, "add conversations.model_name")
+def add_message_model_name(conn):
+    if "model_name" not in column_names(conn, "conversations"):
+        conn.execute("ALTER TABLE conversations ADD COLUMN model_name TEXT")
+
+
+def index_search_range(conn, after_id, upto_id):
+    # Adds messages after_id < id <= upto_id to conversations_fts; returns the rows indexed
+    return conn.execute("INSERT INTO conversations_fts (rowid, content) "
+                        "SELECT id, COALESCE(content, '') FROM conversations WHERE id > ? AND id <= ?",
+                        (after_id, upto_id)).rowcount
+
+
+def backfill_search_index(conn):
+    # Index rows that existed before the triggers, oldest first, resuming from search_index_state
+    updated = 0
+    while True:
+        last_indexed, target = conn.execute("SELECT last_indexed, target FROM search_index_state").fetchone()
+        if last_indexed >= target:
+            return updated
+        with conn:
+            upto = conn.execute(
+                "SELECT MAX(id) FROM (SELECT id FROM conversations WHERE id > ? AND id <= ? ORDER BY id LIMIT ?)",
+                (last_indexed, target, BACKFILL_BATCH_SIZE)).fetchone()[0] or target
+            indexed = index_search_range(conn, last_indexed, upto)
+            conn.execute("UPDATE search_index_state SET last_indexed = ?", (upto,))
+        updated += indexed
+
+
+@migration(7, "add full-text search over messages", backfill=backfill_search_index)
+def add_message_search(conn):
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts
+        USING fts5(content, content='conversations', content_rowid='id')
+    """)
+    # Rows up to the current maximum id predate the triggers and are indexed by the backfill
+    conn.execute("CREATE TABLE IF NOT EXISTS search_index_state (last_indexed INTEGER, target INTEGER)")
+    conn.execute("INSERT INTO search_index_state SELECT 0, COALESCE(MAX(id), 0) FROM conversations")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_insert AFTER INSERT ON conversations BEGIN
+            INSERT INTO conversations_fts (rowid, content) VALUES (new.id, COALESCE(new.content, ''));
+        END
+    """)
+    # Deleting or editing a row the backfill has not reached must not touch the index: a
+    # 'delete' for content that was never indexed corrupts an external-content FTS5 table
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations
+        WHEN old.id <= (SELECT last_indexed FROM search_index_state) OR old.id > (SELECT target FROM search_index_state)
+        BEGIN
+            INSERT INTO conversations_fts (conversations_fts, rowid, content)
+            VALUES ('delete', old.id, COALESCE(old.content, ''));
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_update AFTER UPDATE OF content ON conversations
+        WHEN old.id <= (SELECT last_indexed FROM search_index_state) OR old.id > (SELECT target FROM search_index_state)
+        BEGIN
+            INSERT INTO conversations_fts (conversations_fts, rowid, content)
+            VALUES ('delete', old.id, COALESCE(old.content, ''));
+            INSERT INTO conversations_fts (rowid, content) VALUES (new.id, COALESCE(new.content, ''));
+        END
+    """)
+
+
+@migration(8, "add signed login sessions")
+def add_login_sessions(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            token_id TEXT PRIMARY KEY,
+            user_id INTEGER,
+            email TEXT,
+            created_at REAL,
+            expires_at REAL,
+            revoked INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_sessions_expires ON user_sessions (expires_at)")
+    conn.execute("CREATE TABLE IF NOT EXISTS app_settings (key TEXT PRIMARY KEY, value TEXT)")
+    # Signing key for session tokens unless COT_SESSION_SECRET overrides it
+    conn.execute("INSERT OR IGNORE INTO app_settings (key, value) VALUES ('session_secret', ?)",
+                 (secrets.token_hex(32),))
+
+
+@migration(9, "store reasoning apart from final answers")
+def add_message_reasoning(conn):
+    # Only answers saved from now on are split; existing rows keep their whole text in conversations.content
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS message_reasoning (
+            message_id INTEGER PRIMARY KEY,
+            codec TEXT,
+            steps INTEGER,
+            body BLOB
+        )
+    """)
+
+
+def count_catalogue_range(conn, after_id, upto_id):
+    # Adds messages after_id < id <= upto_id to conversation_catalogue; returns the conversations touched
+    conn.execute("""
+        INSERT INTO conversation_catalogue (session_id, title, message_count, created_at, last_activity)
+        SELECT c.session_id, t.title, 0, MIN(c.timestamp), MAX(c.timestamp)
+        FROM conversations c LEFT JOIN conversation_titles t ON t.session_id = c.session_id
+        WHERE c.id > ? AND c.id <= ?
+          AND c.session_id NOT IN (SELECT session_id FROM conversation_catalogue)
+        GROUP BY c.session_id ORDER BY MIN(c.id)
+    """, (after_id, upto_id))
+    return conn.execute("""
+        UPDATE conversation_catalogue SET
+            message_count = message_count + (SELECT COUNT(*) FROM conversations c
+                WHERE c.session_id = conversation_catalogue.session_id AND c.id > ?1 AND c.id <= ?2),
+            last_activity = MAX(COALESCE(last_activity, ''), COALESCE((SELECT MAX(c.timestamp) FROM conversations c
+                WHERE c.session_id = conversation_catalogue.session_id AND c.id > ?1 AND c.id <= ?2), '')),
+            created_at = COALESCE(MIN(created_at, (SELECT MIN(c.timestamp) FROM conversations c
+                WHERE c.session_id = conversation_catalogue.session_id AND c.id > ?1 AND c.id <= ?2)), created_at)
+        WHERE session_id IN (SELECT session_id FROM conversations WHERE id > ?1 AND id <= ?2)
+    """, (after_id, upto_id)).rowcount
+
+
+def backfill_conversation_catalogue(conn):
+    # Count messages that predate the triggers, oldest first, resuming from catalogue_state
+    updated = 0
+    while True:
+        last_counted, target = conn.execute("SELECT last_counted, target FROM catalogue_state").fetchone()
+        if last_counted >= target:
+            return updated
+        with conn:
+            upto = conn.execute(
+                "SELECT MAX(id) FROM (SELECT id FROM conversations WHERE id > ? AND id <= ? ORDER BY id LIMIT ?)",
+                (last_counted, target, BACKFILL_BATCH_SIZE)).fetchone()[0] or target
+            counted = count_catalogue_range(conn, last_counted, upto)
+            conn.execute("UPDATE catalogue_state SET last_counted = ?", (upto,))
+        updated += counted
+
+
+@migration(10, "add conversation catalogue", backfill=backfill_conversation_catalogue)
+def add_conversation_catalogue(conn):
+    # One row per conversation with a stable id, kept current by triggers on every insert and delete
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_catalogue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT UNIQUE,
+            title TEXT,
+            message_count INTEGER DEFAULT 0,
+            created_at TEXT,
+            last_activity TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conversation_catalogue_activity "
+                 "ON conversation_catalogue (last_activity)")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS conversation_catalogue_insert AFTER INSERT ON conversations BEGIN
+            UPDATE conversation_catalogue SET message_count = message_count + 1, last_activity = new.timestamp
+            WHERE session_id = new.session_id;
+            INSERT INTO conversation_catalogue (session_id, title, message_count, created_at, last_activity)
+            SELECT new.session_id, (SELECT title FROM conversation_titles WHERE session_id = new.session_id),
+                   1, new.timestamp, new.timestamp
+            WHERE NOT EXISTS (SELECT 1 FROM conversation_catalogue WHERE session_id = new.session_id);
+        END
+    """)
+    # Rows the backfill has not reached yet were never counted, so deleting them changes nothing
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS conversation_catalogue_delete AFTER DELETE ON conversations
+        WHEN old.id <= (SELECT last_counted FROM catalogue_state) OR old.id > (SELECT target FROM catalogue_state)
+        BEGIN
+            UPDATE conversation_catalogue SET message_count = message_count - 1 WHERE session_id = old.session_id;
+            DELETE FROM conversation_catalogue WHERE session_id = old.session_id AND message_count <= 0;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS conversation_catalogue_title AFTER INSERT ON conversation_titles BEGIN
+            UPDATE conversation_catalogue SET title = new.title WHERE session_id = new.session_id;
+        END
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS catalogue_state (last_counted INTEGER, target INTEGER)")
+    conn.execute("INSERT INTO catalogue_state SELECT 0, COALESCE(MAX(id), 0) FROM conversations")
+
+
+def backfill_response_similarity(conn):
+    # Signatures for answers cached before migration 11; rows that have one are skipped, so reruns resume
+    from response_cache import normalize_prompt
+    from similarity_index import SQL_SIMILARITY_STORE, match_key, signature
+    updated = 0
+    while True:
+        rows = conn.execute(
+            "SELECT c.model_name, c.prompt_hash, c.prompt FROM response_cache c WHERE NOT EXISTS "
+            "(SELECT 1 FROM response_similarity s WHERE s.model_name = c.model_name AND s.prompt_hash = c.prompt_hash) "
+            "ORDER BY c.last_used LIMIT ?", (BACKFILL_BATCH_SIZE,)).fetchall()
+        with conn:
+            for model_name, key, prompt in rows:
+                text = normalize_prompt(prompt or "")
+                conn.execute(SQL_SIMILARITY_STORE, (model_name, key, match_key(text), signature(text)))
+        updated += len(rows)
+        if len(rows) < BACKFILL_BATCH_SIZE:
+            return updated
+
+
+@migration(11, "add near-duplicate prompt index", backfill=backfill_response_similarity)
+def add_response_similarity(conn):
+    # MinHash signatures of cached prompts, see similarity_index.py; they go when their answer does
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS response_similarity (
+            model_name TEXT,
+            prompt_hash TEXT,
+            match_key TEXT,
+            signature BLOB,
+            PRIMARY KEY (model_name, prompt_hash)
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS response_similarity_evict AFTER DELETE ON response_cache BEGIN
+            DELETE FROM response_similarity WHERE model_name = old.model_name AND prompt_hash = old.prompt_hash;
+        END
+    """)
+
+
+def backfill_reasoning_search(conn):
+    # Index reasoning stored before migration 12, oldest first, resuming from reasoning_index_state
+    updated = 0
+    while True:
+        last_indexed, target = conn.execute("SELECT last_indexed, target FROM reasoning_index_state").fetchone()
+        if last_indexed >= target:
+            return updated
+        with conn:
+            upto = conn.execute(
+                "SELECT MAX(message_id) FROM (SELECT message_id FROM message_reasoning "
+                "WHERE message_id > ? AND message_id <= ? ORDER BY message_id LIMIT ?)",
+                (last_indexed, target, BACKFILL_BATCH_SIZE)).fetchone()[0] or target
+            indexed = storage.index_reasoning(conn, last_indexed, upto)
+            conn.execute("UPDATE reasoning_index_state SET last_indexed = ?", (upto,))
+        updated += indexed
+
+
+@migration(12, "add full-text search over reasoning", backfill=backfill_reasoning_search)
+def add_reasoning_search(conn):
+    # Reasoning is stored compressed, which SQL cannot read, so no trigger can keep the index
+    # in sync. It is contentless, holding no second copy of the text: storage.index_reasoning
+    # adds rows and storage.unindex_reasoning removes them.
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS reasoning_fts USING fts5(reasoning, content='')")
+    conn.execute("CREATE TABLE IF NOT EXISTS reasoning_index_state (last_indexed INTEGER, target INTEGER)")
+    conn.execute("INSERT INTO reasoning_index_state SELECT 0, COALESCE(MAX(message_id), 0) FROM message_reasoning")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations to chat_history.db")
+    parser.add_argument("--db", default=None, help="database file (default: chat_history.db)")
+    parser.add_argument("--target", type=int, default=None, help="stop after this schema version")
+    args = parser.parse_args()
+    print(f"Schema version: {migrate(args.db, args.target, verbose=True)}")
@@ -0,0 +1,239 @@
+import argparse
+import hashlib
+import http.client
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# -------------------- FAKE GRADIO SERVER --------------------
+#
+# A local stand-in for the "Eshita-ds/cot-llm-298" Space so the app, the
+# benchmarks and the load tests can run without network access. It serves a
+# /config handshake and a streaming /chatbot_response endpoint whose latency,
+# length and failure rate are configurable.
+
+
+def fake_answer(user_input, model_name, steps=3):
+    # Deterministic chain-of-thought style answer for a prompt
+    digest = hashlib.sha256(f"{model_name}:{user_input}".encode()).hexdigest()
+    lines = ["Let's think step by step."]
+    for n in range(steps):
+        lines.append(f"Step {n + 1}: consider part {digest[n * 4:n * 4 + 4]} of the question.")
+    lines.append(f"Therefore, the answer is {int(digest[:6], 16) % 100}.")
+    return "\n".join(lines)
+
+
+class MockBackendHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/config":
+            time.sleep(self.server.handshake_latency)
+            self.send_json({"version": "mock", "endpoints": ["/chatbot_response"]})
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.rstrip("/") != "/chatbot_response":
+            self.send_json({"error": "not found"}, status=404)
+            return
+
+        server = self.server
+        with server.stats_lock:
+            server.requests += 1
+        if server.error_rate and random.random() < server.error_rate:
+            time.sleep(server.first_token_latency)
+            self.send_json({"error": "mock backend failure"}, status=500)
+            return
+
+        user_input = request.get("user_input", "")
+        answer = fake_answer(user_input, request.get("model_name", ""), server.steps)
+        words = answer.split(" ")
+
+        # Newline-delimited JSON, one cumulative output per chunk, chunked transfer encoding
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(server.first_token_latency)
+        try:
+            for n in range(1, len(words) + 1, server.words_per_chunk):
+                partial = " ".join(words[:n + server.words_per_chunk - 1])
+                self.write_chunk(json.dumps([[[user_input, partial]], None]).encode() + b"\n")
+                time.sleep(server.chunk_latency)
+            self.write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the job
+            self.close_connection = True
+
+
+class MockGradioServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, handshake_latency=0.2, first_token_latency=0.1,
+                 chunk_latency=0.01, words_per_chunk=4, steps=3, error_rate=0.0):
+        super().__init__((host, port), MockBackendHandler)
+        self.handshake_latency = handshake_latency
+        self.first_token_latency = first_token_latency
+        self.chunk_latency = chunk_latency
+        self.words_per_chunk = words_per_chunk
+        self.steps = steps
+        self.error_rate = error_rate
+        self.stats_lock = threading.Lock()
+        self.requests = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+# -------------------- CLIENT --------------------
+
+class MockJob:
+    # Mirrors the parts of gradio_client.Job the app uses: iteration, result() and cancel()
+
+    def __init__(self, client, payload):
+        self._client = client
+        self._payload = payload
+        self._outputs = []
+        self._error = None
+        self._done = False
+        self._sock = None
+
+    def __iter__(self):
+        if self._done:
+            yield from self._outputs
+            return
+        try:
+            response = self._client._request("POST", "/chatbot_response", json.dumps(self._payload))
+            self._sock = self._client._connection().sock
+            if response.status != 200:
+                body = response.read()
+                raise RuntimeError(f"mock backend returned {response.status}: {body.decode(errors='replace')}")
+            for line in response:
+                if line.strip():
+                    output = json.loads(line)
+                    self._outputs.append(output)
+                    yield output
+        except Exception as e:
+            self._client._reset_connection()
+            self._error = e
+        finally:
+            self._done = True
+
+    def outputs(self):
+        return list(self._outputs)
+
+    def cancel(self):
+        # Called from another thread: shutting the socket down ends the iteration with an error
+        if self._done or self._sock is None:
+            return False
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            return False
+        return True
+
+    def result(self):
+        if not self._done:
+            for _ in self:
+                pass
+        if self._error:
+            raise self._error
+        return self._outputs[-1] if self._outputs else None
+
+
+class MockClient:
+    # Drop-in for gradio_client.Client against a MockGradioServer URL
+
+    def __init__(self, src, hf_token=None, timeout=30):
+        self.src = src.rstrip("/")
+        self.hf_token = hf_token
+        self.timeout = timeout
+        self._local = threading.local()
+        # The handshake real Clients do before any inference
+        response = self._request("GET", "/config")
+        self.config = json.loads(response.read())
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            parsed = urlparse(self.src)
+            conn = self._local.conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=self.timeout)
+        return conn
+
+    def _reset_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _request(self, method, path, body=None):
+        # Keep-alive: one persistent connection per thread, reopened once if the server closed it
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+                return conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self._reset_connection()
+                if attempt:
+                    raise
+
+    def submit(self, api_name="/chatbot_response", **kwargs):
+        return MockJob(self, dict(kwargs))
+
+    def predict(self, api_name="/chatbot_response", **kwargs):
+        return self.submit(api_name=api_name, **kwargs).result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake /chatbot_response backend")
+    parser.add_argument("--port", type=int, default=7861)
+    parser.add_argument("--handshake-latency", type=float, default=0.2)
+    parser.add_argument("--first-token-latency", type=float, default=0.1)
+    parser.add_argument("--chunk-latency", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = MockGradioServer(port=args.port, handshake_latency=args.handshake_latency,
+                              first_token_latency=args.first_token_latency,
+                              chunk_latency=args.chunk_latency, error_rate=args.error_rate)
+    print(f"Mock backend listening on {server.url} (set COT_MOCK_BACKEND={server.url})")
+    server.serve_forever()
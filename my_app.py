@@ -1,137 +1,50 @@
 import streamlit as st
-import sqlite3
-import uuid
-from datetime import datetime
 import time
-from gradio_client import Client
-import os
-
-# -------------------- DATABASE SETUP --------------------
-
-def initialize_database():
-    conn = sqlite3.connect("chat_history.db")
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            role TEXT,
-            content TEXT,
-            timestamp TEXT
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE,
-            password TEXT,
-            first_name TEXT,
-            last_name TEXT
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS conversation_titles (
-            session_id TEXT PRIMARY KEY,
-            title TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-# -------------------- USER FUNCTIONS --------------------
-
-def save_user(email, password, first_name, last_name):
-    conn = sqlite3.connect("chat_history.db")
-    c = conn.cursor()
-    try:
-        c.execute("INSERT INTO users (email, password, first_name, last_name) VALUES (?, ?, ?, ?)",
-                  (email, password, first_name, last_name))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
-
-def authenticate_user(email, password):
-    conn = sqlite3.connect("chat_history.db")
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE email = ? AND password = ?", (email, password))
-    user = c.fetchone()
-    conn.close()
-    return user is not None
-
-def get_user_first_name(email):
-    conn = sqlite3.connect("chat_history.db")
-    c = conn.cursor()
-    c.execute("SELECT first_name FROM users WHERE email = ?", (email,))
-    result = c.fetchone()
-    conn.close()
-    return result[0] if result else ""
-
-# -------------------- CHAT FUNCTIONS --------------------
-
-def save_message(session_id, role, content):
-    conn = sqlite3.connect("chat_history.db")
-    c = conn.cursor()
-    c.execute("INSERT INTO conversations (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
-              (session_id, role, content, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-    conn.commit()
-    conn.close()
-
-def get_conversation_history(session_id):
-    conn = sqlite3.connect("chat_history.db")
-    c = conn.cursor()
-    c.execute("SELECT role, content, timestamp FROM conversations WHERE session_id = ?", (session_id,))
-    history = c.fetchall()
-    conn.close()
-    return [{"role": r, "content": c, "timestamp": t} for r, c, t in history]
-
-def save_conversation_title(session_id, title):
-    conn = sqlite3.connect("chat_history.db")
-    c = conn.cursor()
-    c.execute("INSERT OR IGNORE INTO conversation_titles (session_id, title) VALUES (?, ?)", (session_id, title))
-    conn.commit()
-    conn.close()
-
-def get_conversations():
-    conn = sqlite3.connect("chat_history.db")
-    c = conn.cursor()
-    c.execute("SELECT session_id, title FROM conversation_titles")
-    sessions = c.fetchall()
-    conn.close()
-    return sessions
+
+import chat_session
+import metrics
+from auth import authenticate_user, save_user
+from context import CONTEXT_TOKEN_BUDGET
+from inference import MODEL_OPTIONS
+from rendering import CHAT_CSS, bubble_html
+from response_cache import cache_stats
+from search import search_messages
+
+from repository import get_repository
+
+repo = get_repository()
+
+# Minimum seconds between re-renders of a streaming answer
+STREAM_RENDER_INTERVAL = 0.05
+
+RENDER = metrics.histogram("cot_render_seconds", "Re-rendering a streaming answer in chat_interface")
+TURN = metrics.histogram("cot_turn_seconds", "A chat turn from send to queued replies")
 
 # -------------------- SESSION STATE --------------------
 
 def initialize_session():
+    # Session logic lives in chat_session.py; this only fills in what a new browser session lacks
     if "logged_in" not in st.session_state:
-        st.session_state.logged_in = False
-    if "user_email" not in st.session_state:
-        st.session_state.user_email = ""
-    if "user_first_name" not in st.session_state:
-        st.session_state.user_first_name = ""
-    if "session_id" not in st.session_state:
-        st.session_state.session_id = str(uuid.uuid4())
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
-    if "pending_input" not in st.session_state:
-        st.session_state.pending_input = ""
-    if "send_triggered" not in st.session_state:
-        st.session_state.send_triggered = False
-    if "model_name" not in st.session_state:
-        st.session_state.model_name = "Llama-3.2-1B-DPO"
-
-    # Persistent login check
+        for key, value in chat_session.default_state().items():
+            if key not in st.session_state:
+                st.session_state[key] = value
+
+    # Persistent login check: restore from the signed session token, usually without a DB query
     params = st.query_params
-    if not st.session_state.logged_in and "user_email" in params:
-        email = params["user_email"]
-        st.session_state.logged_in = True
-        st.session_state.user_email = email
-        st.session_state.user_first_name = get_user_first_name(email)
+    if not st.session_state.logged_in and "session" in params:
+        if not chat_session.restore(st.session_state, params["session"]):
+            del st.query_params["session"]
 
 # -------------------- UI COMPONENTS --------------------
 
+def logout():
+    if "session" in st.query_params:
+        chat_session.logout(st.query_params["session"])
+        del st.query_params["session"]
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
+    st.rerun()
+
 def login_page():
     st.title("🔐 Login or Signup")
     tab1, tab2 = st.tabs(["Login", "Signup"])
@@ -141,10 +54,8 @@ def login_page():
         password = st.text_input("Password", type="password", key="login_password")
         if st.button("Login"):
             if authenticate_user(email, password):
-                st.session_state.logged_in = True
-                st.session_state.user_email = email
-                st.session_state.user_first_name = get_user_first_name(email)
-                st.query_params.update({"user_email": email})
+                token = chat_session.login(st.session_state, email)
+                st.query_params.update({"session": token})
                 st.rerun()
             else:
                 st.error("Invalid email or password")
@@ -160,37 +71,138 @@ def login_page():
             else:
                 st.error("User already exists.")
 
-def chat_interface():
-    MODEL_OPTIONS = [
-        "Llama-3.2-1B-DPO",
-        "gemma-3-1b-it-DPO",
-        "phi-2-DPO",
-        "Llama-3.2-1B-DPO-DPO-GRPO"
-    ]
+# -------------------- INFERENCE --------------------
+
+def generate_answers(user_input, models, use_cache, histories=None):
+    # Asks every model in `models` at once and streams each answer into its own column,
+    # so a comparison takes as long as the slowest model rather than the sum of all.
+    # Returns ([(model_name, response)], timings), see chat_session.collect_answers.
+    from dispatcher import follow_all
+    start = time.perf_counter()
+    labels = models if len(models) > 1 else [None]
+    placeholders = [column.empty() for column in st.columns(len(models))]
+    responses, tickets = chat_session.submit_answers(user_input, models, use_cache, histories)
+    for index, response in enumerate(responses):
+        if response is not None and index not in tickets:
+            placeholders[index].markdown(bubble_html("bot", response, label=labels[index]), unsafe_allow_html=True)
+
+    if tickets:
+        # Render chunks as the backend produces them, at most once per STREAM_RENDER_INTERVAL per model
+        indices = list(tickets)
+        last_render = [0.0] * len(models)
+        with st.spinner("Thinking..."):
+            for n, position, text in follow_all([tickets[i] for i in indices]):
+                index = indices[n]
+                if position:
+                    placeholders[index].caption(f"⏳ Waiting for {models[index]}: position {position} in queue")
+                elif text and time.perf_counter() - last_render[index] >= STREAM_RENDER_INTERVAL:
+                    with RENDER.time():
+                        placeholders[index].markdown(bubble_html("bot", text, label=labels[index]), unsafe_allow_html=True)
+                    last_render[index] = time.perf_counter()
+    return chat_session.collect_answers(user_input, models, responses, tickets, start, histories)
+
+def show_reasoning(container, msg):
+    # Only the final answer is in the bubble; the reasoning is fetched while its toggle is on
+    steps = msg.get("reasoning_steps")
+    if steps and container.toggle(f"🧠 Reasoning ({steps} steps)", key=f"reasoning-{msg['id']}"):
+        container.markdown(repo.get_reasoning(msg["id"]))
+
+def debug_panel():
+    # Where the last turn's time went, per stage; backend stages run on dispatcher threads
+    # and are summarised from the ticket timings instead
+    stages = {}
+    for name, labels, seconds in st.session_state.last_trace:
+        stage = name + "".join(f" {value}" for _, value in labels)
+        count, total = stages.get(stage, (0, 0.0))
+        stages[stage] = (count + 1, total + seconds)
+    timings = st.session_state.last_timings
+    for key in ("queued", "ttft", "total"):
+        if key in timings:
+            stages[f"backend {key}"] = (1, timings[key])
+    if not stages:
+        st.caption("No turn recorded yet.")
+    for stage, (count, total) in sorted(stages.items(), key=lambda item: -item[1][1]):
+        st.caption(f"{stage}: {total * 1000:.1f} ms" + (f" over {count} calls" if count > 1 else ""))
+    server = metrics.start_metrics_server()
+    if server:
+        st.caption(f"📈 Prometheus metrics at http://{server.server_address[0]}:{server.server_address[1]}/metrics")
 
+def chat_interface():
     with st.sidebar:
         st.title(f"👋 Welcome, {st.session_state.user_first_name}!")
+        if st.button("🚪 Log out"):
+            logout()
         st.selectbox("Select Model", MODEL_OPTIONS,
                      index=MODEL_OPTIONS.index(st.session_state.model_name),
                      key="model_name")
 
         show_timestamps = st.checkbox("🕒 Show timestamps", value=False)
-
-        conversations = get_conversations()
+        use_cache = st.checkbox("♻️ Reuse cached answers", value=True)
+        compare_mode = st.checkbox("⚖️ Compare models", value=False)
+        if compare_mode:
+            st.multiselect("Models to compare", MODEL_OPTIONS, default=MODEL_OPTIONS[:2], key="compare_models")
+        send_context = st.checkbox("🧠 Send conversation context", value=False)
+        if send_context:
+            context_budget = st.slider("Context budget (tokens)", 128, 4096, CONTEXT_TOKEN_BUDGET, step=128)
+            collapse_reasoning = st.checkbox("Collapse earlier reasoning to final answers", value=True)
+
+        timings = st.session_state.last_timings
+        if timings:
+            source = "cache" if timings.get("cached") else "model"
+            st.caption(f"⏱️ Last reply ({source}): first token {timings.get('ttft', 0):.2f}s · total {timings.get('total', 0):.2f}s")
+            stats = cache_stats()
+            st.caption(f"♻️ Cache: {stats['hits']} hits ({stats['near_hits']} paraphrased) · {stats['misses']} misses")
+        if st.checkbox("🐞 Debug timings", value=False):
+            debug_panel()
+
+        search = st.text_input("🔎 Search conversations", key="conversation_search").strip()
+        conversations, display_options = chat_session.conversation_index(st.session_state, search)
         if conversations:
-            display_options = [f"{title} ({sid[:8]}...)" for sid, title in conversations]
             selected_display = st.selectbox("Load Conversation", display_options)
             if st.button("Load Chat"):
-                selected_sid = conversations[display_options.index(selected_display)][0]
-                st.session_state.session_id = selected_sid
-                st.session_state.messages = get_conversation_history(selected_sid)
+                chat_session.load_conversation(st.session_state, conversations[display_options.index(selected_display)][0])
+            if len(conversations) >= st.session_state.conversation_limit and st.button("More conversations"):
+                st.session_state.conversation_limit += chat_session.SIDEBAR_CONVERSATIONS
+                st.rerun()
+
+        with st.expander("🔍 Search messages"):
+            search_text = st.text_input("Find text in your chats", key="message_search")
+            if search_text.strip():
+                hits = search_messages(search_text, st.session_state.user_id)
+                if not hits:
+                    st.caption("No matches.")
+                for n, (sid, title, role, snippet) in enumerate(hits):
+                    st.markdown(f"**{title}** · {role}  \n{' '.join(snippet.split())}")
+                    if st.button("Open", key=f"search_hit_{n}"):
+                        chat_session.load_conversation(st.session_state, sid)
 
         if st.button("➕ New Chat"):
-            st.session_state.session_id = str(uuid.uuid4())
-            st.session_state.messages = []
+            chat_session.new_chat(st.session_state)
 
     st.title("COT-Reasoning GPT")
-    st.markdown("<hr style='margin-top:-10px;'>", unsafe_allow_html=True)
+    st.markdown("<hr style='margin-top:-10px;'>" + CHAT_CSS, unsafe_allow_html=True)
+
+    # Display messages bottom-up; pairing and bubble HTML are reused across reruns
+    renderer = st.session_state.renderer
+    paired = renderer.pair(st.session_state.messages)
+
+    # Render window: older turns stay in memory (or in the DB) until asked for
+    hidden = len(paired) - st.session_state.render_window
+    if hidden > 0 or st.session_state.history_cursor:
+        if st.button("⬆️ Show earlier messages"):
+            chat_session.load_earlier(st.session_state, hidden)
+            st.rerun()
+    paired = paired[-st.session_state.render_window:]
+
+    for user_msg, bot_msgs in paired:
+        st.markdown(renderer.html(user_msg, show_timestamps), unsafe_allow_html=True)
+        if len(bot_msgs) == 1:
+            st.markdown(renderer.html(bot_msgs[0], show_timestamps), unsafe_allow_html=True)
+            show_reasoning(st, bot_msgs[0])
+        else:
+            for column, bot_msg in zip(st.columns(len(bot_msgs)), bot_msgs):
+                column.markdown(renderer.html(bot_msg, show_timestamps, bot_msg.get("model_name")), unsafe_allow_html=True)
+                show_reasoning(column, bot_msg)
 
     user_input = st.chat_input("Ask your question:")
     if user_input:
@@ -198,105 +210,39 @@ def chat_interface():
         st.session_state.send_triggered = True
 
     if st.session_state.send_triggered:
-        user_input = st.session_state.pending_input
-        st.session_state.messages.append({"role": "user", "content": user_input})
-        save_message(st.session_state.session_id, "user", user_input)
-
-        if len(st.session_state.messages) == 1:
-            title = f"Topic: {user_input.strip()}"
-            if len(title) > 50:
-                title = title[:47] + "..."
-            save_conversation_title(st.session_state.session_id, title)
-
-        try:
-            client = Client("Eshita-ds/cot-llm-298", hf_token = os.getenv("HF_API_TOKEN"))
-            with st.spinner("Thinking..."):
-                result = client.predict(
-                    user_input=user_input,
-                    history=[],
-                    session_id=None,
-                    model_name=st.session_state.model_name,
-                    api_name="/chatbot_response",
-                )
-            if result and isinstance(result, (list, tuple)) and len(result) >= 1:
-                if isinstance(result[0], (list, tuple)) and len(result[0]) > 0 and isinstance(result[0][-1], (list, tuple)):
-                    response = result[0][-1][1]
-                else:
-                    response = "⚠️ Invalid response format."
-            else:
-                response = "⚠️ Empty response."
-        except Exception as e:
-            response = f"❗ Error: {e}"
-
-        st.session_state.messages.append({"role": "bot", "content": response})
-        save_message(st.session_state.session_id, "bot", response)
-        st.session_state.pending_input = ""
-        st.session_state.send_triggered = False
+        # Stages timed on this thread during the turn feed the sidebar debug panel
+        with metrics.trace() as spans, TURN.time():
+            user_input = st.session_state.pending_input
+            models = [st.session_state.model_name]
+            if compare_mode and st.session_state.get("compare_models"):
+                models = st.session_state.compare_models
+            histories = {}
+            if send_context:
+                histories = chat_session.build_histories(st.session_state, models, context_budget, collapse_reasoning)
+
+            # Writes go through the write-behind queue and are committed while the models answer
+            user_msg, pending_user = chat_session.start_turn(st.session_state, user_input)
+            st.markdown(bubble_html("user", user_input), unsafe_allow_html=True)
+
+            answers, timings = generate_answers(user_input, models, use_cache, histories)
+            chat_session.finish_turn(st.session_state, user_msg, pending_user, answers)
+            st.session_state.last_timings = timings
+            st.session_state.pending_input = ""
+            st.session_state.send_triggered = False
+        st.session_state.last_trace = spans
         st.rerun()
 
-    # Display messages bottom-up
-    messages = st.session_state.messages
-    paired = []
-    i = 0
-    while i < len(messages) - 1:
-        if messages[i]["role"] == "user" and messages[i+1]["role"] == "bot":
-            paired.append((messages[i], messages[i+1]))
-            i += 2
-        else:
-            i += 1
-
-    for user_msg, bot_msg in paired:
-        # User message
-        ts_user = f"<div style='font-size:10px; color:gray; text-align:right;'>{user_msg['timestamp']}</div>" if show_timestamps else ""
-        st.markdown(
-            f"""
-            <div style='display: flex; justify-content: flex-end;'>
-                <div style='background-color: #DCF8C6; padding: 10px 15px; border-radius: 12px;
-                            max-width: 75%; margin: 4px 0; box-shadow: 1px 1px 5px rgba(0,0,0,0.05);'>
-                    <b>🧑 You:</b><br>{user_msg['content']}<br>{ts_user}
-                </div>
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
-
-        # Bot message with typewriter effect
-        ts_bot = f"<div style='font-size:10px; color:gray; text-align:left;'>{bot_msg['timestamp']}</div>" if show_timestamps else ""
-        if bot_msg == st.session_state.messages[-1]:  # last bot message
-            placeholder = st.empty()
-            typed = ""
-            for i in range(1, len(bot_msg['content']) + 1):
-                typed = bot_msg['content'][:i]
-                placeholder.markdown(
-                    f"""
-                    <div style='display: flex; justify-content: flex-start;'>
-                        <div style='background-color: #F1F0F0; padding: 10px 15px; border-radius: 12px;
-                                    max-width: 75%; margin: 4px 0; box-shadow: 1px 1px 5px rgba(0,0,0,0.05);'>
-                            <b>🤖 Bot:</b><br>{typed}<br>{ts_bot}
-                        </div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-                time.sleep(0.005)
-        else:
-            st.markdown(
-                f"""
-                <div style='display: flex; justify-content: flex-start;'>
-                    <div style='background-color: #F1F0F0; padding: 10px 15px; border-radius: 12px;
-                                max-width: 75%; margin: 4px 0; box-shadow: 1px 1px 5px rgba(0,0,0,0.05);'>
-                        <b>🤖 Bot:</b><br>{bot_msg['content']}<br>{ts_bot}
-                    </div>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-
 # -------------------- MAIN --------------------
 
+@st.cache_resource
+def startup():
+    # Once per process rather than on every rerun: schema migrations and the metrics endpoint
+    repo.initialize()
+    metrics.start_metrics_server()
+
 def main():
     st.set_page_config(page_title="COT Chatbot", page_icon="🤖")
-    initialize_database()
+    startup()
     initialize_session()
 
     if not st.session_state.logged_in:
@@ -0,0 +1,51 @@
+import re
+import zlib
+
+# -------------------- CHAIN-OF-THOUGHT PARSING --------------------
+#
+# A bot answer that announces its conclusion ("the answer is", "final answer")
+# is split at the start of the last line doing so. The conclusion is kept in
+# conversations.content, where it is rendered, searched and sent as context.
+# Everything before it, byte for byte, goes into message_reasoning (migration 9)
+# and is read only when a user opens it, so reasoning + answer is always the
+# original text. Answers without such a line are stored whole. Longer
+# reasoning blobs are zlib-compressed; short ones are stored as-is because
+# compression would not pay for its header.
+
+COMPRESS_MIN_BYTES = 200
+COMPRESS_LEVEL = 6
+
+_ANSWER_LINE = re.compile(r"the (?:final )?answer is|final answer|^\s*answer\s*:", re.IGNORECASE)
+
+
+def split_reasoning(text):
+    # Returns (reasoning, answer) with reasoning + answer == text. The answer starts at the last
+    # line announcing it, provided some text comes before it; otherwise reasoning is "".
+    text = text or ""
+    offset = 0
+    start = None
+    for line in text.splitlines(keepends=True):
+        if _ANSWER_LINE.search(line) and text[:offset].strip():
+            start = offset
+        offset += len(line)
+    if start is None:
+        return "", text
+    return text[:start], text[start:]
+
+
+def count_steps(reasoning):
+    # Non-empty lines, shown as the step count on the reasoning toggle
+    return sum(1 for line in reasoning.splitlines() if line.strip())
+
+
+def pack_reasoning(reasoning):
+    # (codec, blob) for the message_reasoning table
+    data = reasoning.encode()
+    if len(data) >= COMPRESS_MIN_BYTES:
+        return "zlib", zlib.compress(data, COMPRESS_LEVEL)
+    return "raw", data
+
+
+def unpack_reasoning(codec, blob):
+    data = zlib.decompress(blob) if codec == "zlib" else blob
+    return data.decode()
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+
+# -------------------- CHAT RENDERING --------------------
+#
+# Bubbles share one stylesheet instead of repeating inline styles, each stored
+# message's HTML is built once and memoized by message id, and user/bot turns
+# are paired incrementally as messages are appended. A rerun therefore only
+# does work for new messages, and unchanged bubbles produce byte-identical
+# payloads that Streamlit's message cache can deduplicate.
+
+CHAT_CSS = """
+<style>
+.cot-row { display: flex; }
+.cot-row.user { justify-content: flex-end; }
+.cot-row.bot { justify-content: flex-start; }
+.cot-bubble { padding: 10px 15px; border-radius: 12px; max-width: 75%; margin: 4px 0;
+              box-shadow: 1px 1px 5px rgba(0,0,0,0.05); }
+.cot-row.user .cot-bubble { background-color: #DCF8C6; }
+.cot-row.bot .cot-bubble { background-color: #F1F0F0; }
+.cot-ts { font-size: 10px; color: gray; }
+.cot-row.user .cot-ts { text-align: right; }
+.cot-row.bot .cot-ts { text-align: left; }
+</style>
+"""
+
+MAX_CACHED_BUBBLES = 500
+
+
+def bubble_html(role, content, timestamp=None, label=None):
+    header = "🧑 You" if role == "user" else f"🤖 {label or 'Bot'}"
+    ts = f"<div class='cot-ts'>{timestamp}</div>" if timestamp else ""
+    return f"<div class='cot-row {role}'><div class='cot-bubble'><b>{header}:</b><br>{content}<br>{ts}</div></div>"
+
+
+def pair_turns(messages, start=0):
+    # A question followed by one or more bot replies (several in compare mode) is one turn.
+    # Returns (turns, index of the last turn's question).
+    turns = []
+    last = start
+    i = start
+    while i < len(messages):
+        if messages[i]["role"] != "user":
+            i += 1
+            continue
+        j = i + 1
+        while j < len(messages) and messages[j]["role"] == "bot":
+            j += 1
+        if j > i + 1:
+            turns.append((messages[i], messages[i+1:j]))
+            last = i
+        i = j
+    return turns, last
+
+
+class ChatRenderer:
+    # Per-session pairing state and HTML memo for st.session_state.messages
+
+    def __init__(self):
+        self.turns = []          # [(user_msg, [bot_msg, ...])]
+        self._messages = None    # the list the turns were built from
+        self._scanned = 0        # index where the last (possibly still open) turn starts
+        self._html = OrderedDict()
+
+    def pair(self, messages):
+        if messages is not self._messages or len(messages) < self._scanned:
+            self.turns = []
+            self._messages = messages
+            self._scanned = 0
+        elif self.turns and self._scanned < len(messages):
+            # The last turn may still gain replies; re-pair from its question
+            self.turns.pop()
+
+        turns, self._scanned = pair_turns(messages, self._scanned)
+        self.turns.extend(turns)
+        return self.turns
+
+    def html(self, msg, show_timestamps, label=None):
+        key = (msg.get("id"), msg["role"], show_timestamps, label)
+        if key[0] is None:
+            return bubble_html(msg["role"], msg["content"], msg.get("timestamp") if show_timestamps else None, label)
+        cached = self._html.get(key)
+        if cached is None:
+            timestamp = msg.get("timestamp") or "" if show_timestamps else None
+            cached = self._html[key] = bubble_html(msg["role"], msg["content"], timestamp, label)
+            if len(self._html) > MAX_CACHED_BUBBLES:
+                self._html.popitem(last=False)
+        else:
+            self._html.move_to_end(key)
+        return cached
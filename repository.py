@@ -0,0 +1,302 @@
+import abc
+import itertools
+from bisect import bisect_left
+from datetime import datetime
+
+import storage
+from reasoning import count_steps
+from storage import NEWEST, PendingWrite
+
+# -------------------- CHAT REPOSITORY --------------------
+#
+# Users, messages and conversation titles behind one interface shared by
+# my_app.py and COT_Interface.py. SQLiteRepository is the storage.py module
+# bound to a database file. MemoryRepository keeps everything in dicts and
+# lists and takes no locks. It relies on the atomic dict/list operations and
+# itertools.count of CPython, and is meant for tests and benchmarks. The two
+# return the same shapes, so code written against one runs on the other.
+# Sessions, search and the response cache stay on SQLite.
+
+
+class ChatRepository(abc.ABC):
+    def initialize(self):
+        pass
+
+    # Users
+
+    @abc.abstractmethod
+    def save_user(self, email, password_hash, first_name, last_name):
+        # False if the email is taken
+        ...
+
+    @abc.abstractmethod
+    def get_password_hash(self, email):
+        ...
+
+    @abc.abstractmethod
+    def update_password_hash(self, email, password_hash):
+        ...
+
+    @abc.abstractmethod
+    def get_user_profile(self, email):
+        # (user_id, first_name); (None, "") for unknown emails
+        ...
+
+    # Messages
+
+    @abc.abstractmethod
+    def save_message(self, session_id, role, content, model_name=None, reasoning=None):
+        # Returns the message id
+        ...
+
+    def queue_message(self, session_id, role, content, model_name=None, reasoning=None):
+        # Like save_message but returns a PendingWrite; backends without a write queue save at once
+        write = PendingWrite(None, session_id)
+        write.finish(self.save_message(session_id, role, content, model_name, reasoning))
+        return write
+
+    @abc.abstractmethod
+    def get_reasoning(self, message_id):
+        ...
+
+    @abc.abstractmethod
+    def get_conversation_history(self, session_id):
+        # [{"role", "content", "timestamp"}] oldest first
+        ...
+
+    @abc.abstractmethod
+    def get_conversation_page(self, session_id, before_id=None, limit=40):
+        # (messages, cursor), see storage.get_conversation_page
+        ...
+
+    @abc.abstractmethod
+    def get_session_ids(self):
+        ...
+
+    @abc.abstractmethod
+    def get_catalogue(self, after_id=0, limit=-1):
+        # [(catalogue_id, session_id, title, message_count, last_activity)] by catalogue id
+        ...
+
+    @abc.abstractmethod
+    def get_catalogue_entry(self, catalogue_id=None, session_id=None):
+        ...
+
+    # Titles
+
+    @abc.abstractmethod
+    def save_conversation_title(self, session_id, title, user_id=None):
+        ...
+
+    def queue_conversation_title(self, session_id, title, user_id=None):
+        write = PendingWrite(None, session_id)
+        write.finish(self.save_conversation_title(session_id, title, user_id))
+        return write
+
+    @abc.abstractmethod
+    def conversation_index_version(self, user_id):
+        # Changes whenever user_id's conversation list does
+        ...
+
+    @abc.abstractmethod
+    def get_conversations(self):
+        ...
+
+    @abc.abstractmethod
+    def get_user_conversations(self, user_id, limit=20, search=""):
+        # [(session_id, title)] most recent first
+        ...
+
+
+class SQLiteRepository(ChatRepository):
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+
+    def initialize(self):
+        storage.initialize_database(self.db_path)
+
+    def save_user(self, email, password_hash, first_name, last_name):
+        return storage.save_user(email, password_hash, first_name, last_name, self.db_path)
+
+    def get_password_hash(self, email):
+        return storage.get_password_hash(email, self.db_path)
+
+    def update_password_hash(self, email, password_hash):
+        storage.update_password_hash(email, password_hash, self.db_path)
+
+    def get_user_profile(self, email):
+        return storage.get_user_profile(email, self.db_path)
+
+    def save_message(self, session_id, role, content, model_name=None, reasoning=None):
+        return storage.save_message(session_id, role, content, model_name, reasoning, self.db_path)
+
+    def queue_message(self, session_id, role, content, model_name=None, reasoning=None):
+        return storage.queue_message(session_id, role, content, model_name, reasoning, self.db_path)
+
+    def get_reasoning(self, message_id):
+        return storage.get_reasoning(message_id, self.db_path)
+
+    def get_conversation_history(self, session_id):
+        return storage.get_conversation_history(session_id, self.db_path)
+
+    def get_conversation_page(self, session_id, before_id=None, limit=40):
+        return storage.get_conversation_page(session_id, before_id, limit, self.db_path)
+
+    def get_session_ids(self):
+        return storage.get_session_ids(self.db_path)
+
+    def get_catalogue(self, after_id=0, limit=-1):
+        return storage.get_catalogue(after_id, limit, self.db_path)
+
+    def get_catalogue_entry(self, catalogue_id=None, session_id=None):
+        return storage.get_catalogue_entry(catalogue_id, session_id, self.db_path)
+
+    def save_conversation_title(self, session_id, title, user_id=None):
+        storage.save_conversation_title(session_id, title, user_id, self.db_path)
+
+    def queue_conversation_title(self, session_id, title, user_id=None):
+        return storage.queue_conversation_title(session_id, title, user_id, self.db_path)
+
+    def conversation_index_version(self, user_id):
+        return storage.conversation_index_version(user_id)
+
+    def get_conversations(self):
+        return storage.get_conversations(self.db_path)
+
+    def get_user_conversations(self, user_id, limit=20, search=""):
+        return storage.get_user_conversations(user_id, limit, search, self.db_path)
+
+
+class MemoryRepository(ChatRepository):
+    # Messages of one session are expected to be written by one thread at a time,
+    # as chat_interface does; their list is kept in id order by appending.
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._versions = itertools.count(1)
+        self._users = {}            # email -> [id, password_hash, first_name, last_name]
+        self._sessions = {}         # session_id -> [message dict], oldest first
+        self._message_ids = {}      # session_id -> [message id], parallel to _sessions for bisect
+        self._reasoning = {}        # message_id -> reasoning text
+        self._titles = {}           # session_id -> (title, user_id, created_at)
+        self._user_titles = {}      # user_id -> [session_id], oldest first
+        self._title_versions = {}   # user_id -> version
+        self._catalogue = {}        # session_id -> [catalogue_id, session_id, title, message_count, last_activity]
+        self._catalogue_ids = {}    # catalogue_id -> session_id
+        self._catalogue_seq = itertools.count(1)
+
+    @staticmethod
+    def _now():
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def save_user(self, email, password_hash, first_name, last_name):
+        user = [next(self._ids), password_hash, first_name, last_name]
+        return self._users.setdefault(email, user) is user
+
+    def get_password_hash(self, email):
+        user = self._users.get(email)
+        return user[1] if user else None
+
+    def update_password_hash(self, email, password_hash):
+        user = self._users.get(email)
+        if user:
+            user[1] = password_hash
+
+    def get_user_profile(self, email):
+        user = self._users.get(email)
+        return (user[0], user[2]) if user else (None, "")
+
+    def save_message(self, session_id, role, content, model_name=None, reasoning=None):
+        message_id = next(self._ids)
+        now = self._now()
+        if reasoning:
+            self._reasoning[message_id] = reasoning
+        self._sessions.setdefault(session_id, []).append(
+            {"id": message_id, "role": role, "content": content, "timestamp": now,
+             "model_name": model_name, "reasoning_steps": count_steps(reasoning or "")})
+        self._message_ids.setdefault(session_id, []).append(message_id)
+        entry = self._catalogue.get(session_id)
+        if entry is None:
+            title = self._titles.get(session_id, (None,))[0]
+            entry = [next(self._catalogue_seq), session_id, title, 0, now]
+            self._catalogue_ids[entry[0]] = session_id
+            self._catalogue[session_id] = entry
+        entry[3] += 1
+        entry[4] = now
+        return message_id
+
+    def get_reasoning(self, message_id):
+        return self._reasoning.get(message_id, "")
+
+    def get_conversation_history(self, session_id):
+        return [{"role": m["role"], "content": m["content"], "timestamp": m["timestamp"]}
+                for m in self._sessions.get(session_id, ())]
+
+    def get_conversation_page(self, session_id, before_id=None, limit=40):
+        messages = self._sessions.get(session_id, [])
+        end = bisect_left(self._message_ids.get(session_id, []), before_id or NEWEST)
+        start = max(0, end - limit)
+        rows = messages[start:end]
+        has_more = start > 0
+        # Same rule as storage.get_conversation_page: never start a page on orphaned bot replies
+        if has_more:
+            while len(rows) > 1 and rows[0]["role"] == "bot":
+                rows = rows[1:]
+        cursor = rows[0]["id"] if has_more and rows else None
+        return [dict(m) for m in rows], cursor
+
+    def get_session_ids(self):
+        return list(self._sessions)
+
+    def get_catalogue(self, after_id=0, limit=-1):
+        entries = [tuple(self._catalogue[self._catalogue_ids[i]])
+                   for i in sorted(self._catalogue_ids) if i > after_id]
+        return entries if limit < 0 else entries[:limit]
+
+    def get_catalogue_entry(self, catalogue_id=None, session_id=None):
+        if catalogue_id is not None:
+            session_id = self._catalogue_ids.get(catalogue_id)
+        entry = self._catalogue.get(session_id)
+        return tuple(entry) if entry else None
+
+    def save_conversation_title(self, session_id, title, user_id=None):
+        entry = (title, user_id, self._now())
+        if self._titles.setdefault(session_id, entry) is entry:
+            if session_id in self._catalogue:
+                self._catalogue[session_id][2] = title
+            self._user_titles.setdefault(user_id, []).append(session_id)
+            self._title_versions[user_id] = next(self._versions)
+
+    def conversation_index_version(self, user_id):
+        return self._title_versions.get(user_id, 0)
+
+    def get_conversations(self):
+        return [(session_id, entry[0]) for session_id, entry in list(self._titles.items())]
+
+    def get_user_conversations(self, user_id, limit=20, search=""):
+        search = search.lower()
+        found = []
+        for session_id in reversed(self._user_titles.get(user_id, [])):
+            title = self._titles[session_id][0]
+            if search in title.lower():
+                found.append((session_id, title))
+                if len(found) == limit:
+                    break
+        return found
+
+
+_repository = None
+
+
+def get_repository():
+    # The process-wide repository; SQLite on storage.DB_PATH unless set_repository() swapped it
+    global _repository
+    if _repository is None:
+        _repository = SQLiteRepository()
+    return _repository
+
+
+def set_repository(repository):
+    global _repository
+    _repository = repository
+    return repository
@@ -1,5 +1,7 @@
 import sqlite3
 
+from migrations import migrate
+
 def reset_users_table():
     try:
         # Connect to existing chat_history.db
@@ -32,15 +34,9 @@ def reset_users_table():
         conn.close()
 
 def add_timestamp():
-    conn = sqlite3.connect("chat_history.db")
-    c = conn.cursor()
-
-    # Add a timestamp column to the existing conversations table
-    c.execute("ALTER TABLE conversations ADD COLUMN timestamp TEXT")
-
-    conn.commit()
-    conn.close()
-    print("✅ Timestamp column added.")
+    # The timestamp column is now added by migration 2; run every pending migration
+    version = migrate(verbose=True)
+    print(f"✅ Schema is at version {version}.")
 
 if __name__ == "__main__":
     # reset_users_table()
@@ -0,0 +1,106 @@
+import hashlib
+import threading
+import time
+import unicodedata
+
+import metrics
+import similarity_index
+import storage
+
+# -------------------- RESPONSE CACHE --------------------
+#
+# Answers are requested with history=[], so they depend only on the model and
+# the prompt. They are cached in chat_history.db keyed by (model_name, hash of
+# the normalized prompt), expire after RESPONSE_CACHE_TTL seconds and the least
+# recently used rows are evicted once RESPONSE_CACHE_MAX_ENTRIES is exceeded.
+# A prompt with no exact entry can still be answered by a cached paraphrase
+# through similarity_index when COT_SIMILARITY_CACHE=1; those count as both
+# hits and near_hits.
+
+RESPONSE_CACHE_TTL = 7 * 24 * 60 * 60
+RESPONSE_CACHE_MAX_ENTRIES = 5000
+
+SQL_CACHE_LOOKUP = "SELECT response, created_at FROM response_cache WHERE model_name = ? AND prompt_hash = ?"
+SQL_CACHE_TOUCH = "UPDATE response_cache SET last_used = ?, hits = hits + 1 WHERE model_name = ? AND prompt_hash = ?"
+SQL_CACHE_DELETE = "DELETE FROM response_cache WHERE model_name = ? AND prompt_hash = ?"
+SQL_CACHE_STORE = ("INSERT OR REPLACE INTO response_cache "
+                   "(model_name, prompt_hash, prompt, response, created_at, last_used, hits) "
+                   "VALUES (?, ?, ?, ?, ?, ?, 0)")
+SQL_CACHE_EVICT = ("DELETE FROM response_cache WHERE rowid IN "
+                   "(SELECT rowid FROM response_cache ORDER BY last_used LIMIT "
+                   "max(0, (SELECT COUNT(*) FROM response_cache) - ?))")
+
+_stats = {"hits": 0, "near_hits": 0, "misses": 0, "stores": 0}
+_stats_lock = threading.Lock()
+
+
+def normalize_prompt(prompt):
+    text = unicodedata.normalize("NFKC", prompt).casefold()
+    return " ".join(text.split())
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(normalize_prompt(prompt).encode()).hexdigest()
+
+
+CACHE_EVENTS = metrics.counter("cot_response_cache_events_total", "Response cache hits, misses and stores")
+
+
+def _count(counter):
+    with _stats_lock:
+        _stats[counter] += 1
+    CACHE_EVENTS.inc(event=counter)
+
+
+def get_cached_response(model_name, prompt):
+    key = (model_name, prompt_hash(prompt))
+    row = storage.query_one(SQL_CACHE_LOOKUP, key)
+    near = False
+    if row is None and similarity_index.ENABLED:
+        similar = similarity_index.find_similar(model_name, normalize_prompt(prompt))
+        if similar is not None:
+            key = (model_name, similar)
+            row = storage.query_one(SQL_CACHE_LOOKUP, key)
+            if row is None:
+                # Evicted by another process since this one loaded the index
+                similarity_index.forget(model_name, similar)
+            near = True
+    now = time.time()
+    if row is None:
+        _count("misses")
+        return None
+    response, created_at = row
+    with storage.transaction() as conn:
+        if now - created_at > RESPONSE_CACHE_TTL:
+            conn.execute(SQL_CACHE_DELETE, key)
+            response = None
+        else:
+            conn.execute(SQL_CACHE_TOUCH, (now,) + key)
+    if response is None:
+        if near:
+            similarity_index.forget(model_name, key[1])
+        _count("misses")
+    else:
+        _count("hits")
+        if near:
+            _count("near_hits")
+    return response
+
+
+def store_response(model_name, prompt, response):
+    now = time.time()
+    key = prompt_hash(prompt)
+    with storage.transaction() as conn:
+        conn.execute(SQL_CACHE_STORE, (model_name, key, prompt, response, now, now))
+        if similarity_index.ENABLED:
+            similarity_index.index_prompt(conn, model_name, key, normalize_prompt(prompt))
+        conn.execute(SQL_CACHE_EVICT, (RESPONSE_CACHE_MAX_ENTRIES,))
+    _count("stores")
+
+
+def cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
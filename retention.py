@@ -0,0 +1,188 @@
+import argparse
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import storage
+from migrations import migrate
+from reasoning import unpack_reasoning
+
+# -------------------- RETENTION --------------------
+#
+# Deletes whole conversations picked by age, owner or session id. Deletion
+# happens in chunks of at most CHUNK_ROWS messages. Each chunk is its own short
+# BEGIN IMMEDIATE transaction, with a pause after it, so the app's writers
+# never queue behind one long lock. Conversations can first be archived to a
+# gzip JSONL file, one line per conversation. Only messages that existed when
+# the run started are archived and deleted, so a chat that continues during
+# the run keeps its new messages.
+#
+#   python retention.py --older-than 90 --archive archives/ --vacuum
+#   python retention.py --user alice@example.com --dry-run
+
+CHUNK_ROWS = 500
+CHUNK_PAUSE = 0.02
+VACUUM_PAGES = 1000
+
+SQL_SESSIONS_OLDER_THAN = ("SELECT session_id FROM conversations GROUP BY session_id "
+                           "HAVING MAX(timestamp) < ?")
+SQL_USER_SESSIONS = ("SELECT t.session_id FROM conversation_titles t JOIN users u ON u.id = t.user_id "
+                     "WHERE u.email = ?")
+SQL_ALL_SESSIONS = "SELECT DISTINCT session_id FROM conversations"
+SQL_ARCHIVE_MESSAGES = ("SELECT c.id, c.role, c.content, c.timestamp, c.model_name, r.codec, r.body "
+                        "FROM conversations c LEFT JOIN message_reasoning r ON r.message_id = c.id "
+                        "WHERE c.session_id = ? AND c.id <= ? ORDER BY c.id")
+SQL_TITLE = "SELECT title, user_id, created_at FROM conversation_titles WHERE session_id = ?"
+SQL_SESSION_CHUNK_IDS = "SELECT id FROM conversations WHERE session_id = ? AND id <= ? LIMIT ?"
+SQL_DELETE_REASONING = "DELETE FROM message_reasoning WHERE message_id = ?"
+SQL_DELETE_MESSAGE = "DELETE FROM conversations WHERE id = ?"
+SQL_DELETE_EMPTY_TITLE = ("DELETE FROM conversation_titles WHERE session_id = ? AND NOT EXISTS "
+                          "(SELECT 1 FROM conversations c WHERE c.session_id = conversation_titles.session_id)")
+
+
+def select_sessions(conn, older_than=None, users=(), sessions=(), everything=False):
+    # Session ids matching every given policy
+    chosen = None
+
+    def narrow(ids):
+        nonlocal chosen
+        chosen = set(ids) if chosen is None else chosen & set(ids)
+
+    if older_than is not None:
+        cutoff = (datetime.now() - timedelta(days=older_than)).strftime("%Y-%m-%d %H:%M:%S")
+        narrow(row[0] for row in conn.execute(SQL_SESSIONS_OLDER_THAN, (cutoff,)))
+    if users:
+        narrow(row[0] for email in users for row in conn.execute(SQL_USER_SESSIONS, (email,)))
+    if sessions:
+        narrow(sessions)
+    if everything:
+        narrow(row[0] for row in conn.execute(SQL_ALL_SESSIONS))
+    return sorted(chosen or ())
+
+
+def archive_sessions(conn, session_ids, max_id, directory):
+    # One gzip JSONL file per run; returns (path, conversations written)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"conversations-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl.gz")
+    written = 0
+    with gzip.open(path, "wt", encoding="utf-8") as archive:
+        for session_id in session_ids:
+            messages = [{"id": i, "role": role, "content": content, "timestamp": timestamp, "model_name": model,
+                         "reasoning": unpack_reasoning(codec, body) if body is not None else ""}
+                        for i, role, content, timestamp, model, codec, body
+                        in conn.execute(SQL_ARCHIVE_MESSAGES, (session_id, max_id))]
+            title = conn.execute(SQL_TITLE, (session_id,)).fetchone() or (None, None, None)
+            archive.write(json.dumps({"session_id": session_id, "title": title[0], "user_id": title[1],
+                                      "created_at": title[2], "messages": messages}, ensure_ascii=False) + "\n")
+            written += 1
+    return path, written
+
+
+def delete_sessions(conn, session_ids, max_id, chunk_rows=CHUNK_ROWS, pause=CHUNK_PAUSE):
+    # Returns (messages deleted, longest write-lock hold in seconds)
+    deleted = 0
+    longest = 0.0
+    pending = list(reversed(session_ids))
+    while pending:
+        conn.execute("BEGIN IMMEDIATE")
+        # Timed from when the write lock is held, not from when it was requested
+        started = time.perf_counter()
+        try:
+            # Fill the chunk from as many sessions as it takes, each through idx_conversations_session
+            ids = []
+            finished = []
+            while pending and len(ids) < chunk_rows:
+                wanted = chunk_rows - len(ids)
+                rows = conn.execute(SQL_SESSION_CHUNK_IDS, (pending[-1], max_id, wanted)).fetchall()
+                ids.extend(rows)
+                if len(rows) < wanted:
+                    finished.append((pending.pop(),))
+            storage.unindex_reasoning(conn, ids)
+            conn.executemany(SQL_DELETE_REASONING, ids)
+            conn.executemany(SQL_DELETE_MESSAGE, ids)
+            conn.executemany(SQL_DELETE_EMPTY_TITLE, finished)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        longest = max(longest, time.perf_counter() - started)
+        deleted += len(ids)
+        time.sleep(pause)
+    return deleted, longest
+
+
+def incremental_vacuum(conn, pages=VACUUM_PAGES, pause=CHUNK_PAUSE):
+    # Returns freed pages, or None when the database was not created with auto_vacuum=INCREMENTAL
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return None
+    start = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    while True:
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free:
+            return start
+        # executescript steps the pragma to completion; execute() would free a single page
+        conn.executescript(f"PRAGMA incremental_vacuum({pages})")
+        if conn.execute("PRAGMA freelist_count").fetchone()[0] >= free:
+            return start - free
+        time.sleep(pause)
+
+
+def enable_incremental_vacuum(conn):
+    # Switching modes rewrites the whole file once, holding the lock for the duration
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive and delete old conversations in small chunks")
+    parser.add_argument("--db", default=None, help="database file (default: chat_history.db)")
+    parser.add_argument("--older-than", type=float, metavar="DAYS",
+                        help="conversations whose last message is older than this")
+    parser.add_argument("--user", action="append", default=[], metavar="EMAIL", help="conversations owned by a user")
+    parser.add_argument("--session", action="append", default=[], metavar="ID", help="a conversation by session id")
+    parser.add_argument("--all", action="store_true", help="every conversation")
+    parser.add_argument("--archive", metavar="DIR", help="write deleted conversations to DIR as gzip JSONL first")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="messages deleted per transaction")
+    parser.add_argument("--pause", type=float, default=CHUNK_PAUSE, help="seconds to yield between chunks")
+    parser.add_argument("--vacuum", action="store_true", help="return freed pages to the OS afterwards")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="switch the database to auto_vacuum=INCREMENTAL (one full VACUUM)")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+    args = parser.parse_args()
+    if not (args.older_than is not None or args.user or args.session or args.all):
+        parser.error("choose at least one of --older-than, --user, --session or --all")
+
+    migrate(args.db)
+    conn = storage.get_connection(args.db)
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM conversations").fetchone()[0]
+    session_ids = select_sessions(conn, args.older_than, args.user, args.session, args.all)
+    print(f"🗂️ {len(session_ids)} conversations selected")
+    if args.dry_run:
+        return
+
+    if args.archive and session_ids:
+        path, written = archive_sessions(conn, session_ids, max_id, args.archive)
+        print(f"📦 Archived {written} conversations to {path} ({os.path.getsize(path):,} bytes)")
+
+    if session_ids:
+        start = time.perf_counter()
+        deleted, longest = delete_sessions(conn, session_ids, max_id, args.chunk_rows, args.pause)
+        elapsed = time.perf_counter() - start
+        print(f"✅ Deleted {deleted} messages in {elapsed:.1f}s "
+              f"({deleted / elapsed if elapsed else 0:.0f} rows/s, longest lock {longest * 1000:.1f} ms)")
+
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum(conn)
+        print("✅ auto_vacuum is now INCREMENTAL")
+    elif args.vacuum:
+        freed = incremental_vacuum(conn)
+        if freed is None:
+            print("ℹ️ auto_vacuum is not INCREMENTAL; rerun once with --enable-incremental-vacuum")
+        else:
+            print(f"✅ Returned {freed} pages to the OS")
+
+
+if __name__ == "__main__":
+    main()
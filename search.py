@@ -0,0 +1,114 @@
+import argparse
+import string
+
+import storage
+
+REBUILD_BATCH_ROWS = 1000
+SNIPPET_TOKENS = 12
+
+# -------------------- MESSAGE SEARCH --------------------
+#
+# conversations_fts (migration 7) is an external-content FTS5 index over
+# conversations.content, kept in sync by triggers. reasoning_fts (migration 12)
+# indexes the reasoning stored apart from final answers. It is contentless,
+# since that reasoning is compressed, so its snippets are cut here in Python.
+# Queries search both, are scoped to the conversations a user owns and are
+# ranked by bm25.
+
+SQL_SEARCH_MESSAGES = """
+    SELECT session_id, title, role, snippet, reasoning_id FROM (
+        SELECT c.session_id, t.title, c.role, conversations_fts.rank AS rank,
+               snippet(conversations_fts, 0, '**', '**', '…', 12) AS snippet, NULL AS reasoning_id
+        FROM conversations_fts
+        JOIN conversations c ON c.id = conversations_fts.rowid
+        JOIN conversation_titles t ON t.session_id = c.session_id
+        WHERE conversations_fts MATCH ?1 AND t.user_id = ?2
+        UNION ALL
+        SELECT c.session_id, t.title, c.role, reasoning_fts.rank AS rank,
+               NULL AS snippet, c.id AS reasoning_id
+        FROM reasoning_fts
+        JOIN conversations c ON c.id = reasoning_fts.rowid
+        JOIN conversation_titles t ON t.session_id = c.session_id
+        WHERE reasoning_fts MATCH ?1 AND t.user_id = ?2
+    )
+    ORDER BY rank
+    LIMIT ?3
+"""
+
+
+def fts_query(text):
+    # Every word must match, the last one as a prefix; quoting keeps FTS5 syntax characters literal
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    if not terms:
+        return None
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def reasoning_snippet(reasoning, text, tokens=SNIPPET_TOKENS):
+    # Up to `tokens` words around the first word matching `text`, marked like FTS5 snippet()
+    words = reasoning.split()
+    terms = [term.lower() for term in text.split()]
+
+    def matches(word):
+        word = word.strip(string.punctuation).lower()
+        return any(word == term for term in terms[:-1]) or word.startswith(terms[-1])
+
+    hit = next((i for i, word in enumerate(words) if matches(word)), 0)
+    start = max(0, min(hit - tokens // 2, len(words) - tokens))
+    shown = [f"**{word}**" if matches(word) else word for word in words[start:start + tokens]]
+    return ("…" if start else "") + " ".join(shown) + ("…" if start + tokens < len(words) else "")
+
+
+def search_messages(text, user_id, limit=10):
+    # [(session_id, title, role, snippet)], best match first
+    match = fts_query(text)
+    if match is None:
+        return []
+    return [(session_id, title, role,
+             snippet if reasoning_id is None else reasoning_snippet(storage.get_reasoning(reasoning_id), text))
+            for session_id, title, role, snippet, reasoning_id
+            in storage.query(SQL_SEARCH_MESSAGES, (match, user_id, limit))]
+
+
+def rebuild_search_index(db_path=None):
+    # Full rebuild from the conversations and message_reasoning tables, e.g. after restoring an old chat_history.db
+    with storage.transaction(db_path) as conn:
+        conn.execute("INSERT INTO conversations_fts (conversations_fts) VALUES ('rebuild')")
+        conn.execute("UPDATE search_index_state SET last_indexed = target")
+        conn.execute("INSERT INTO reasoning_fts (reasoning_fts) VALUES ('delete-all')")
+        last = 0
+        while True:
+            upto = conn.execute("SELECT MAX(message_id) FROM (SELECT message_id FROM message_reasoning "
+                                "WHERE message_id > ? ORDER BY message_id LIMIT ?)",
+                                (last, REBUILD_BATCH_ROWS)).fetchone()[0]
+            if upto is None:
+                break
+            storage.index_reasoning(conn, last, upto)
+            last = upto
+        conn.execute("UPDATE reasoning_index_state SET last_indexed = target")
+    with storage.transaction(db_path) as conn:
+        conn.execute("INSERT INTO conversations_fts (conversations_fts) VALUES ('optimize')")
+        conn.execute("INSERT INTO reasoning_fts (reasoning_fts) VALUES ('optimize')")
+
+
+if __name__ == "__main__":
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Backfill, rebuild or query the chat history search index")
+    parser.add_argument("--db", default=None, help="database file (default: chat_history.db)")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the whole index from conversations")
+    parser.add_argument("--user-id", type=int, help="search this user's conversations")
+    parser.add_argument("query", nargs="?", help="text to search for")
+    args = parser.parse_args()
+
+    # Applying migrations 7 and 12 creates the indexes and backfills existing messages
+    migrate(args.db, verbose=True)
+    if args.rebuild:
+        rebuild_search_index(args.db)
+        print("✅ Search index rebuilt.")
+    if args.query:
+        if args.db:
+            storage.DB_PATH = args.db
+        for session_id, title, role, snippet in search_messages(args.query, args.user_id):
+            print(f"{session_id[:8]}  {title}  [{role}] {snippet}")
@@ -0,0 +1,140 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import storage
+
+# -------------------- LOGIN SESSIONS --------------------
+#
+# A login issues a token "<token id>.<expiry>.<signature>" signed with HMAC-SHA256.
+# The browser keeps it in the ?session= query parameter, and the user_sessions
+# table records which tokens are live. A reconnecting browser is restored by
+# checking the signature and expiry in memory and then looking the token id up
+# in an LRU of recently validated sessions. An LRU entry is trusted for
+# RECHECK_INTERVAL seconds; after that the next restore reads the row again. A
+# revocation is written to the table straight away and dropped from this
+# process's LRU, so it holds at once here and across restarts, and within
+# RECHECK_INTERVAL in other worker processes. Only the sweep that deletes
+# expired and revoked rows is batched, at most once per SWEEP_INTERVAL.
+
+SESSION_TTL = 7 * 24 * 60 * 60
+VALIDATED_CACHE_SIZE = 4096
+RECHECK_INTERVAL = 30
+SWEEP_INTERVAL = 30
+SWEEP_BATCH_SIZE = 1000
+
+SQL_INSERT_SESSION = ("INSERT INTO user_sessions (token_id, user_id, email, created_at, expires_at) "
+                      "VALUES (?, ?, ?, ?, ?)")
+SQL_LOOKUP_SESSION = ("SELECT s.user_id, s.email, u.first_name FROM user_sessions s "
+                      "JOIN users u ON u.id = s.user_id "
+                      "WHERE s.token_id = ? AND s.revoked = 0 AND s.expires_at > ?")
+SQL_REVOKE_SESSION = "UPDATE user_sessions SET revoked = 1 WHERE token_id = ?"
+SQL_SWEEP_SESSIONS = ("DELETE FROM user_sessions WHERE token_id IN "
+                      "(SELECT token_id FROM user_sessions WHERE expires_at < ? OR revoked = 1 LIMIT ?)")
+
+_validated = OrderedDict()  # token_id -> (user_id, email, first_name, expires_at, time.monotonic() when read)
+_lock = threading.Lock()
+_last_sweep = time.monotonic()
+_secret = None
+
+
+def _signing_key():
+    global _secret
+    if _secret is None:
+        configured = os.getenv("COT_SESSION_SECRET")
+        if configured:
+            _secret = configured.encode()
+        else:
+            _secret = storage.query_one("SELECT value FROM app_settings WHERE key = 'session_secret'")[0].encode()
+    return _secret
+
+
+def _sign(token_id, expires_at):
+    mac = hmac.new(_signing_key(), f"{token_id}.{expires_at}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(mac).decode().rstrip("=")
+
+
+def _parse(token):
+    # Returns (token_id, expires_at) for a well-signed, unexpired token, else None
+    try:
+        token_id, expires_at, signature = token.split(".")
+        expires_at = int(expires_at)
+    except (AttributeError, ValueError):
+        return None
+    if not hmac.compare_digest(signature, _sign(token_id, expires_at)) or expires_at < time.time():
+        return None
+    return token_id, expires_at
+
+
+def create_session(user_id, email, first_name=""):
+    token_id = uuid.uuid4().hex
+    now = time.time()
+    expires_at = int(now + SESSION_TTL)
+    with storage.transaction() as conn:
+        conn.execute(SQL_INSERT_SESSION, (token_id, user_id, email, now, expires_at))
+    with _lock:
+        _remember(token_id, (user_id, email, first_name, expires_at, time.monotonic()))
+    sweep_sessions()
+    return f"{token_id}.{expires_at}.{_sign(token_id, expires_at)}"
+
+
+def _remember(token_id, session):
+    _validated[token_id] = session
+    _validated.move_to_end(token_id)
+    while len(_validated) > VALIDATED_CACHE_SIZE:
+        _validated.popitem(last=False)
+
+
+def validate_session(token):
+    # (user_id, email, first_name) for a live token, else None
+    parsed = _parse(token)
+    if parsed is None:
+        return None
+    token_id, expires_at = parsed
+    with _lock:
+        session = _validated.get(token_id)
+        if session is not None and time.monotonic() - session[4] < RECHECK_INTERVAL:
+            _validated.move_to_end(token_id)
+            return session[:3]
+
+    # Not seen yet, or seen long enough ago that another process may have revoked it
+    row = storage.query_one(SQL_LOOKUP_SESSION, (token_id, time.time()))
+    if row is None:
+        with _lock:
+            _validated.pop(token_id, None)
+        return None
+    with _lock:
+        _remember(token_id, (row[0], row[1], row[2], expires_at, time.monotonic()))
+    return row[0], row[1], row[2]
+
+
+def revoke_session(token):
+    parsed = _parse(token)
+    if parsed is None:
+        return
+    # Committed before the LRU entry goes, so a concurrent restore cannot re-read the live row
+    with storage.transaction() as conn:
+        conn.execute(SQL_REVOKE_SESSION, (parsed[0],))
+    with _lock:
+        _validated.pop(parsed[0], None)
+    sweep_sessions()
+
+
+def sweep_sessions(force=False):
+    # Deletes a batch of expired/revoked rows and prunes expired LRU entries, at most every SWEEP_INTERVAL
+    global _last_sweep
+    with _lock:
+        if not force and time.monotonic() - _last_sweep < SWEEP_INTERVAL:
+            return
+        _last_sweep = time.monotonic()
+        now = time.time()
+        for token_id in [t for t, s in _validated.items() if s[3] < now]:
+            del _validated[token_id]
+
+    with storage.transaction() as conn:
+        conn.execute(SQL_SWEEP_SESSIONS, (time.time(), SWEEP_BATCH_SIZE))
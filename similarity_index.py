@@ -0,0 +1,252 @@
+import os
+import random
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import metrics
+import storage
+
+# -------------------- NEAR-DUPLICATE PROMPT INDEX --------------------
+#
+# Lets the response cache answer paraphrases of a question it has already
+# answered. A normalized prompt loses its articles and filler ("please",
+# "show your work") and is reduced to its words and word pairs, and a
+# NUM_PERM-value MinHash signature is taken over them. Character shingles
+# were tried first; they let "coffee next to a dog" match "coffee next to
+# sun", because one short word barely changes a long prompt's shingles. The share of equal values estimates
+# the Jaccard similarity of two prompts. Only prompts with the same match key
+# are compared: the same numbers and operators, so "What is 23 * 17?" never
+# reuses the answer to "What is 23 * 18?" or "What is 23 + 17?", and the same
+# negation and tense words, so "not a mammal" never reuses "a mammal" and
+# "who was" never reuses "who is". Other one-word opposites ("oldest" and
+# "youngest") are left to the threshold; bench_similarity measures them.
+# Signatures live in chat_history.db
+# (response_similarity, migration 11), next to the cached answers, and
+# rows leave when their answer is evicted from response_cache. Each model also
+# keeps at most SIMILARITY_MAX_ENTRIES signatures, oldest dropped first. Each
+# process loads a model's signatures into memory on first use. NumPy, when
+# installed, is imported on the first lookup and computes signatures and
+# scores candidates as one matrix; the pure-Python fallback gives the same
+# signatures and scores. A near hit still serves an answer to a question that
+# was not asked, so the lookup is off unless COT_SIMILARITY_CACHE=1. While it
+# is off, answers are cached without signatures and only exact repeats hit.
+
+ENABLED = os.getenv("COT_SIMILARITY_CACHE", "0") == "1"
+SIMILARITY_THRESHOLD = float(os.getenv("COT_SIMILARITY_THRESHOLD", "0.9"))
+SIMILARITY_MAX_ENTRIES = 2000   # per model
+
+NUM_PERM = 64
+
+# Fixed hash functions (a * x + b) mod p, so stored signatures stay valid across processes
+_PRIME = (1 << 31) - 1
+_rng = random.Random(298)
+_A = [_rng.randrange(1, _PRIME) for _ in range(NUM_PERM)]
+_B = [_rng.randrange(0, _PRIME) for _ in range(NUM_PERM)]
+_numpy = None   # (numpy, a, b, prime) once get_numpy() has run; numpy is None when not installed
+
+# Numbers and arithmetic operators, spelled or symbolic, in order of appearance
+_MATH_TOKEN = re.compile(r"\d+(?:[.,]\d+)*|[+*/×÷^=<>%]|(?<![^\W\d_])-(?![^\W\d_])|\b(?:plus|minus|times|"
+                         r"multiplied|divided|over|squared|cubed|percent|sum|difference|product|quotient)\b")
+_OPERATOR_WORDS = {"plus": "+", "sum": "+", "minus": "-", "difference": "-", "times": "*", "multiplied": "*",
+                   "product": "*", "×": "*", "divided": "/", "over": "/", "quotient": "/", "÷": "/",
+                   "percent": "%"}
+_TOKEN = re.compile(r"[^\W_]+|[+\-*/×÷^=<>%]")
+_NOT = re.compile(r"n['’]t\b")
+# Words that do not change what is asked, dropped before shingling
+_STOPWORDS = {"a", "an", "the", "is", "are", "be", "do", "does", "what", "whats", "s", "please", "thanks", "thank",
+              "hey", "q", "quick", "question", "answer", "explain", "show", "your", "work", "think", "step", "by",
+              "you", "me", "tell", "can", "could"}
+# Words that negate a question or move it in time; they are part of the match key
+_MARKERS = {"not", "no", "never", "nor", "none", "nothing", "without", "was", "were", "did", "had", "will",
+            "would", "wo"}
+
+LOOKUP = metrics.histogram("cot_similarity_lookup_seconds", "Near-duplicate prompt lookups, signature included",
+                           buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05))
+
+SQL_SIMILARITY_LOAD = ("SELECT prompt_hash, match_key, signature FROM response_similarity "
+                       "WHERE model_name = ? ORDER BY rowid")
+SQL_SIMILARITY_STORE = ("INSERT OR REPLACE INTO response_similarity (model_name, prompt_hash, match_key, signature) "
+                        "VALUES (?, ?, ?, ?)")
+SQL_SIMILARITY_EVICT = ("DELETE FROM response_similarity WHERE rowid IN "
+                        "(SELECT rowid FROM response_similarity WHERE model_name = ?1 ORDER BY rowid LIMIT "
+                        "max(0, (SELECT COUNT(*) FROM response_similarity WHERE model_name = ?1) - ?2))")
+
+
+def math_key(text):
+    # "what is 23 plus 17" and "23 + 17 = ?" share the key "23 + 17"; "23 * 17" does not
+    return " ".join(_OPERATOR_WORDS.get(token, token) for token in _MATH_TOKEN.findall(text)
+                    if token != "=")
+
+
+def _tokens(text):
+    # Words and operators, "isn't" read as "is not" and spelled-out operators as symbols
+    return [_OPERATOR_WORDS.get(token, token) for token in _TOKEN.findall(_NOT.sub(" not", text))]
+
+
+def match_key(text):
+    # "who wasn't the oldest" -> "|was not"; only prompts with equal keys are compared
+    return f"{math_key(text)}|{' '.join(token for token in _tokens(text) if token in _MARKERS)}"
+
+
+def get_numpy():
+    # Imports NumPy on first use rather than with the app; None when it is not installed
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy as np
+        except ImportError:
+            _numpy = (None, None, None, None)
+        else:
+            _numpy = (np, np.array(_A, dtype=np.uint64)[:, None], np.array(_B, dtype=np.uint64)[:, None],
+                      np.uint64(_PRIME))
+    return _numpy[0]
+
+
+def shingles(text):
+    # Words and word pairs; punctuation, spacing, stopwords and spelled-out operators do not change them
+    words = [token for token in _tokens(text) if token not in _STOPWORDS]
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])} or {""}
+
+
+def signature(text):
+    # NUM_PERM little-endian uint32 values as bytes, from normalize_prompt() output
+    hashes = [zlib.crc32(s.encode()) % _PRIME for s in shingles(text)]
+    if get_numpy() is not None:
+        np, a, b, prime = _numpy
+        x = np.array(hashes, dtype=np.uint64)[None, :]
+        return ((a * x + b) % prime).min(axis=1).astype("<u4").tobytes()
+    values = [min((a * x + b) % _PRIME for x in hashes) for a, b in zip(_A, _B)]
+    return b"".join(v.to_bytes(4, "little") for v in values)
+
+
+class _Group:
+    # Signatures of one model's prompts with the same match key. With NumPy they are
+    # compared as one matrix; without it, an inverted index from (position, value)
+    # to prompts means only prompts sharing at least one value are ever scored.
+
+    __slots__ = ("signatures", "_matrix", "_keys", "_postings")
+
+    def __init__(self):
+        self.signatures = {}    # prompt hash -> signature
+        self._matrix = None
+        self._keys = None
+        self._postings = None if get_numpy() is not None else [{} for _ in range(NUM_PERM)]
+
+    def put(self, key, sig):
+        self.signatures[key] = sig
+        if self._postings is None:
+            self._matrix = None
+        else:
+            for position, value in enumerate(memoryview(sig).cast("I")):
+                self._postings[position].setdefault(value, set()).add(key)
+
+    def remove(self, key):
+        sig = self.signatures.pop(key)
+        if self._postings is None:
+            self._matrix = None
+        else:
+            for position, value in enumerate(memoryview(sig).cast("I")):
+                keys = self._postings[position][value]
+                keys.discard(key)
+                if not keys:
+                    del self._postings[position][value]
+
+    def best(self, sig):
+        # (similarity, key) of the closest signature
+        if self._postings is None:
+            np = get_numpy()
+            if self._matrix is None:
+                self._keys = list(self.signatures)
+                self._matrix = np.frombuffer(b"".join(self.signatures.values()), dtype="<u4").reshape(-1, NUM_PERM)
+            scores = (self._matrix == np.frombuffer(sig, dtype="<u4")).sum(axis=1)
+            index = int(scores.argmax())
+            return int(scores[index]) / NUM_PERM, self._keys[index]
+        scores = {}
+        for position, value in enumerate(memoryview(sig).cast("I")):
+            for key in self._postings[position].get(value, ()):
+                scores[key] = scores.get(key, 0) + 1
+        if not scores:
+            return 0.0, None
+        key = max(scores, key=scores.get)
+        return scores[key] / NUM_PERM, key
+
+
+class ModelIndex:
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or SIMILARITY_MAX_ENTRIES
+        self.groups = {}                # match key -> _Group
+        self.entries = OrderedDict()    # prompt hash -> match key, oldest first like the table's rowids
+        self.lock = threading.Lock()
+
+    def put(self, key, match, sig):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = match
+            self.groups.setdefault(match, _Group()).put(key, sig)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        match = self.entries.pop(key, None)
+        group = self.groups.get(match)
+        if group is not None:
+            group.remove(key)
+            if not group.signatures:
+                del self.groups[match]
+
+    def find(self, match, sig, threshold):
+        with self.lock:
+            group = self.groups.get(match)
+            if group is None:
+                return None
+            similarity, key = group.best(sig)
+        return key if similarity >= threshold else None
+
+    def __len__(self):
+        return len(self.entries)
+
+
+_indexes = {}   # (database file, model name) -> ModelIndex
+_indexes_lock = threading.Lock()
+
+
+def get_index(model_name, db_path=None):
+    db_path = db_path or storage.DB_PATH
+    with _indexes_lock:
+        index = _indexes.get((db_path, model_name))
+        if index is not None:
+            return index
+    index = ModelIndex()
+    for key, match, sig in storage.query(SQL_SIMILARITY_LOAD, (model_name,), db_path):
+        if len(sig) == NUM_PERM * 4:
+            index.put(key, match, sig)
+    with _indexes_lock:
+        return _indexes.setdefault((db_path, model_name), index)
+
+
+def find_similar(model_name, text, threshold=None, db_path=None):
+    # prompt_hash of the closest indexed prompt at or above the threshold, else None
+    with LOOKUP.time():
+        index = get_index(model_name, db_path)
+        return index.find(match_key(text), signature(text),
+                          SIMILARITY_THRESHOLD if threshold is None else threshold)
+
+
+def index_prompt(conn, model_name, key, text, db_path=None):
+    # Called inside the transaction that stores the answer
+    match, sig = match_key(text), signature(text)
+    conn.execute(SQL_SIMILARITY_STORE, (model_name, key, match, sig))
+    conn.execute(SQL_SIMILARITY_EVICT, (model_name, SIMILARITY_MAX_ENTRIES))
+    get_index(model_name, db_path).put(key, match, sig)
+
+
+def forget(model_name, key, db_path=None):
+    # Drops an entry whose cached answer has expired or been evicted
+    get_index(model_name, db_path).remove(key)
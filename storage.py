@@ -0,0 +1,518 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime
+
+import metrics
+from reasoning import count_steps, pack_reasoning, unpack_reasoning
+
+# -------------------- CONNECTION POOL --------------------
+
+DB_PATH = os.getenv("COT_DB_PATH", "chat_history.db")
+
+# Applied once to every pooled connection. WAL lets readers run alongside the
+# single writer, NORMAL sync is durable across app crashes in WAL mode, and the
+# busy timeout turns short lock waits into retries instead of "database is locked".
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+)
+
+STATEMENT_CACHE_SIZE = 128
+
+# Idle connections kept per database file for threads that have not opened one yet.
+# Streamlit runs every rerun on a new script thread: when a thread ends, its
+# connections are checked back in here instead of leaking, and the next thread
+# reuses one without reconnecting or re-running the PRAGMAs. Any beyond
+# POOL_SIZE are closed.
+POOL_SIZE = 8
+
+DB_CONNECT = metrics.histogram("cot_db_connect_seconds", "Opening a pooled SQLite connection")
+DB_QUERY = metrics.histogram("cot_db_query_seconds", "query() and query_one() calls")
+DB_TRANSACTION = metrics.histogram("cot_db_transaction_seconds", "transaction() blocks including the commit")
+
+_local = threading.local()
+_pool_lock = threading.RLock()
+_pool = set()       # every open pooled connection, checked out or idle
+_idle = {}          # database file -> connections no thread holds
+
+
+class _ThreadConnections:
+    # Referenced only from the owning thread's local storage, so it is freed when the thread ends
+    def __init__(self):
+        self.by_path = {}
+        weakref.finalize(self, _check_in, self.by_path)
+
+
+def _open_connection(db_path):
+    with DB_CONNECT.time():
+        # Connections move between threads through the idle list, one thread at a time
+        conn = sqlite3.connect(db_path, timeout=5.0, cached_statements=STATEMENT_CACHE_SIZE,
+                               check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+    return conn
+
+
+def _check_in(connections):
+    with _pool_lock:
+        for db_path, conn in connections.items():
+            if conn not in _pool:
+                continue        # already closed by close_all_connections()
+            idle = _idle.setdefault(db_path, [])
+            if len(idle) < POOL_SIZE and not conn.in_transaction:
+                idle.append(conn)
+            else:
+                _pool.discard(conn)
+                conn.close()
+    connections.clear()
+
+
+def get_connection(db_path=None):
+    # One connection per (thread, database file), held for the life of the thread
+    db_path = db_path or DB_PATH
+    holder = getattr(_local, "connections", None)
+    if holder is None:
+        holder = _local.connections = _ThreadConnections()
+    conn = holder.by_path.get(db_path)
+    if conn is None:
+        with _pool_lock:
+            idle = _idle.get(db_path)
+            conn = idle.pop() if idle else None
+        if conn is None:
+            conn = _open_connection(db_path)
+            with _pool_lock:
+                _pool.add(conn)
+        holder.by_path[db_path] = conn
+    return conn
+
+
+@contextmanager
+def transaction(db_path=None):
+    # Commits on success, rolls back on error; the connection stays in the pool
+    conn = get_connection(db_path)
+    with DB_TRANSACTION.time(), conn:
+        yield conn
+
+
+def query(sql, params=(), db_path=None):
+    conn = get_connection(db_path)
+    with DB_QUERY.time():
+        return conn.execute(sql, params).fetchall()
+
+
+def query_one(sql, params=(), db_path=None):
+    conn = get_connection(db_path)
+    with DB_QUERY.time():
+        return conn.execute(sql, params).fetchone()
+
+
+def close_thread_connections():
+    # Closes the calling thread's connections instead of returning them to the idle list
+    holder = getattr(_local, "connections", None)
+    if holder is None:
+        return
+    with _pool_lock:
+        for conn in holder.by_path.values():
+            _pool.discard(conn)
+            conn.close()
+    holder.by_path.clear()
+
+
+def close_all_connections():
+    # Only safe at shutdown: connections belonging to other threads are closed too
+    with _pool_lock:
+        for conn in _pool:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
+        _pool.clear()
+        _idle.clear()
+    _local.connections = None
+
+# -------------------- PREPARED STATEMENTS --------------------
+
+# Kept as constants so every call site hits the same entry in the statement cache
+SQL_INSERT_USER = "INSERT INTO users (email, password, first_name, last_name) VALUES (?, ?, ?, ?)"
+SQL_PASSWORD_HASH = "SELECT password FROM users WHERE email = ?"
+SQL_UPDATE_PASSWORD_HASH = "UPDATE users SET password = ? WHERE email = ?"
+SQL_USER_PROFILE = "SELECT id, first_name FROM users WHERE email = ?"
+SQL_INSERT_MESSAGE = ("INSERT INTO conversations (session_id, role, content, timestamp, model_name) "
+                      "VALUES (?, ?, ?, ?, ?)")
+SQL_CONVERSATION_HISTORY = "SELECT role, content, timestamp FROM conversations WHERE session_id = ? ORDER BY id"
+SQL_SESSION_IDS = "SELECT session_id FROM conversation_catalogue ORDER BY id"
+SQL_CATALOGUE = ("SELECT id, session_id, title, message_count, last_activity FROM conversation_catalogue "
+                 "WHERE id > ? ORDER BY id LIMIT ?")
+SQL_CATALOGUE_BY_ID = ("SELECT id, session_id, title, message_count, last_activity FROM conversation_catalogue "
+                       "WHERE id = ?")
+SQL_CATALOGUE_BY_SESSION = ("SELECT id, session_id, title, message_count, last_activity FROM conversation_catalogue "
+                            "WHERE session_id = ?")
+SQL_CONVERSATION_PAGE = ("SELECT c.id, c.role, c.content, c.timestamp, c.model_name, r.steps FROM conversations c "
+                         "LEFT JOIN message_reasoning r ON r.message_id = c.id "
+                         "WHERE c.session_id = ? AND c.id < ? ORDER BY c.id DESC LIMIT ?")
+SQL_INSERT_REASONING = "INSERT INTO message_reasoning (message_id, codec, steps, body) VALUES (?, ?, ?, ?)"
+SQL_REASONING = "SELECT codec, body FROM message_reasoning WHERE message_id = ?"
+SQL_REASONING_RANGE = ("SELECT message_id, codec, body FROM message_reasoning "
+                       "WHERE message_id > ? AND message_id <= ? ORDER BY message_id")
+SQL_INDEX_REASONING = "INSERT INTO reasoning_fts (rowid, reasoning) VALUES (?, ?)"
+SQL_INDEXED_REASONING = ("SELECT r.message_id, r.codec, r.body FROM message_reasoning r, reasoning_index_state s "
+                         "WHERE r.message_id = ? AND (r.message_id <= s.last_indexed OR r.message_id > s.target)")
+SQL_UNINDEX_REASONING = "INSERT INTO reasoning_fts (reasoning_fts, rowid, reasoning) VALUES ('delete', ?, ?)"
+SQL_INSERT_TITLE = ("INSERT OR IGNORE INTO conversation_titles (session_id, title, created_at, user_id) "
+                    "VALUES (?, ?, ?, ?)")
+SQL_CONVERSATIONS = "SELECT session_id, title FROM conversation_titles"
+SQL_USER_CONVERSATIONS = ("SELECT session_id, title FROM conversation_titles WHERE user_id = ? "
+                          "ORDER BY created_at DESC LIMIT ?")
+SQL_SEARCH_USER_CONVERSATIONS = ("SELECT session_id, title FROM conversation_titles "
+                                 "WHERE user_id = ? AND title LIKE ? ESCAPE '\\' "
+                                 "ORDER BY created_at DESC LIMIT ?")
+
+# -------------------- DATABASE SETUP --------------------
+
+# Databases already migrated by this process. Streamlit calls initialize_database()
+# on every rerun and COT_Interface before queries; after the first call per file
+# they only pay a set lookup. migrations.migrate() itself always runs.
+_initialized = set()
+_initialize_lock = threading.Lock()
+
+
+def initialize_database(db_path=None):
+    path = os.path.abspath(db_path or DB_PATH)
+    if path in _initialized:
+        return
+    # Schema lives in migrations.py; imported here because it builds on this module
+    from migrations import migrate
+    with _initialize_lock:
+        if path not in _initialized:
+            migrate(db_path)
+            _initialized.add(path)
+
+# -------------------- USER FUNCTIONS --------------------
+
+# Passwords arrive here already hashed; see auth.py
+
+def save_user(email, password_hash, first_name, last_name, db_path=None):
+    try:
+        with transaction(db_path) as conn:
+            conn.execute(SQL_INSERT_USER, (email, password_hash, first_name, last_name))
+        return True
+    except sqlite3.IntegrityError:
+        return False
+
+
+def get_password_hash(email, db_path=None):
+    result = query_one(SQL_PASSWORD_HASH, (email,), db_path)
+    return result[0] if result else None
+
+
+def update_password_hash(email, password_hash, db_path=None):
+    with transaction(db_path) as conn:
+        conn.execute(SQL_UPDATE_PASSWORD_HASH, (password_hash, email))
+
+
+def get_user_profile(email, db_path=None):
+    # (user_id, first_name) in one round trip; (None, "") for unknown emails
+    result = query_one(SQL_USER_PROFILE, (email,), db_path)
+    return (result[0], result[1]) if result else (None, "")
+
+# -------------------- CHAT FUNCTIONS --------------------
+
+def _insert_message(conn, session_id, role, content, model_name=None, reasoning=None):
+    cursor = conn.execute(SQL_INSERT_MESSAGE,
+                          (session_id, role, content, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), model_name))
+    if reasoning:
+        codec, body = pack_reasoning(reasoning)
+        conn.execute(SQL_INSERT_REASONING, (cursor.lastrowid, codec, count_steps(reasoning), body))
+        conn.execute(SQL_INDEX_REASONING, (cursor.lastrowid, reasoning))
+    return cursor.lastrowid
+
+
+def index_reasoning(conn, after_id, upto_id):
+    # Adds the reasoning of messages after_id < id <= upto_id to reasoning_fts; returns the rows indexed.
+    # Reasoning is stored compressed, so the search index is filled here rather than by a trigger.
+    rows = conn.execute(SQL_REASONING_RANGE, (after_id, upto_id)).fetchall()
+    conn.executemany(SQL_INDEX_REASONING, ((message_id, unpack_reasoning(codec, body))
+                                           for message_id, codec, body in rows))
+    return len(rows)
+
+
+def unindex_reasoning(conn, message_ids):
+    # Removes messages from reasoning_fts before their reasoning is deleted. The index is
+    # contentless, so each delete must repeat the indexed text; rows the migration 12
+    # backfill has not reached yet are skipped, as deleting them would corrupt the index.
+    rows = [row for (message_id,) in message_ids for row in conn.execute(SQL_INDEXED_REASONING, (message_id,))]
+    conn.executemany(SQL_UNINDEX_REASONING, ((message_id, unpack_reasoning(codec, body))
+                                             for message_id, codec, body in rows))
+
+
+def save_message(session_id, role, content, model_name=None, reasoning=None, db_path=None):
+    # `reasoning` is the text that came before `content` in the model's answer, see reasoning.split_reasoning
+    with transaction(db_path) as conn:
+        return _insert_message(conn, session_id, role, content, model_name, reasoning)
+
+
+def get_reasoning(message_id, db_path=None):
+    # The reasoning text stored for a bot message, "" if it has none
+    row = query_one(SQL_REASONING, (message_id,), db_path)
+    return unpack_reasoning(*row) if row else ""
+
+
+def get_conversation_history(session_id, db_path=None):
+    flush_writes(session_id)
+    history = query(SQL_CONVERSATION_HISTORY, (session_id,), db_path)
+    return [{"role": r, "content": c, "timestamp": t} for r, c, t in history]
+
+
+def get_session_ids(db_path=None):
+    # Every conversation's session id, oldest conversation first
+    return [row[0] for row in query(SQL_SESSION_IDS, db_path=db_path)]
+
+
+# conversation_catalogue (migration 10) has one row per conversation, kept current by triggers.
+# Entries are (catalogue_id, session_id, title, message_count, last_activity).
+
+def get_catalogue(after_id=0, limit=-1, db_path=None):
+    # Entries with a catalogue id above after_id, oldest first; pass the last id back to fetch only newer ones
+    return query(SQL_CATALOGUE, (after_id, limit), db_path)
+
+
+def get_catalogue_entry(catalogue_id=None, session_id=None, db_path=None):
+    if catalogue_id is not None:
+        return query_one(SQL_CATALOGUE_BY_ID, (catalogue_id,), db_path)
+    return query_one(SQL_CATALOGUE_BY_SESSION, (session_id,), db_path)
+
+
+# Larger than any rowid, used as the keyset cursor for the newest page
+NEWEST = 2 ** 63 - 1
+
+
+def get_conversation_page(session_id, before_id=None, limit=40, db_path=None):
+    # Keyset pagination: the newest `limit` messages older than `before_id`, oldest first.
+    # Returns (messages, cursor); pass cursor back as before_id for the next older page,
+    # it is None once the start of the conversation has been reached.
+    flush_writes(session_id)
+    rows = query(SQL_CONVERSATION_PAGE, (session_id, before_id or NEWEST, limit + 1), db_path)
+    has_more = len(rows) > limit
+    rows = rows[:limit][::-1]
+    # Never start a page on bot replies whose question sits on the previous page
+    if has_more:
+        while len(rows) > 1 and rows[0][1] == "bot":
+            rows = rows[1:]
+    cursor = rows[0][0] if has_more and rows else None
+    messages = [{"id": i, "role": r, "content": c, "timestamp": t, "model_name": m, "reasoning_steps": n or 0}
+                for i, r, c, t, m, n in rows]
+    return messages, cursor
+
+
+# Bumped whenever a user's conversation list changes so cached sidebar indexes know to refresh
+_title_versions = {}
+_title_versions_lock = threading.Lock()
+
+
+def conversation_index_version(user_id):
+    return _title_versions.get(user_id, 0)
+
+
+def _insert_title(conn, session_id, title, user_id=None):
+    conn.execute(SQL_INSERT_TITLE, (session_id, title, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), user_id))
+
+
+def _bump_title_version(user_id):
+    with _title_versions_lock:
+        _title_versions[user_id] = _title_versions.get(user_id, 0) + 1
+
+
+def save_conversation_title(session_id, title, user_id=None, db_path=None):
+    with transaction(db_path) as conn:
+        _insert_title(conn, session_id, title, user_id)
+    _bump_title_version(user_id)
+
+
+def get_conversations(db_path=None):
+    return query(SQL_CONVERSATIONS, db_path=db_path)
+
+
+def get_user_conversations(user_id, limit=20, search="", db_path=None):
+    # Most recent first, scoped to one user through idx_conversation_titles_user
+    if search:
+        pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return query(SQL_SEARCH_USER_CONVERSATIONS, (user_id, pattern, limit), db_path)
+    return query(SQL_USER_CONVERSATIONS, (user_id, limit), db_path)
+
+# -------------------- WRITE-BEHIND QUEUE --------------------
+#
+# Chat writes can be handed to one background writer instead of each paying
+# for its own transaction and fsync. The writer drains a bounded queue and
+# commits everything waiting in it (up to WRITE_BATCH_SIZE writes, from any
+# session) as one transaction, so writes that arrive during a slow commit share
+# the next one. WRITE_BATCH_WINDOW optionally lingers for more writes before
+# committing. A full queue blocks the caller, which is the backpressure. Each
+# write returns a PendingWrite whose result() is the new row id once committed.
+# get_conversation_page() first waits for the session's queued writes, so a
+# session always reads back its own messages. atexit drains the queue.
+
+WRITE_QUEUE_SIZE = 1000
+WRITE_BATCH_SIZE = 200
+WRITE_BATCH_WINDOW = 0.0
+
+WRITE_BATCH = metrics.histogram("cot_db_write_batch_size", "Writes committed together by the write-behind queue",
+                                buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+
+
+class PendingWrite:
+    def __init__(self, apply, session_id=None, db_path=None, after=None):
+        self.apply = apply          # apply(conn) -> value, run inside the batch transaction; None for a flush marker
+        self.after = after          # run once the batch has committed
+        self.session_id = session_id
+        self.db_path = db_path or DB_PATH
+        self.value = None
+        self.error = None
+        self._done = threading.Event()
+
+    def finish(self, value=None, error=None):
+        self.value, self.error = value, error
+        if error is None and self.after:
+            self.after()
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("Write not committed in time")
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class WriteBehind:
+    def __init__(self, queue_size=WRITE_QUEUE_SIZE, batch_size=WRITE_BATCH_SIZE, window=WRITE_BATCH_WINDOW):
+        self.batch_size = batch_size
+        self.window = window
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._last = {}         # session_id -> newest PendingWrite queued for it
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, write):
+        if write.session_id is not None:
+            with self._lock:
+                self._last[write.session_id] = write
+        self._queue.put(write)
+        return write
+
+    def flush(self, session_id=None, timeout=None):
+        # Waits for the session's queued writes, or for everything queued so far.
+        # Writes commit in queue order, so the last one finishing means all of them have.
+        if session_id is not None:
+            with self._lock:
+                last = self._last.get(session_id)
+        else:
+            last = PendingWrite(None)
+            self._queue.put(last)
+        if last is not None:
+            last._done.wait(timeout)
+
+    def stop(self, timeout=None):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    remaining = deadline - time.monotonic()
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is None
+            if stopping:
+                batch.pop()
+            by_path = {}
+            for write in batch:
+                if write.apply is not None:
+                    by_path.setdefault(write.db_path, []).append(write)
+            for db_path, writes in by_path.items():
+                WRITE_BATCH.observe(len(writes))
+                self._commit(db_path, writes)
+            # Flush markers touch no database; they finish once everything queued before them has
+            for write in batch:
+                if write.apply is None:
+                    write.finish()
+            with self._lock:
+                for write in batch:
+                    if self._last.get(write.session_id) is write:
+                        del self._last[write.session_id]
+            if stopping:
+                close_thread_connections()
+                return
+
+    def _commit(self, db_path, writes):
+        try:
+            with transaction(db_path) as conn:
+                values = [write.apply(conn) for write in writes]
+        except Exception:
+            # One bad write must not lose the rest of the batch: retry them one by one
+            for write in writes:
+                try:
+                    with transaction(db_path) as conn:
+                        value = write.apply(conn)
+                except Exception as e:
+                    write.finish(error=e)
+                else:
+                    write.finish(value)
+            return
+        for write, value in zip(writes, values):
+            write.finish(value)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = WriteBehind()
+            atexit.register(stop_writer)
+        return _writer
+
+
+def stop_writer():
+    # Commits everything still queued and stops the writer thread
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+
+
+def flush_writes(session_id=None, timeout=None):
+    if _writer is not None:
+        _writer.flush(session_id, timeout)
+
+
+def queue_message(session_id, role, content, model_name=None, reasoning=None, db_path=None):
+    # save_message through the write-behind queue; .result() is the message id
+    return get_writer().submit(PendingWrite(
+        lambda conn: _insert_message(conn, session_id, role, content, model_name, reasoning), session_id, db_path))
+
+
+def queue_conversation_title(session_id, title, user_id=None, db_path=None):
+    return get_writer().submit(PendingWrite(
+        lambda conn: _insert_title(conn, session_id, title, user_id), session_id, db_path,
+        after=lambda: _bump_title_version(user_id)))
@@ -0,0 +1,46 @@
+import pytest
+
+from reasoning import count_steps, pack_reasoning, split_reasoning, unpack_reasoning
+
+# split_reasoning must never lose or reorder text: reasoning + answer is the model's answer.
+
+TEXTS = [
+    # Several paragraphs, the answer in the last one
+    "First, note the train covers 120 km.\n\nThen divide by 2 hours.\n\n\nThe answer is 60 km/h.",
+    # A list, indented and blank lines included, then an "Answer:" line
+    "Steps:\n  1. 17 * 3 = 51\n  2. 51 + 4 = 55\n\n- checked twice\nAnswer: 55\n",
+    # Windows line endings and trailing whitespace
+    "Think it over.   \r\nFinal answer: blue\r\n",
+    # Two answer lines: the split is at the last one
+    "The answer is 3? No, recount.\nThe final answer is 4.",
+    # Nothing announces an answer
+    "Just a plain reply\nacross two lines.",
+    # The answer line comes first, so there is no reasoning before it
+    "Answer: yes\nbecause it rains.",
+    "",
+]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_split_is_lossless(text):
+    reasoning, answer = split_reasoning(text)
+    assert reasoning + answer == text
+
+
+def test_split_points():
+    assert split_reasoning(TEXTS[0]) == (TEXTS[0][:TEXTS[0].index("The answer")], "The answer is 60 km/h.")
+    assert split_reasoning(TEXTS[1])[1] == "Answer: 55\n"
+    assert split_reasoning(TEXTS[3])[1] == "The final answer is 4."
+    assert split_reasoning(TEXTS[4]) == ("", TEXTS[4])
+    assert split_reasoning(TEXTS[5]) == ("", TEXTS[5])
+    assert split_reasoning(None) == ("", "")
+
+
+def test_count_steps():
+    assert count_steps(split_reasoning(TEXTS[1])[0]) == 4
+    assert count_steps("") == 0
+
+
+@pytest.mark.parametrize("text", ["short", "Let's think.\n" * 50])
+def test_pack_round_trip(text):
+    assert unpack_reasoning(*pack_reasoning(text)) == text
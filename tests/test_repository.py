@@ -0,0 +1,148 @@
+import pytest
+
+import storage
+from repository import ChatRepository, MemoryRepository, SQLiteRepository
+
+# The ChatRepository contract, run against every backend: code written against
+# one must behave the same on the other.
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def repo(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryRepository()
+        return
+    repo = SQLiteRepository(str(tmp_path / "chat_history.db"))
+    repo.initialize()
+    yield repo
+    storage.flush_writes()
+    storage.close_all_connections()
+
+
+def chat(repo, session_id, turns, model_name="m"):
+    # Saves `turns` question/answer pairs and returns their ids in order
+    ids = []
+    for n in range(turns):
+        ids.append(repo.save_message(session_id, "user", f"question {n}"))
+        ids.append(repo.save_message(session_id, "bot", f"The answer is {n}.", model_name))
+    return ids
+
+
+def test_interface_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        ChatRepository()
+
+
+def test_users(repo):
+    assert repo.save_user("ada@example.com", "hash-1", "Ada", "Lovelace")
+    assert not repo.save_user("ada@example.com", "hash-2", "Other", "User")
+    assert repo.get_password_hash("ada@example.com") == "hash-1"
+    repo.update_password_hash("ada@example.com", "hash-3")
+    assert repo.get_password_hash("ada@example.com") == "hash-3"
+
+    user_id, first_name = repo.get_user_profile("ada@example.com")
+    assert isinstance(user_id, int) and first_name == "Ada"
+    assert repo.get_user_profile("nobody@example.com") == (None, "")
+    assert repo.get_password_hash("nobody@example.com") is None
+
+
+def test_message_ids_increase(repo):
+    ids = chat(repo, "s1", 3) + chat(repo, "s2", 1)
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+
+
+def test_conversation_history(repo):
+    chat(repo, "s1", 2)
+    chat(repo, "s2", 1)
+    history = repo.get_conversation_history("s1")
+    assert [(m["role"], m["content"]) for m in history] == [
+        ("user", "question 0"), ("bot", "The answer is 0."), ("user", "question 1"), ("bot", "The answer is 1.")]
+    assert all(set(m) == {"role", "content", "timestamp"} and m["timestamp"] for m in history)
+    assert repo.get_conversation_history("missing") == []
+
+
+def test_reasoning(repo):
+    reasoning = "Let's think.\n\n  1. indented step\n- a list item\n"
+    message_id = repo.save_message("s1", "bot", "The answer is 4.", "m", reasoning)
+    plain_id = repo.save_message("s1", "bot", "No reasoning here.", "m")
+    assert repo.get_reasoning(message_id) == reasoning
+    assert repo.get_reasoning(plain_id) == ""
+
+    messages, _ = repo.get_conversation_page("s1")
+    assert [m["reasoning_steps"] for m in messages] == [3, 0]
+
+
+def test_conversation_pages(repo):
+    ids = chat(repo, "s1", 5)
+    messages, cursor = repo.get_conversation_page("s1", limit=4)
+    assert [m["id"] for m in messages] == ids[-4:]
+    assert set(messages[0]) == {"id", "role", "content", "timestamp", "model_name", "reasoning_steps"}
+    assert messages[-1]["model_name"] == "m"
+    assert cursor == ids[-4]
+
+    messages, cursor = repo.get_conversation_page("s1", before_id=cursor, limit=4)
+    assert [m["id"] for m in messages] == ids[2:6]
+    messages, cursor = repo.get_conversation_page("s1", before_id=cursor, limit=4)
+    assert [m["id"] for m in messages] == ids[:2]
+    assert cursor is None
+
+
+def test_pages_never_start_with_orphaned_replies(repo):
+    ids = [repo.save_message("s1", "user", "compare this")]
+    ids += [repo.save_message("s1", "bot", f"answer {n}", f"model-{n}") for n in range(3)]
+    ids += chat(repo, "s1", 1)
+    # The newest 4 would start on two bot replies whose question is older
+    messages, cursor = repo.get_conversation_page("s1", limit=4)
+    assert messages[0]["role"] == "user"
+    assert [m["id"] for m in messages] == ids[-2:]
+    assert cursor == ids[-2]
+
+
+def test_titles(repo):
+    repo.save_user("ada@example.com", "hash", "Ada", "Lovelace")
+    user_id, _ = repo.get_user_profile("ada@example.com")
+    version = repo.conversation_index_version(user_id)
+
+    repo.save_conversation_title("s1", "Topic: apples", user_id)
+    repo.save_conversation_title("s2", "Topic: pears", user_id)
+    repo.save_conversation_title("s1", "Topic: renamed", user_id)
+    repo.save_conversation_title("s3", "Topic: someone else", None)
+    assert repo.conversation_index_version(user_id) != version
+
+    assert sorted(repo.get_conversations()) == [
+        ("s1", "Topic: apples"), ("s2", "Topic: pears"), ("s3", "Topic: someone else")]
+    assert repo.get_user_conversations(user_id) == [("s2", "Topic: pears"), ("s1", "Topic: apples")]
+    assert repo.get_user_conversations(user_id, limit=1) == [("s2", "Topic: pears")]
+    assert repo.get_user_conversations(user_id, search="APPLE") == [("s1", "Topic: apples")]
+    assert repo.get_user_conversations(user_id, search="%") == []
+
+
+def test_catalogue(repo):
+    repo.save_conversation_title("s1", "Topic: first", 1)
+    chat(repo, "s1", 2)
+    chat(repo, "s2", 1)
+    repo.save_conversation_title("s2", "Topic: second", 1)
+
+    entries = repo.get_catalogue()
+    assert [(e[1], e[2], e[3]) for e in entries] == [("s1", "Topic: first", 4), ("s2", "Topic: second", 2)]
+    assert all(e[4] for e in entries)
+    assert repo.get_session_ids() == ["s1", "s2"]
+
+    first_id = entries[0][0]
+    assert repo.get_catalogue(after_id=first_id) == entries[1:]
+    assert repo.get_catalogue(limit=1) == entries[:1]
+    assert repo.get_catalogue_entry(catalogue_id=first_id) == entries[0]
+    assert repo.get_catalogue_entry(session_id="s2") == entries[1]
+    assert repo.get_catalogue_entry(session_id="missing") is None
+
+    chat(repo, "s1", 1)
+    assert repo.get_catalogue_entry(session_id="s1")[3] == 6
+
+
+def test_queued_writes(repo):
+    write = repo.queue_message("s1", "user", "queued question")
+    message_id = write.result(timeout=5)
+    repo.queue_conversation_title("s1", "Topic: queued", 7).result(timeout=5)
+    messages, _ = repo.get_conversation_page("s1")
+    assert [(m["id"], m["content"]) for m in messages] == [(message_id, "queued question")]
+    assert repo.get_user_conversations(7) == [("s1", "Topic: queued")]
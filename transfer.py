@@ -0,0 +1,241 @@
+import argparse
+import gzip
+import json
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import storage
+from migrations import count_catalogue_range, current_version, index_search_range, migrate
+from reasoning import count_steps, pack_reasoning, unpack_reasoning
+
+# -------------------- JSONL EXPORT / IMPORT --------------------
+#
+# Moves users, conversation titles and messages between chat_history.db files,
+# or out to training pipelines, as JSON Lines. The first line is a header. It is
+# followed by every user, then every title, then every message in id order, one
+# object per line with a "type" field. Messages carry their reasoning text.
+# Users carry their stored password hash (see auth.py), so imported accounts
+# log in with the same password; treat export files as credentials. Both directions stream through
+# generators in batches of BATCH_ROWS, so memory stays flat whatever the size.
+# ".gz" paths are gzip-compressed at a fast level that keeps up with the disk.
+#
+# An import writes each batch in one BEGIN IMMEDIATE transaction with
+# executemany. Per-row search and catalogue triggers are dropped for the batch
+# and replaced by one set-based catch-up over its ids, then recreated before
+# commit, so no other connection ever sees them missing. In the same
+# transaction it also records how far into the file it got,
+# keyed by the export id from the header. An interrupted import therefore
+# resumes where it stopped, and importing the same file twice adds nothing.
+# Messages get new ids in the target, and user ids are remapped by email.
+#
+#   python transfer.py export backup.jsonl.gz
+#   python transfer.py import backup.jsonl.gz --db other.db
+
+FORMAT_VERSION = 1
+BATCH_ROWS = 5000
+# Fired once per inserted message; an import batch catches up with index_search_range and count_catalogue_range
+BULK_TRIGGERS = ("conversations_fts_insert", "conversation_catalogue_insert")
+GZIP_LEVEL = 1
+
+SQL_EXPORT_USERS = "SELECT id, email, password, first_name, last_name FROM users WHERE id > ? ORDER BY id LIMIT ?"
+SQL_EXPORT_TITLES = ("SELECT rowid, session_id, title, user_id, created_at FROM conversation_titles "
+                     "WHERE rowid > ? ORDER BY rowid LIMIT ?")
+SQL_EXPORT_MESSAGES = ("SELECT c.id, c.session_id, c.role, c.content, c.timestamp, c.model_name, r.codec, r.body "
+                       "FROM conversations c LEFT JOIN message_reasoning r ON r.message_id = c.id "
+                       "WHERE c.id > ? ORDER BY c.id LIMIT ?")
+SQL_IMPORT_USER = ("INSERT OR IGNORE INTO users (email, password, first_name, last_name) "
+                   "VALUES (?, ?, ?, ?)")
+SQL_USER_ID = "SELECT id FROM users WHERE email = ?"
+SQL_IMPORT_TITLE = ("INSERT OR IGNORE INTO conversation_titles (session_id, title, user_id, created_at) "
+                    "VALUES (?, ?, ?, ?)")
+SQL_IMPORT_MESSAGE = ("INSERT INTO conversations (session_id, role, content, timestamp, model_name) "
+                      "VALUES (?, ?, ?, ?, ?)")
+SQL_LAST_ROWID = "SELECT last_insert_rowid()"
+SQL_IMPORT_REASONING = "INSERT INTO message_reasoning (message_id, codec, steps, body) VALUES (?, ?, ?, ?)"
+SQL_TRIGGER = "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?"
+SQL_CHECKPOINT = "SELECT value FROM app_settings WHERE key = ?"
+SQL_SAVE_CHECKPOINT = "INSERT OR REPLACE INTO app_settings (key, value) VALUES (?, ?)"
+
+
+def open_jsonl(path, mode):
+    # Text-mode handle for path, "-" for stdin/stdout; gzip by extension when writing, by magic bytes when reading
+    if path == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+    if mode == "w":
+        if path.endswith(".gz"):
+            return gzip.open(path, "wt", encoding="utf-8", compresslevel=GZIP_LEVEL)
+        return open(path, "w", encoding="utf-8")
+    with open(path, "rb") as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+    return gzip.open(path, "rt", encoding="utf-8") if compressed else open(path, encoding="utf-8")
+
+# -------------------- EXPORT --------------------
+
+def _pages(conn, sql, batch_rows):
+    # Keyset pagination on the first column; yields one batch of rows at a time
+    last = 0
+    while True:
+        rows = conn.execute(sql, (last, batch_rows)).fetchall()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def export_records(conn, batch_rows=BATCH_ROWS):
+    yield {"type": "header", "format": FORMAT_VERSION, "export_id": uuid.uuid4().hex,
+           "schema_version": current_version(conn), "exported_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    for rows in _pages(conn, SQL_EXPORT_USERS, batch_rows):
+        for user_id, email, password_hash, first_name, last_name in rows:
+            yield {"type": "user", "id": user_id, "email": email, "password_hash": password_hash,
+                   "first_name": first_name, "last_name": last_name}
+    for rows in _pages(conn, SQL_EXPORT_TITLES, batch_rows):
+        for _, session_id, title, user_id, created_at in rows:
+            yield {"type": "title", "session_id": session_id, "title": title, "user_id": user_id,
+                   "created_at": created_at}
+    for rows in _pages(conn, SQL_EXPORT_MESSAGES, batch_rows):
+        for message_id, session_id, role, content, timestamp, model_name, codec, body in rows:
+            yield {"type": "message", "id": message_id, "session_id": session_id, "role": role, "content": content,
+                   "timestamp": timestamp, "model_name": model_name,
+                   "reasoning": unpack_reasoning(codec, body) if body is not None else ""}
+
+
+def export_jsonl(path, db_path=None, batch_rows=BATCH_ROWS):
+    # Returns records written by type. One read transaction: a consistent snapshot while the app keeps writing.
+    conn = storage.get_connection(db_path)
+    counts = {}
+    out = open_jsonl(path, "w")
+    conn.execute("BEGIN")
+    try:
+        for record in export_records(conn, batch_rows):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            counts[record["type"]] = counts.get(record["type"], 0) + 1
+    finally:
+        conn.rollback()
+        if out is not sys.stdout:
+            out.close()
+    return counts
+
+# -------------------- IMPORT --------------------
+
+def read_records(lines):
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _write_batch(conn, users, titles, messages, user_ids):
+    for user in users:
+        # An account that already exists in the target keeps its own password
+        conn.execute(SQL_IMPORT_USER, (user["email"], user.get("password_hash"), user["first_name"], user["last_name"]))
+        user_ids[user["id"]] = conn.execute(SQL_USER_ID, (user["email"],)).fetchone()[0]
+    conn.executemany(SQL_IMPORT_TITLE, ((t["session_id"], t["title"], user_ids.get(t["user_id"]), t["created_at"])
+                                        for t in titles))
+    if messages:
+        triggers = [conn.execute(SQL_TRIGGER, (name,)).fetchone()[0] for name in BULK_TRIGGERS]
+        for name in BULK_TRIGGERS:
+            conn.execute(f"DROP TRIGGER {name}")
+        conn.executemany(SQL_IMPORT_MESSAGE, ((m["session_id"], m["role"], m["content"], m["timestamp"],
+                                               m.get("model_name")) for m in messages))
+        # The write lock is held, so the batch got consecutive ids ending at last_insert_rowid()
+        last_id = conn.execute(SQL_LAST_ROWID).fetchone()[0]
+        first_id = last_id - len(messages) + 1
+        index_search_range(conn, first_id - 1, last_id)
+        count_catalogue_range(conn, first_id - 1, last_id)
+        for sql in triggers:
+            conn.execute(sql)
+        reasoning = []
+        texts = []
+        for n, message in enumerate(messages):
+            text = message.get("reasoning")
+            if text:
+                codec, body = pack_reasoning(text)
+                reasoning.append((first_id + n, codec, count_steps(text), body))
+                texts.append((first_id + n, text))
+        conn.executemany(SQL_IMPORT_REASONING, reasoning)
+        conn.executemany(storage.SQL_INDEX_REASONING, texts)
+
+
+def import_jsonl(path, db_path=None, batch_rows=BATCH_ROWS):
+    # Returns (records imported by type, records skipped because an earlier run imported them)
+    migrate(db_path)
+    conn = storage.get_connection(db_path)
+    source = open_jsonl(path, "r")
+    try:
+        records = read_records(source)
+        header = next(records, None)
+        if not header or header.get("type") != "header":
+            raise ValueError(f"{path} is not a transfer.py export")
+        if header["format"] > FORMAT_VERSION:
+            raise ValueError(f"{path} uses export format {header['format']}, newer than {FORMAT_VERSION}")
+        key = f"import:{header['export_id']}"
+        row = conn.execute(SQL_CHECKPOINT, (key,)).fetchone()
+        done = int(row[0]) if row else 0
+
+        counts = {}
+        user_ids = {}
+        batch = {"user": [], "title": [], "message": []}
+        pending = 0
+        line = 0
+
+        def flush():
+            nonlocal pending
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                _write_batch(conn, batch["user"], batch["title"], batch["message"], user_ids)
+                if line > done:
+                    conn.execute(SQL_SAVE_CHECKPOINT, (key, str(line)))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            for records_of_type in batch.values():
+                records_of_type.clear()
+            pending = 0
+
+        for line, record in enumerate(records, start=1):
+            kind = record["type"]
+            # Users are re-read on resume to rebuild the id map; inserting them again is a no-op
+            if kind == "user" or line > done:
+                batch[kind].append(record)
+                pending += 1
+            if line > done:
+                counts[kind] = counts.get(kind, 0) + 1
+            if pending >= batch_rows:
+                flush()
+        if pending or line > done:
+            flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    return counts, min(done, line)
+
+# -------------------- CLI --------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import users, titles and messages as JSONL")
+    parser.add_argument("direction", choices=["export", "import"])
+    parser.add_argument("path", help="JSONL file, .gz for gzip, - for stdout/stdin")
+    parser.add_argument("--db", default=None, help="database file (default: chat_history.db)")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS, help="rows read or written per batch")
+    args = parser.parse_args()
+
+    # Progress goes to stderr so "export -" can be piped
+    start = time.perf_counter()
+    if args.direction == "export":
+        migrate(args.db)
+        counts = export_jsonl(args.path, args.db, args.batch_rows)
+        skipped = 0
+    else:
+        counts, skipped = import_jsonl(args.path, args.db, args.batch_rows)
+    elapsed = time.perf_counter() - start
+    summary = ", ".join(f"{counts.get(kind, 0)} {kind}s" for kind in ("user", "title", "message"))
+    print(f"✅ {args.direction.capitalize()}ed {summary} in {elapsed:.1f}s", file=sys.stderr)
+    if skipped:
+        print(f"ℹ️ Skipped {skipped} records imported by an earlier run", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()